@@ -1,7 +1,10 @@
 """
-ASGI config for mysite project.
+ASGI config for cs412 project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Serving the site through ASGI (for example ``uvicorn cs412.asgi:application``)
+is required for the Mini Insta live update streams, which hold one
+connection open per page without tying up a thread.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
@@ -9,8 +12,16 @@ https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 
 import os
 
+from django.conf import settings
 from django.core.asgi import get_asgi_application
 
-os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'mysite.settings')
+os.environ.setdefault(
+    'DJANGO_SETTINGS_MODULE',
+    'cs412.settings_production' if os.environ.get('DJANGO_ENV') == 'production' else 'cs412.settings',
+)
 
 application = get_asgi_application()
+
+if settings.WARM_UP_WORKERS:
+    from cs412.warmup import warm_up
+    warm_up()
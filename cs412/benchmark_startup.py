@@ -0,0 +1,136 @@
+"""
+File: benchmark_startup.py
+Author: Anthony Xie
+Email: xiea@bu.edu
+Description: Cold-start benchmark for the cs412 WSGI application.
+
+Each run starts a fresh Python process, the way Apache starts a new worker,
+imports cs412.wsgi and sends one request straight to the WSGI callable. It
+reports the time to import the application, the time to the end of the
+first response, and the peak resident memory of the worker.
+
+Usage:
+    python -m cs412.benchmark_startup
+    python -m cs412.benchmark_startup --runs 10 --path /mini_insta/ --path /quote/
+    python -m cs412.benchmark_startup --warm-up
+    python -m cs412.benchmark_startup --preload plotly.graph_objs
+
+--preload imports modules before the application, which reproduces the
+cost of modules that used to be imported at startup (plotly was imported by
+voter_analytics.views) so before/after numbers can be taken from one tree.
+"""
+
+import argparse
+import importlib
+import io
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+from wsgiref.util import setup_testing_defaults
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+
+def run_worker(path, preload):
+    """
+    Start the application in this process, serve one request and print the
+    measurements as JSON. Runs inside the child process.
+
+    Parameters:
+        path: The URL path of the first request.
+        preload: Module names to import before the application.
+    """
+    start = time.perf_counter()
+    for module in preload:
+        importlib.import_module(module)
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'cs412.settings')
+    from cs412.wsgi import application
+    imported = time.perf_counter()
+
+    environ = {'PATH_INFO': path, 'wsgi.input': io.BytesIO(), 'wsgi.errors': sys.stderr}
+    setup_testing_defaults(environ)
+    status = []
+    body = application(environ, lambda code, headers, exc_info=None: status.append(code))
+    try:
+        size = sum(len(chunk) for chunk in body)
+    finally:
+        if hasattr(body, 'close'):
+            body.close()
+    responded = time.perf_counter()
+
+    print(json.dumps({
+        'import': imported - start,
+        'first_response': responded - start,
+        'status': status[0] if status else None,
+        'bytes': size,
+        # ru_maxrss is in kilobytes on Linux and bytes on macOS
+        'rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+                  / (1024 * 1024 if sys.platform == 'darwin' else 1024),
+    }))
+
+
+def spawn_worker(path, preload, warm_up):
+    """
+    Run one cold worker in a new interpreter.
+
+    Parameters:
+        path: The URL path of the first request.
+        preload: Module names to import before the application.
+        warm_up: Whether the worker warms up URLs and templates at startup.
+
+    Returns:
+        dict: The worker's measurements plus its total wall-clock time.
+    """
+    command = [sys.executable, '-m', 'cs412.benchmark_startup', '--worker', '--path', path]
+    for module in preload:
+        command += ['--preload', module]
+    env = dict(os.environ, DJANGO_WARM_UP='1' if warm_up else '0')
+
+    start = time.perf_counter()
+    result = subprocess.run(command, cwd=BASE_DIR, env=env, capture_output=True, text=True)
+    wall = time.perf_counter() - start
+    if result.returncode != 0:
+        raise RuntimeError(f'Worker failed:\n{result.stderr}')
+
+    measurements = json.loads(result.stdout.strip().splitlines()[-1])
+    measurements['wall'] = wall
+    return measurements
+
+
+def main():
+    """
+    Parse arguments, run the benchmark and print a summary table.
+    """
+    parser = argparse.ArgumentParser(description='Measure cold start of the cs412 WSGI app.')
+    parser.add_argument('--path', action='append', help='URL path of the first request (repeatable).')
+    parser.add_argument('--runs', type=int, default=5, help='Cold starts per path.')
+    parser.add_argument('--preload', action='append', default=[], help='Module to import first (repeatable).')
+    parser.add_argument('--warm-up', action='store_true', help='Warm up URLs and templates at startup.')
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    paths = args.path or ['/quote/']
+
+    if args.worker:
+        run_worker(paths[0], args.preload)
+        return
+
+    print(f'{"path":<28}{"status":>7}{"import s":>10}{"first resp s":>14}{"wall s":>9}{"rss MB":>9}')
+    for path in paths:
+        runs = [spawn_worker(path, args.preload, args.warm_up) for _ in range(args.runs)]
+        print(
+            f'{path:<28}{runs[0]["status"].split()[0]:>7}'
+            f'{statistics.median(r["import"] for r in runs):>10.3f}'
+            f'{statistics.median(r["first_response"] for r in runs):>14.3f}'
+            f'{statistics.median(r["wall"] for r in runs):>9.3f}'
+            f'{statistics.median(r["rss_mb"] for r in runs):>9.1f}'
+        )
+
+
+if __name__ == '__main__':
+    main()
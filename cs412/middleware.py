@@ -0,0 +1,175 @@
+"""
+File: middleware.py
+Author: Anthony Xie
+Email: xiea@bu.edu
+Description: Middleware that serves collected static files from the app.
+
+With DEBUG off, Django stops serving STATIC_URL, so without this the files
+are only reachable where the web server has been configured for them. The
+middleware answers requests under STATIC_URL from STATIC_ROOT before the
+URLconf runs, for both the WSGI and ASGI entry points:
+
+- Files whose names carry the content hash from the static files manifest
+  are sent with a one-year immutable Cache-Control, so browsers never ask
+  for them again; a changed file gets a new name.
+- Other files are sent with a short max-age and an ETag, so revalidation
+  costs a 304.
+- Precompressed .br/.gz siblings written at collectstatic time are sent to
+  clients that accept them.
+"""
+
+import json
+import mimetypes
+import os
+from urllib.parse import urlparse
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponseNotModified
+from django.utils.http import http_date, parse_etags
+from django.utils.cache import patch_vary_headers
+
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+REVALIDATE_CACHE_CONTROL = 'public, max-age=60'
+
+# Preferred encodings first
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+class StaticFile:
+    """
+    A collected static file and its precompressed siblings.
+    """
+    def __init__(self, path, immutable):
+        """
+        Read the file metadata.
+
+        Parameters:
+            path: The absolute path of the file.
+            immutable: Whether the file name contains a content hash.
+        """
+        stat = os.stat(path)
+        self.path = path
+        self.immutable = immutable
+        self.size = stat.st_size
+        self.last_modified = http_date(stat.st_mtime)
+        # Weak, since the gzip and brotli bodies share it with the plain file
+        self.etag = f'W/"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+        self.content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        self.encoded = {
+            encoding: (path + suffix, os.path.getsize(path + suffix))
+            for encoding, suffix in ENCODINGS
+            if os.path.exists(path + suffix)
+        }
+
+    def choose(self, accept_encoding):
+        """
+        Pick the smallest representation the client accepts.
+
+        Parameters:
+            accept_encoding: The Accept-Encoding request header.
+
+        Returns:
+            tuple: (path, size, encoding) where encoding is None for the plain file.
+        """
+        accepted = {part.split(';')[0].strip() for part in accept_encoding.split(',')}
+        for encoding, suffix in ENCODINGS:
+            if encoding in accepted and encoding in self.encoded:
+                path, size = self.encoded[encoding]
+                return path, size, encoding
+        return self.path, self.size, None
+
+
+def _build_index(root):
+    """
+    Index every file under STATIC_ROOT by its URL path.
+
+    Parameters:
+        root: The STATIC_ROOT directory.
+
+    Returns:
+        dict: URL path relative to STATIC_URL -> StaticFile.
+    """
+    hashed_names = set()
+    manifest_path = os.path.join(root, 'staticfiles.json')
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as manifest_file:
+            hashed_names = set(json.load(manifest_file).get('paths', {}).values())
+
+    index = {}
+    suffixes = tuple(suffix for encoding, suffix in ENCODINGS)
+    for directory, dirs, files in os.walk(root):
+        for filename in files:
+            if filename.endswith(suffixes) or filename == 'staticfiles.json':
+                continue
+            path = os.path.join(directory, filename)
+            name = os.path.relpath(path, root).replace(os.sep, '/')
+            index[name] = StaticFile(path, name in hashed_names)
+    return index
+
+
+class StaticFilesMiddleware:
+    """
+    Serve files under STATIC_URL from STATIC_ROOT with long-lived caching.
+    """
+    def __init__(self, get_response):
+        """
+        Index the collected static files.
+
+        Parameters:
+            get_response: The next middleware or view.
+        """
+        self.get_response = get_response
+        self.prefix = urlparse(settings.STATIC_URL).path
+        # Files are collected before workers start, so index them once
+        self.files = _build_index(settings.STATIC_ROOT) if settings.STATIC_ROOT else {}
+
+    def __call__(self, request):
+        """
+        Answer static file requests and pass everything else on.
+
+        Parameters:
+            request: The HTTP request.
+
+        Returns:
+            HttpResponse: The static file response or the next handler's response.
+        """
+        if request.method in ('GET', 'HEAD') and request.path.startswith(self.prefix):
+            static_file = self.files.get(request.path[len(self.prefix):])
+            if static_file is not None:
+                return self.serve(request, static_file)
+        return self.get_response(request)
+
+    def serve(self, request, static_file):
+        """
+        Build the response for one static file.
+
+        Parameters:
+            request: The HTTP request.
+            static_file: The StaticFile to send.
+
+        Returns:
+            HttpResponse: A 304 or the file contents.
+        """
+        if_none_match = request.headers.get('If-None-Match')
+        if if_none_match and static_file.etag in parse_etags(if_none_match):
+            response = HttpResponseNotModified()
+        elif not if_none_match and request.headers.get('If-Modified-Since') == static_file.last_modified:
+            response = HttpResponseNotModified()
+        else:
+            path, size, encoding = static_file.choose(request.headers.get('Accept-Encoding', ''))
+            if request.method == 'HEAD':
+                response = FileResponse(b'', content_type=static_file.content_type)
+            else:
+                response = FileResponse(open(path, 'rb'), content_type=static_file.content_type)
+            response['Content-Length'] = str(size)
+            # The path may be a .gz/.br sibling, whose name must not leak out
+            del response['Content-Disposition']
+            if encoding:
+                response['Content-Encoding'] = encoding
+
+        response['ETag'] = static_file.etag
+        response['Last-Modified'] = static_file.last_modified
+        response['Cache-Control'] = IMMUTABLE_CACHE_CONTROL if static_file.immutable else REVALIDATE_CACHE_CONTROL
+        if static_file.encoded:
+            patch_vary_headers(response, ('Accept-Encoding',))
+        return response
@@ -0,0 +1,367 @@
+"""
+File: profiling.py
+Author: Anthony Xie
+Email: xiea@bu.edu
+Description: On-demand sampling profiler for slow requests.
+
+ProfilingMiddleware records where a request spends its time by sampling
+the stack of the thread handling it, which covers the view and the
+template render. A capture is taken when:
+
+- a staff user sends the X-Profile: 1 header or adds ?_profile=1 to the
+  URL, in which case the whole request is sampled and the response names
+  the capture in an X-Profile-Capture header, or
+- PROFILING_SLOW_REQUEST_MS is set and a request runs longer than that,
+  in which case sampling starts when the threshold is crossed.
+
+Captures are written to PROFILING_DIR as collapsed stacks, one
+"frame;frame;frame count" line per distinct stack, which flamegraph.pl,
+speedscope and similar tools turn into flame graphs. Staff can list and
+download recent captures at /profiles/.
+
+When no request asks for a capture and no threshold is set, the middleware
+only checks for the flag and the sampler thread is never started.
+"""
+
+import json
+import os
+import re
+import sys
+import sysconfig
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import FileResponse, Http404
+from django.shortcuts import render
+
+# Seconds between stack samples of a profiled request
+SAMPLE_INTERVAL = 0.002
+
+# Captures kept on disk; older ones are deleted as new ones are written
+MAX_CAPTURES = 200
+
+# Longest stack recorded, counted from the innermost frame
+MAX_DEPTH = 200
+
+PROFILE_HEADER = 'HTTP_X_PROFILE'
+PROFILE_PARAM = '_profile'
+
+# Path prefixes shortened in frame names, longest first
+_PATH_PREFIXES = sorted(
+    {str(settings.BASE_DIR) + os.sep, sysconfig.get_paths()['purelib'] + os.sep,
+     sysconfig.get_paths()['stdlib'] + os.sep},
+    key=len, reverse=True,
+)
+
+
+def _frame_name(code):
+    """
+    Return the flame graph label of a code object.
+
+    Parameters:
+        code: The code object of a frame.
+
+    Returns:
+        str: The function name and its shortened file and line.
+    """
+    filename = code.co_filename
+    for prefix in _PATH_PREFIXES:
+        if filename.startswith(prefix):
+            filename = filename[len(prefix):]
+            break
+    return f'{code.co_name} ({filename}:{code.co_firstlineno})'
+
+
+def _collapse(frame):
+    """
+    Return the collapsed stack of a frame, outermost frame first.
+
+    Parameters:
+        frame: The innermost frame of a thread.
+
+    Returns:
+        str: Frame names joined with semicolons.
+    """
+    names = []
+    while frame is not None and len(names) < MAX_DEPTH:
+        names.append(_frame_name(frame.f_code))
+        frame = frame.f_back
+    names.reverse()
+    return ';'.join(names)
+
+
+class Capture:
+    """
+    The samples collected for one request.
+    """
+    def __init__(self, thread_id, trigger, deadline=None):
+        """
+        Create an empty capture.
+
+        Parameters:
+            thread_id: The identifier of the thread handling the request.
+            trigger: 'manual' or 'slow'.
+            deadline: For slow captures, the monotonic time at which sampling starts.
+        """
+        self.thread_id = thread_id
+        self.trigger = trigger
+        self.deadline = deadline
+        self.sampling = deadline is None
+        self.stacks = Counter()
+
+
+class Sampler:
+    """
+    Background thread that samples the stacks of the requests being profiled.
+    The thread is started on first use and sleeps while nothing needs sampling.
+    """
+    def __init__(self):
+        """
+        Create an idle sampler.
+        """
+        self._condition = threading.Condition()
+        self._captures = {}
+        self._thread = None
+
+    def start_capture(self, capture):
+        """
+        Start watching a request.
+
+        Parameters:
+            capture: The Capture of the request.
+        """
+        with self._condition:
+            was_idle = not self._captures
+            self._captures[capture.thread_id] = capture
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='request-sampler', daemon=True)
+                self._thread.start()
+            # A sampler already waiting on an earlier deadline need not wake up
+            if was_idle or capture.sampling:
+                self._condition.notify()
+
+    def stop_capture(self, capture):
+        """
+        Stop watching a request.
+
+        Parameters:
+            capture: The Capture of the request.
+        """
+        with self._condition:
+            self._captures.pop(capture.thread_id, None)
+
+    def _run(self):
+        """
+        Sample every capture that is due, then sleep until the next sample or deadline.
+        """
+        while True:
+            with self._condition:
+                now = time.monotonic()
+                sampling = []
+                next_deadline = None
+                for capture in self._captures.values():
+                    if not capture.sampling and capture.deadline <= now:
+                        capture.sampling = True
+                    if capture.sampling:
+                        sampling.append(capture)
+                    elif next_deadline is None or capture.deadline < next_deadline:
+                        next_deadline = capture.deadline
+
+                if not sampling:
+                    timeout = None if next_deadline is None else next_deadline - now
+                    self._condition.wait(timeout)
+                    continue
+
+            frames = sys._current_frames()
+            with self._condition:
+                for capture in sampling:
+                    # Skip requests that finished since, as their samples may be saving
+                    frame = frames.get(capture.thread_id)
+                    if frame is not None and self._captures.get(capture.thread_id) is capture:
+                        capture.stacks[_collapse(frame)] += 1
+            del frames
+            time.sleep(SAMPLE_INTERVAL)
+
+
+sampler = Sampler()
+
+
+def _capture_dir():
+    """
+    Return the directory captures are stored in.
+    """
+    return getattr(settings, 'PROFILING_DIR', os.path.join(settings.BASE_DIR, 'profiles'))
+
+
+def save_capture(capture, request, duration):
+    """
+    Write a capture as a collapsed-stack file with a JSON description next to it.
+
+    Parameters:
+        capture: The finished Capture.
+        request: The profiled request.
+        duration: The request's duration in seconds.
+
+    Returns:
+        str: The capture name, or None if it has no samples.
+    """
+    if not capture.stacks:
+        return None
+    directory = _capture_dir()
+    os.makedirs(directory, exist_ok=True)
+
+    now = datetime.now()
+    slug = re.sub(r'[^A-Za-z0-9]+', '-', request.path).strip('-')[:60] or 'root'
+    name = f'{now:%Y%m%dT%H%M%S%f}-{request.method}-{slug}'
+    with open(os.path.join(directory, name + '.collapsed'), 'w') as file:
+        for stack, count in capture.stacks.most_common():
+            file.write(f'{stack} {count}\n')
+    with open(os.path.join(directory, name + '.json'), 'w') as file:
+        json.dump({
+            'created': now.isoformat(timespec='seconds'),
+            'method': request.method,
+            'path': request.get_full_path(),
+            'duration_ms': round(duration * 1000, 1),
+            'trigger': capture.trigger,
+            'samples': sum(capture.stacks.values()),
+        }, file)
+
+    _prune(directory)
+    return name
+
+
+def _prune(directory):
+    """
+    Delete the oldest captures beyond MAX_CAPTURES.
+
+    Parameters:
+        directory: The capture directory.
+    """
+    names = sorted(entry[:-len('.json')] for entry in os.listdir(directory) if entry.endswith('.json'))
+    for name in names[:-MAX_CAPTURES]:
+        for extension in ('.json', '.collapsed'):
+            try:
+                os.remove(os.path.join(directory, name + extension))
+            except FileNotFoundError:
+                pass
+
+
+def list_captures():
+    """
+    Return the descriptions of stored captures, newest first.
+
+    Returns:
+        list: Dictionaries with the capture name and its recorded details.
+    """
+    directory = _capture_dir()
+    if not os.path.isdir(directory):
+        return []
+    captures = []
+    for entry in sorted(os.listdir(directory), reverse=True):
+        if not entry.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(directory, entry)) as file:
+                details = json.load(file)
+        except (OSError, ValueError):
+            continue
+        details['name'] = entry[:-len('.json')]
+        captures.append(details)
+    return captures
+
+
+class ProfilingMiddleware:
+    """
+    Middleware that samples requests flagged by staff or slower than a threshold.
+    """
+    def __init__(self, get_response):
+        """
+        Read the slow request threshold once.
+
+        Parameters:
+            get_response: The next handler in the middleware chain.
+        """
+        self.get_response = get_response
+        threshold = getattr(settings, 'PROFILING_SLOW_REQUEST_MS', None)
+        self.slow_threshold = threshold / 1000 if threshold else None
+
+    def _requested(self, request):
+        """
+        Return whether a staff user asked for this request to be profiled.
+        The user is only loaded when the flag is present.
+        """
+        flagged = request.META.get(PROFILE_HEADER) == '1' or request.GET.get(PROFILE_PARAM) == '1'
+        return flagged and request.user.is_staff
+
+    def __call__(self, request):
+        """
+        Handle a request, sampling it if it is flagged or becomes slow.
+
+        Parameters:
+            request: The HTTP request.
+
+        Returns:
+            HttpResponse: The response of the view.
+        """
+        if self._requested(request):
+            capture = Capture(threading.get_ident(), 'manual')
+        elif self.slow_threshold is not None:
+            capture = Capture(threading.get_ident(), 'slow', time.monotonic() + self.slow_threshold)
+        else:
+            return self.get_response(request)
+
+        start = time.perf_counter()
+        sampler.start_capture(capture)
+        try:
+            response = self.get_response(request)
+        finally:
+            sampler.stop_capture(capture)
+        name = save_capture(capture, request, time.perf_counter() - start)
+        if name and capture.trigger == 'manual':
+            response['X-Profile-Capture'] = name
+        return response
+
+
+@staff_member_required
+def capture_index(request):
+    """
+    Staff page listing the stored captures.
+
+    Parameters:
+        request: The HTTP request.
+
+    Returns:
+        HttpResponse: The rendered list.
+    """
+    return render(request, 'cs412/profiles.html', {
+        **admin.site.each_context(request),
+        'title': 'Request profiles',
+        'captures': list_captures(),
+        'slow_threshold': getattr(settings, 'PROFILING_SLOW_REQUEST_MS', None),
+    })
+
+
+@staff_member_required
+def capture_download(request, name):
+    """
+    Send one capture's collapsed stacks as a text file.
+
+    Parameters:
+        request: The HTTP request.
+        name: The capture name.
+
+    Returns:
+        FileResponse: The collapsed-stack file.
+    """
+    if not re.fullmatch(r'[A-Za-z0-9-]+', name):
+        raise Http404('No such capture')
+    path = os.path.join(_capture_dir(), name + '.collapsed')
+    if not os.path.exists(path):
+        raise Http404('No such capture')
+    return FileResponse(open(path, 'rb'), as_attachment=True, filename=name + '.collapsed',
+                        content_type='text/plain; charset=utf-8')
@@ -0,0 +1,563 @@
+"""
+File: replay.py
+Author: Anthony Xie
+Email: xiea@bu.edu
+Description: Replays an Apache access log against a local cs412 instance.
+
+The tool reads a log in the combined format written by the BU Apache
+deployment, keeps the requests that reach Django, and sends them to a
+running local server with a pool of concurrent workers:
+
+- The deployment prefix (/xiea) is stripped and each path is resolved
+  against the cs412 URLconf. Static and media files, which Apache serves
+  itself, and streams, logout and post deletion are skipped.
+- Primary keys in the path are rewritten to rows that exist in the local
+  database, mapping each original id to the same local id every time, so
+  a hot post in the log stays a hot post in the replay.
+- Paths that need a login are sent with the session of a replay user
+  (replay_user_<n>, created on first use), chosen from the client address
+  in the log so one visitor keeps one session. POST bodies are not logged,
+  so writes are sent with minimal form data.
+- Requests are sent at their original spacing divided by --speed, or as
+  fast as the workers allow with --speed 0.
+
+The report gives throughput, error rates and latency percentiles and a
+latency histogram for each URL pattern, and --json saves it for comparing
+runs.
+
+Usage:
+    python manage.py runserver --noreload   (in another terminal)
+    python -m cs412.replay access.log
+    python -m cs412.replay access.log --speed 10 --workers 16 --users 20
+    python -m cs412.replay access.log --speed 0 --read-only --json report.json
+"""
+
+import argparse
+import bisect
+import http.cookiejar
+import json
+import os
+import queue
+import re
+import statistics
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import zlib
+from collections import defaultdict
+from datetime import datetime
+
+LOG_LINE_RE = re.compile(
+    r'(?P<host>\S+) \S+ (?P<user>\S+) \[(?P<time>[^\]]+)\] '
+    r'"(?P<method>[A-Z]+) (?P<target>\S+)(?: [^"]*)?" (?P<status>\d{3}) (?P<size>\S+)'
+    r'(?: "(?P<referer>[^"]*)" "(?P<agent>[^"]*)")?'
+)
+LOG_TIME_FORMAT = '%d/%b/%Y:%H:%M:%S %z'
+
+# Upper bounds of the latency histogram buckets, in milliseconds
+HISTOGRAM_BOUNDS = [10, 25, 50, 100, 250, 500, 1000, 2500, 5000]
+
+# URL names that are never replayed: endless streams and requests that
+# would end a session or delete the rows the replay relies on
+SKIPPED_NAMES = {'logout', 'delete_post', 'feed_events', 'post_events'}
+
+# Model whose primary keys a URL name's pk argument refers to
+PK_MODELS = {
+    'profile': 'mini_insta.Profile',
+    'show_followers': 'mini_insta.Profile',
+    'show_following': 'mini_insta.Profile',
+    'create_follow': 'mini_insta.Profile',
+    'delete_follow': 'mini_insta.Profile',
+    'api_profile': 'mini_insta.Profile',
+    'post_detail': 'mini_insta.Post',
+    'post_comments': 'mini_insta.Post',
+    'update_post': 'mini_insta.Post',
+    'create_comment': 'mini_insta.Post',
+    'create_like': 'mini_insta.Post',
+    'delete_like': 'mini_insta.Post',
+    'api_post': 'mini_insta.Post',
+    'api_comments': 'mini_insta.Post',
+    'voter': 'voter_analytics.Voter',
+}
+
+# Form data sent with replayed POSTs, whose bodies are not in the log
+POST_DATA = {
+    'create_comment': {'comment_text': 'Replayed comment'},
+    'create_post': {'caption': 'Replayed post'},
+}
+
+REPLAY_PASSWORD = 'replay-password'
+
+
+class Entry:
+    """
+    One replayable request from the log.
+    """
+    def __init__(self, offset, method, path, pattern, name, visitor, needs_login):
+        """
+        Create an entry.
+
+        Parameters:
+            offset: Seconds since the first request of the log.
+            method: The HTTP method.
+            path: The rewritten path and query string.
+            pattern: The URL pattern the path matched, used to group results.
+            name: The URL name.
+            visitor: The client address from the log.
+            needs_login: Whether the view requires a logged-in user.
+        """
+        self.offset = offset
+        self.method = method
+        self.path = path
+        self.pattern = pattern
+        self.name = name
+        self.visitor = visitor
+        self.needs_login = needs_login
+
+
+def setup_django():
+    """
+    Configure Django so paths can be resolved and ids read from the local database.
+    """
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'cs412.settings')
+    import django
+    django.setup()
+
+
+def load_id_pools():
+    """
+    Return the primary keys of each model that paths are rewritten to.
+
+    Returns:
+        dict: Model label -> sorted list of primary keys.
+    """
+    from django.apps import apps
+    pools = {}
+    for label in set(PK_MODELS.values()):
+        pools[label] = list(apps.get_model(label).objects.order_by('pk').values_list('pk', flat=True))
+    return pools
+
+
+def parse_log(lines, prefix, include_static):
+    """
+    Parse access log lines into replayable entries.
+
+    Parameters:
+        lines: An iterable of log lines.
+        prefix: The deployment prefix to strip from paths, e.g. '/xiea'.
+        include_static: Whether to keep requests for static and media files.
+
+    Returns:
+        tuple: (entries, skipped) where skipped counts the dropped lines by reason.
+    """
+    from django.conf import settings
+    from django.contrib.auth.mixins import LoginRequiredMixin
+    from django.urls import Resolver404, resolve
+
+    static_prefixes = ('/static/', '/media/', urllib.parse.urlparse(settings.STATIC_URL).path,
+                       urllib.parse.urlparse(settings.MEDIA_URL).path)
+    entries = []
+    skipped = defaultdict(int)
+    start = None
+    for line in lines:
+        match = LOG_LINE_RE.match(line)
+        if not match:
+            skipped['unparsed'] += 1
+            continue
+
+        target = match['target']
+        if prefix and target.startswith(prefix + '/'):
+            target = target[len(prefix):]
+        path, _, query = target.partition('?')
+        if not include_static and path.startswith(static_prefixes):
+            skipped['static'] += 1
+            continue
+        if path.startswith('/admin/'):
+            skipped['admin'] += 1
+            continue
+
+        try:
+            resolved = resolve(path)
+        except Resolver404:
+            skipped['unmatched'] += 1
+            continue
+        if resolved.url_name in SKIPPED_NAMES:
+            skipped[resolved.url_name] += 1
+            continue
+
+        timestamp = datetime.strptime(match['time'], LOG_TIME_FORMAT).timestamp()
+        start = timestamp if start is None else start
+        view_class = getattr(resolved.func, 'view_class', None)
+        entries.append(Entry(
+            offset=timestamp - start,
+            method=match['method'],
+            path=path + ('?' + query if query else ''),
+            pattern='/' + str(resolved.route),
+            name=resolved.url_name,
+            visitor=match['host'],
+            needs_login=bool(view_class) and issubclass(view_class, LoginRequiredMixin),
+        ))
+    return entries, skipped
+
+
+def rewrite_ids(entries, pools):
+    """
+    Point each entry's pk at an existing local row.
+
+    Parameters:
+        entries: The parsed entries; their paths are rewritten in place.
+        pools: The primary key pools from load_id_pools.
+
+    Returns:
+        int: The number of entries dropped because their model has no rows.
+    """
+    from django.urls import resolve, reverse
+
+    kept = []
+    for entry in entries:
+        label = PK_MODELS.get(entry.name)
+        if label is None:
+            kept.append(entry)
+            continue
+        pool = pools[label]
+        if not pool:
+            continue
+        path, _, query = entry.path.partition('?')
+        kwargs = dict(resolve(path).kwargs)
+        kwargs['pk'] = pool[kwargs['pk'] % len(pool)]
+        entry.path = reverse(entry.name, kwargs=kwargs) + ('?' + query if query else '')
+        kept.append(entry)
+    dropped = len(entries) - len(kept)
+    entries[:] = kept
+    return dropped
+
+
+def ensure_replay_users(count):
+    """
+    Create the replay users and their profiles if they do not exist.
+
+    Parameters:
+        count: The number of replay users.
+
+    Returns:
+        list: The usernames.
+    """
+    from django.contrib.auth.models import User
+    from mini_insta.models import Profile
+
+    usernames = [f'replay_user_{index}' for index in range(count)]
+    for username in usernames:
+        user, created = User.objects.get_or_create(username=username)
+        if created:
+            user.set_password(REPLAY_PASSWORD)
+            user.save()
+        Profile.objects.get_or_create(user=user, defaults={
+            'username': username,
+            'display_name': username.replace('_', ' ').title(),
+            'profile_image_url': 'https://example.com/replay.png',
+        })
+    return usernames
+
+
+class Session:
+    """
+    A cookie-keeping HTTP client for one replay user.
+    """
+    def __init__(self, base_url, username=None):
+        """
+        Create a session, logging in when a username is given.
+
+        Parameters:
+            base_url: The root URL of the server.
+            username: The replay user to log in as, or None.
+        """
+        self.base_url = base_url
+        self.cookies = http.cookiejar.CookieJar()
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(self.cookies), NoRedirect()
+        )
+        if username:
+            self.login(username)
+
+    def csrf_token(self):
+        """
+        Return the CSRF cookie value, or an empty string.
+        """
+        for cookie in self.cookies:
+            if cookie.name == 'csrftoken':
+                return cookie.value
+        return ''
+
+    def login(self, username):
+        """
+        Log in through the Mini Insta login form.
+
+        Parameters:
+            username: The replay user's username.
+        """
+        status = self.send('POST', '/mini_insta/login/', {'username': username, 'password': REPLAY_PASSWORD})
+        if status != 302:
+            raise RuntimeError(f'Login as {username} failed with status {status}')
+
+    def send(self, method, path, data=None):
+        """
+        Send one request and read the whole response.
+
+        Parameters:
+            method: The HTTP method.
+            path: The path and query string.
+            data: Form fields for a POST, or None.
+
+        Returns:
+            int: The response status.
+        """
+        body = None
+        headers = {'User-Agent': 'cs412-replay'}
+        if method == 'POST':
+            if not self.csrf_token():
+                # Any page with a form sets the CSRF cookie
+                self.send('GET', '/mini_insta/login/')
+            data = dict(data or {}, csrfmiddlewaretoken=self.csrf_token())
+            body = urllib.parse.urlencode(data).encode()
+            headers['Referer'] = self.base_url + '/'
+        request = urllib.request.Request(self.base_url + path, data=body, method=method, headers=headers)
+        try:
+            with self.opener.open(request, timeout=60) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as error:
+            error.read()
+            return error.code
+
+
+class NoRedirect(urllib.request.HTTPRedirectHandler):
+    """
+    Redirect handler that returns redirects instead of following them, as
+    the log records the redirect and its target as separate requests.
+    """
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+
+class Results:
+    """
+    Latencies and statuses of the replayed requests, grouped by URL pattern.
+    """
+    def __init__(self):
+        """
+        Create empty results.
+        """
+        self._lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+        self.max_lag = 0.0
+
+    def record(self, pattern, status, latency, lag):
+        """
+        Record one request.
+
+        Parameters:
+            pattern: The URL pattern of the request.
+            status: The response status, or 'error' if none was received.
+            latency: Seconds from sending to the end of the response.
+            lag: Seconds the request was sent behind its schedule.
+        """
+        with self._lock:
+            self.latencies[pattern].append(latency)
+            self.statuses[pattern][status] += 1
+            self.max_lag = max(self.max_lag, lag)
+
+    def summary(self, elapsed):
+        """
+        Return the per-pattern and overall statistics.
+
+        Parameters:
+            elapsed: The wall-clock duration of the replay in seconds.
+
+        Returns:
+            dict: Statistics ready to print or save as JSON.
+        """
+        def describe(latencies, statuses):
+            latencies = sorted(latencies)
+            errors = sum(n for status, n in statuses.items() if status == 'error' or status >= 500)
+            client_errors = sum(n for status, n in statuses.items() if status != 'error' and 400 <= status < 500)
+            histogram = [0] * (len(HISTOGRAM_BOUNDS) + 1)
+            for latency in latencies:
+                histogram[bisect.bisect_left(HISTOGRAM_BOUNDS, latency * 1000)] += 1
+            quantiles = statistics.quantiles(latencies, n=100, method='inclusive') if len(latencies) > 1 else latencies * 99
+            return {
+                'requests': len(latencies),
+                'throughput': len(latencies) / elapsed if elapsed else 0.0,
+                'error_rate': errors / len(latencies),
+                'client_error_rate': client_errors / len(latencies),
+                'p50_ms': quantiles[49] * 1000,
+                'p90_ms': quantiles[89] * 1000,
+                'p99_ms': quantiles[98] * 1000,
+                'max_ms': latencies[-1] * 1000,
+                'histogram': histogram,
+                'statuses': {str(status): n for status, n in sorted(statuses.items(), key=str)},
+            }
+
+        patterns = {
+            pattern: describe(self.latencies[pattern], self.statuses[pattern])
+            for pattern in sorted(self.latencies, key=lambda p: -len(self.latencies[p]))
+        }
+        everything = defaultdict(int)
+        for statuses in self.statuses.values():
+            for status, n in statuses.items():
+                everything[status] += n
+        all_latencies = [latency for latencies in self.latencies.values() for latency in latencies]
+        return {
+            'elapsed_s': elapsed,
+            'max_lag_s': self.max_lag,
+            'histogram_bounds_ms': HISTOGRAM_BOUNDS,
+            'total': describe(all_latencies, everything) if all_latencies else None,
+            'patterns': patterns,
+        }
+
+
+def replay(entries, base_url, workers, speed, usernames):
+    """
+    Send the entries to the server with a pool of workers.
+
+    Parameters:
+        entries: The entries to send, in log order.
+        base_url: The root URL of the server.
+        workers: The number of concurrent workers.
+        speed: Replay speed relative to the log; 0 sends as fast as possible.
+        usernames: The replay users for paths that need a login.
+
+    Returns:
+        tuple: (results, elapsed seconds).
+    """
+    results = Results()
+    pending = queue.Queue(maxsize=workers * 4)
+
+    def user_for(visitor):
+        # The same visitor always uses the same replay user, run after run
+        return usernames[zlib.crc32(visitor.encode()) % len(usernames)]
+
+    def work():
+        sessions = {}
+        while True:
+            item = pending.get()
+            if item is None:
+                return
+            entry, scheduled = item
+            username = user_for(entry.visitor) if entry.needs_login else None
+            started = time.perf_counter()
+            try:
+                session = sessions.get(username)
+                if session is None:
+                    session = sessions[username] = Session(base_url, username)
+                    # Logging in is not part of the measured request
+                    started = time.perf_counter()
+                status = session.send(entry.method, entry.path, POST_DATA.get(entry.name))
+            except (OSError, RuntimeError):
+                status = 'error'
+            finished = time.perf_counter()
+            results.record(entry.pattern, status, finished - started, max(0.0, started - scheduled))
+
+    threads = [threading.Thread(target=work, daemon=True) for _ in range(workers)]
+    for thread in threads:
+        thread.start()
+
+    start = time.perf_counter()
+    for entry in entries:
+        scheduled = start + entry.offset / speed if speed else time.perf_counter()
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        pending.put((entry, scheduled))
+    for _ in threads:
+        pending.put(None)
+    for thread in threads:
+        thread.join()
+    return results, time.perf_counter() - start
+
+
+def print_report(summary, skipped, stream=sys.stdout):
+    """
+    Print the replay statistics as tables.
+
+    Parameters:
+        summary: The dictionary returned by Results.summary.
+        skipped: Counts of log lines that were not replayed, by reason.
+        stream: The file to print to.
+    """
+    def row(label, stats):
+        print(
+            f'{label[:44]:<44}{stats["requests"]:>8}{stats["throughput"]:>9.1f}'
+            f'{stats["error_rate"] * 100:>7.1f}%{stats["client_error_rate"] * 100:>7.1f}%'
+            f'{stats["p50_ms"]:>9.1f}{stats["p90_ms"]:>9.1f}{stats["p99_ms"]:>9.1f}{stats["max_ms"]:>9.1f}',
+            file=stream,
+        )
+
+    print(f'Replayed in {summary["elapsed_s"]:.1f}s; requests fell up to '
+          f'{summary["max_lag_s"]:.2f}s behind schedule', file=stream)
+    if skipped:
+        print('Skipped: ' + ', '.join(f'{reason} {n}' for reason, n in sorted(skipped.items())), file=stream)
+    if summary['total'] is None:
+        return
+    print(file=stream)
+    print(f'{"pattern":<44}{"reqs":>8}{"req/s":>9}{"5xx":>8}{"4xx":>8}'
+          f'{"p50 ms":>9}{"p90 ms":>9}{"p99 ms":>9}{"max ms":>9}', file=stream)
+    for pattern, stats in summary['patterns'].items():
+        row(pattern, stats)
+    row('TOTAL', summary['total'])
+
+    bounds = summary['histogram_bounds_ms']
+    labels = [f'<{bound}' for bound in bounds] + [f'>={bounds[-1]}']
+    print(file=stream)
+    print(f'{"latency histogram (ms)":<44}' + ''.join(f'{label:>7}' for label in labels), file=stream)
+    for pattern, stats in list(summary['patterns'].items()) + [('TOTAL', summary['total'])]:
+        print(f'{pattern[:44]:<44}' + ''.join(f'{n:>7}' for n in stats['histogram']), file=stream)
+
+
+def main():
+    """
+    Parse arguments, replay the log and print the report.
+    """
+    parser = argparse.ArgumentParser(description='Replay an Apache access log against a local cs412 server.')
+    parser.add_argument('log', help='Access log in combined (or common) format.')
+    parser.add_argument('--base-url', default='http://127.0.0.1:8000', help='Root URL of the local server.')
+    parser.add_argument('--prefix', default='/xiea', help='Deployment prefix to strip from logged paths.')
+    parser.add_argument('--workers', type=int, default=8, help='Concurrent workers.')
+    parser.add_argument('--speed', type=float, default=1.0,
+                        help='Replay speed relative to the log; 0 sends as fast as possible.')
+    parser.add_argument('--users', type=int, default=10, help='Replay users for paths that need a login.')
+    parser.add_argument('--limit', type=int, help='Replay only the first N requests.')
+    parser.add_argument('--read-only', action='store_true', help='Skip everything but GET and HEAD.')
+    parser.add_argument('--include-static', action='store_true', help='Also replay static and media files.')
+    parser.add_argument('--json', help='Also save the report to this file.')
+    args = parser.parse_args()
+
+    setup_django()
+    with open(args.log, encoding='utf-8', errors='replace') as file:
+        entries, skipped = parse_log(file, args.prefix.rstrip('/'), args.include_static)
+    if args.read_only:
+        writes = [entry for entry in entries if entry.method not in ('GET', 'HEAD')]
+        skipped['writes'] += len(writes)
+        entries = [entry for entry in entries if entry.method in ('GET', 'HEAD')]
+    if args.limit:
+        entries = entries[:args.limit]
+    skipped['no local rows'] += rewrite_ids(entries, load_id_pools())
+
+    usernames = ensure_replay_users(args.users) if any(entry.needs_login for entry in entries) else []
+    print(f'Replaying {len(entries)} requests with {args.workers} workers '
+          f'at {"full" if not args.speed else f"{args.speed:g}x"} speed')
+    results, elapsed = replay(entries, args.base_url.rstrip('/'), args.workers, args.speed, usernames)
+
+    summary = results.summary(elapsed)
+    summary['skipped'] = dict(skipped)
+    print_report(summary, {reason: n for reason, n in skipped.items() if n})
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(summary, file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -51,6 +51,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'cs412.profiling.ProfilingMiddleware',
 ]
 
 ROOT_URLCONF = 'cs412.urls'
@@ -58,7 +59,7 @@ ROOT_URLCONF = 'cs412.urls'
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
-        'DIRS': [],
+        'DIRS': [BASE_DIR / 'cs412' / 'templates'],
         'APP_DIRS': True,
         'OPTIONS': {
             'context_processors': [
@@ -83,6 +84,25 @@ DATABASES = {
     }
 }
 
+# Caches
+# Sessions and logged-in users have their own cache so other entries cannot
+# evict them; settings_production shares it between worker processes
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'sessions': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'sessions',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+    # Rate limit counters (mini_insta.ratelimit)
+    'ratelimit': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'ratelimit',
+    },
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -140,9 +160,55 @@ else:
 STATIC_ROOT = BASE_DIR / 'staticfiles'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Keep small uploads in memory; stream larger ones to a temporary file in
+# chunks, hashing them on the way in for content-addressed photo storage
+FILE_UPLOAD_HANDLERS = [
+    'django.core.files.uploadhandler.MemoryFileUploadHandler',
+    'mini_insta.storage.HashingUploadHandler',
+]
+
+# Partial files of chunked photo uploads, kept outside MEDIA_ROOT so they
+# are never served
+CHUNKED_UPLOAD_DIR = BASE_DIR / 'uploads'
+
+# Image proxy settings
+# External profile pictures and photos are fetched once, resized and served
+# from a cache directory bounded to IMAGE_PROXY_MAX_BYTES. The proxy fetches
+# from the network, so only settings_production turns it on
+IMAGE_PROXY_ENABLED = False
+IMAGE_PROXY_DIR = BASE_DIR / 'cache' / 'images'
+IMAGE_PROXY_MAX_BYTES = 256 * 1024 * 1024
+
 # Authentication settings
 LOGIN_REDIRECT_URL = 'show_user_profile'
 LOGIN_URL = 'login'
+# The user is read from the sessions cache; ModelBackend stays listed so
+# sessions created before the cached backend remain valid
+AUTHENTICATION_BACKENDS = [
+    'mini_insta.backends.CachedModelBackend',
+    'django.contrib.auth.backends.ModelBackend',
+]
+
+# Sessions are read from the cache and written through to the database,
+# which is only written when a session changes (login and logout)
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+SESSION_CACHE_ALIAS = 'sessions'
+SESSION_SAVE_EVERY_REQUEST = False
+
+# Startup settings
+# Load URL patterns and compile templates when a worker starts instead of on
+# its first request; set DJANGO_WARM_UP=0 or 1 to override the default
+WARM_UP_WORKERS = os.environ.get('DJANGO_WARM_UP', '1' if is_production else '0') == '1'
+
+# Request profiling (cs412.profiling)
+# Staff profile a request with the X-Profile: 1 header or ?_profile=1
+PROFILING_DIR = BASE_DIR / 'profiles'
+# Requests slower than this many milliseconds are profiled automatically; unset turns it off
+PROFILING_SLOW_REQUEST_MS = int(os.environ['DJANGO_PROFILE_SLOW_MS']) if os.environ.get('DJANGO_PROFILE_SLOW_MS') else None
+
+# Mini Insta settings
+# Seconds a like/unlike waits in mini_insta.PendingLike so rapid toggles are written once; 0 writes at once
+MINI_INSTA_LIKE_COALESCE_SECONDS = 1.0
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
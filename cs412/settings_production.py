@@ -0,0 +1,81 @@
+"""
+File: settings_production.py
+Author: Anthony Xie
+Email: xiea@bu.edu
+Description: Production settings profile for the cs412 project.
+
+Extends cs412.settings with the options that only make sense on the BU
+server: DEBUG off, compiled templates kept in memory by the cached loader,
+content-hashed and precompressed static files served by the application,
+a session cache shared by all workers, workers that warm up at startup,
+and the caching proxy for external images.
+wsgi.py and manage.py use this module when DJANGO_ENV=production, or it
+can be selected with DJANGO_SETTINGS_MODULE=cs412.settings_production.
+"""
+
+from .settings import *  # noqa: F401,F403
+
+DEBUG = False
+
+STATIC_URL = '/xiea/static/'
+MEDIA_URL = '/xiea/media/'
+
+# Templates are compiled once per worker and reused until the worker exits.
+# APP_DIRS must be off when loaders are listed explicitly.
+TEMPLATES = [
+    {
+        **TEMPLATES[0],
+        'APP_DIRS': False,
+        'OPTIONS': {
+            **TEMPLATES[0]['OPTIONS'],
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
+            ],
+        },
+    },
+]
+
+# collectstatic writes each file under a name containing a hash of its
+# contents, and {% static %} links to that name, so browsers can keep
+# stylesheets until they change. Text files also get .gz/.br copies.
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'cs412.storage.CompressedManifestStaticFilesStorage',
+    },
+}
+
+# Serve STATIC_ROOT from the application with immutable caching, so static
+# files work without web server configuration
+MIDDLEWARE = [
+    'django.middleware.security.SecurityMiddleware',
+    'cs412.middleware.StaticFilesMiddleware',
+    *[name for name in MIDDLEWARE if name != 'django.middleware.security.SecurityMiddleware'],
+]
+
+# Apache runs several worker processes, so sessions and cached users go in
+# a file cache they all share; a per-process cache would keep serving a
+# session another worker has logged out
+CACHES = {
+    **CACHES,
+    'sessions': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'cache' / 'sessions',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+    # Shared by all workers, so each user has one limit rather than one per process
+    'ratelimit': {
+        'BACKEND': 'mini_insta.ratelimit.FileLockedCache',
+        'LOCATION': BASE_DIR / 'cache' / 'ratelimit',
+    },
+}
+
+WARM_UP_WORKERS = True
+
+# Serve external images through the caching proxy
+IMAGE_PROXY_ENABLED = True
@@ -0,0 +1,100 @@
+"""
+File: storage.py
+Author: Anthony Xie
+Email: xiea@bu.edu
+Description: Static files storage that precompresses collected files.
+
+collectstatic already writes content-hashed copies of every file through
+ManifestStaticFilesStorage. This storage also writes a .gz sibling, and a
+.br sibling when the optional brotli package is installed, next to each
+text file, so StaticFilesMiddleware can send compressed bytes without
+compressing on every request.
+"""
+
+import gzip
+import os
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Only text formats compress well; images and fonts are already compressed
+COMPRESSIBLE_EXTENSIONS = ('.css', '.js', '.mjs', '.map', '.svg', '.html', '.txt', '.json', '.xml', '.ico')
+
+# A compressed copy must save at least this fraction of the size to be kept
+MIN_SAVING = 0.05
+
+
+def _write_if_smaller(path, data, original_size):
+    """
+    Write compressed data next to a static file if it saves enough bytes.
+
+    Parameters:
+        path: The path of the compressed file.
+        data: The compressed bytes.
+        original_size: The size of the uncompressed file.
+    """
+    if len(data) <= original_size * (1 - MIN_SAVING):
+        with open(path, 'wb') as compressed_file:
+            compressed_file.write(data)
+    elif os.path.exists(path):
+        os.remove(path)
+
+
+def compress_file(path):
+    """
+    Write gzip and brotli siblings of a static file.
+
+    Parameters:
+        path: The absolute path of the file.
+
+    Returns:
+        list: The suffixes of the compressed files written.
+    """
+    with open(path, 'rb') as static_file:
+        data = static_file.read()
+
+    written = []
+    # mtime=0 keeps the .gz bytes identical between collectstatic runs
+    _write_if_smaller(path + '.gz', gzip.compress(data, compresslevel=9, mtime=0), len(data))
+    if os.path.exists(path + '.gz'):
+        written.append('.gz')
+    if brotli is not None:
+        _write_if_smaller(path + '.br', brotli.compress(data, quality=11), len(data))
+        if os.path.exists(path + '.br'):
+            written.append('.br')
+    return written
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """
+    Manifest storage that precompresses the original and hashed copies of
+    text files after collectstatic has processed them.
+    """
+    def post_process(self, paths, dry_run=False, **options):
+        """
+        Hash files as ManifestStaticFilesStorage does, then compress them.
+
+        Parameters:
+            paths: The collected files, as passed by collectstatic.
+            dry_run: Whether collectstatic is only reporting what it would do.
+            **options: Additional collectstatic options.
+
+        Returns:
+            generator: (original_name, processed_name, processed) tuples.
+        """
+        names = set()
+        for name, hashed_name, processed in super().post_process(paths, dry_run, **options):
+            if hashed_name and not isinstance(processed, Exception):
+                names.update((name, hashed_name))
+            yield name, hashed_name, processed
+
+        if dry_run:
+            return
+
+        for name in sorted(names):
+            if name.endswith(COMPRESSIBLE_EXTENSIONS) and self.exists(name):
+                compress_file(self.path(name))
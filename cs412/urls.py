@@ -18,9 +18,12 @@ from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
+from cs412 import profiling
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('profiles/', profiling.capture_index, name='profile_captures'),
+    path('profiles/<str:name>/', profiling.capture_download, name='profile_capture'),
     path('', include('quotes.urls')),
     path('', include('restaurant.urls')),
     path('mini_insta/', include('mini_insta.urls')),
@@ -0,0 +1,102 @@
+"""
+File: warmup.py
+Author: Anthony Xie
+Email: xiea@bu.edu
+Description: Worker warm-up for the cs412 project.
+
+Django imports the URLconf and compiles each template the first time a
+request needs them, so the first visitor to each new worker pays for it.
+warm_up() does that work while the worker starts instead. It is called from
+wsgi.py and asgi.py when the WARM_UP_WORKERS setting is on.
+"""
+
+import logging
+import os
+import time
+
+from django.template import engines
+from django.template.backends.django import DjangoTemplates
+from django.template.exceptions import TemplateDoesNotExist, TemplateSyntaxError
+from django.urls import get_resolver
+
+logger = logging.getLogger(__name__)
+
+
+def warm_url_resolvers():
+    """
+    Import the root URLconf and every view module it includes, and build the
+    reverse lookup tables used by {% url %} and reverse().
+
+    Returns:
+        int: The number of URL names that can be reversed.
+    """
+    resolver = get_resolver()
+    # reverse_dict populates every nested resolver on first access
+    return len(resolver.reverse_dict)
+
+
+def _loader_dirs(loaders):
+    """
+    Return the directories searched by a list of template loaders.
+
+    Parameters:
+        loaders: Template loader instances; cached loaders are unwrapped.
+
+    Returns:
+        list: The template directories, in search order and without duplicates.
+    """
+    dirs = []
+    for loader in loaders:
+        if hasattr(loader, 'loaders'):
+            candidates = _loader_dirs(loader.loaders)
+        elif hasattr(loader, 'get_dirs'):
+            candidates = loader.get_dirs()
+        else:
+            candidates = []
+        dirs.extend(str(d) for d in candidates if str(d) not in dirs)
+    return dirs
+
+
+def warm_templates(strict=False):
+    """
+    Compile every template in the template directories of Django template
+    engines, so they are stored in the cached template loader.
+
+    Parameters:
+        strict: Raise on the first template that fails to compile instead of
+            logging a warning.
+
+    Returns:
+        int: The number of templates compiled.
+    """
+    compiled = 0
+    for engine in engines.all():
+        if not isinstance(engine, DjangoTemplates):
+            continue
+        for template_dir in _loader_dirs(engine.engine.template_loaders):
+            for root, dirs, files in os.walk(template_dir):
+                for filename in files:
+                    if not filename.endswith(('.html', '.txt')):
+                        continue
+                    name = os.path.relpath(os.path.join(root, filename), template_dir)
+                    try:
+                        engine.get_template(name.replace(os.sep, '/'))
+                        compiled += 1
+                    except (TemplateDoesNotExist, TemplateSyntaxError):
+                        if strict:
+                            raise
+                        logger.warning('Could not warm up template %s', name, exc_info=True)
+    return compiled
+
+
+def warm_up():
+    """
+    Warm up URL resolvers and templates for a new worker.
+    """
+    start = time.perf_counter()
+    url_count = warm_url_resolvers()
+    template_count = warm_templates()
+    logger.info(
+        'Warmed up %d URL names and %d templates in %.3fs',
+        url_count, template_count, time.perf_counter() - start,
+    )
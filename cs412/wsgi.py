@@ -9,8 +9,16 @@ https://docs.djangoproject.com/en/5.2/howto/deployment/wsgi/
 
 import os
 
+from django.conf import settings
 from django.core.wsgi import get_wsgi_application
 
-os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'cs412.settings')
+os.environ.setdefault(
+    'DJANGO_SETTINGS_MODULE',
+    'cs412.settings_production' if os.environ.get('DJANGO_ENV') == 'production' else 'cs412.settings',
+)
 
 application = get_wsgi_application()
+
+if settings.WARM_UP_WORKERS:
+    from cs412.warmup import warm_up
+    warm_up()
@@ -6,7 +6,10 @@ import sys
 
 def main():
     """Run administrative tasks."""
-    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'cs412.settings')
+    os.environ.setdefault(
+        'DJANGO_SETTINGS_MODULE',
+        'cs412.settings_production' if os.environ.get('DJANGO_ENV') == 'production' else 'cs412.settings',
+    )
     try:
         from django.core.management import execute_from_command_line
     except ImportError as exc:
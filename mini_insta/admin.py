@@ -7,62 +7,182 @@ Registers models with the admin interface and customizes admin views.
 """
 
 from django.contrib import admin
-from .models import Profile, Post, Photo, Follow, Comment, Like
+from django.contrib.auth.admin import UserAdmin
+from django.contrib.auth.models import User
+
+from cs412.changelist import LargeTableAdminMixin
+from .models import Profile, Post, Photo, Follow, Comment, Like, MediaBlob, PurgeJob, TagEntry
+
+
+class TombstoneAdminMixin:
+    """
+    Admin mixin that deletes objects by tombstoning them and purging their
+    rows in the background, instead of running Django's cascade collector.
+    """
+    def tombstone(self, obj):
+        """
+        Tombstone one object through its model's tombstone() method.
+        """
+        obj.tombstone()
+
+    def get_deleted_objects(self, objs, request):
+        """
+        List only the selected objects on the confirmation page, since
+        collecting every related row is what the background purge avoids.
+        """
+        return [str(obj) for obj in objs], {}, set(), []
+
+    def delete_model(self, request, obj):
+        """
+        Tombstone a single object.
+        """
+        self.tombstone(obj)
+
+    def delete_queryset(self, request, queryset):
+        """
+        Tombstone each selected object.
+        """
+        for obj in queryset:
+            self.tombstone(obj)
+
 
 @admin.register(Profile)
-class ProfileAdmin(admin.ModelAdmin):
+class ProfileAdmin(TombstoneAdminMixin, LargeTableAdminMixin, admin.ModelAdmin):
     """
     Admin configuration for Profile model.
     """
     list_display = ['username', 'display_name', 'join_date']
     list_filter = ['join_date']
     search_fields = ['username', 'display_name']
+    raw_id_fields = ['user']
 
 
 @admin.register(Post)
-class PostAdmin(admin.ModelAdmin):
+class PostAdmin(TombstoneAdminMixin, LargeTableAdminMixin, admin.ModelAdmin):
     """
     Admin configuration for Post model.
     """
     list_display = ['profile', 'caption', 'timestamp']
     list_filter = ['timestamp']
     search_fields = ['caption', 'profile__username']
+    list_select_related = ['profile']
+    raw_id_fields = ['profile']
 
 
 @admin.register(Photo)
-class PhotoAdmin(admin.ModelAdmin):
+class PhotoAdmin(LargeTableAdminMixin, admin.ModelAdmin):
     """
     Admin configuration for Photo model.
     """
     list_display = ['post', 'timestamp']
     list_filter = ['timestamp']
+    list_select_related = ['post__profile']
+    raw_id_fields = ['post']
 
 
 @admin.register(Follow)
-class FollowAdmin(admin.ModelAdmin):
+class FollowAdmin(LargeTableAdminMixin, admin.ModelAdmin):
     """
     Admin configuration for Follow model.
     """
     list_display = ['follower_profile', 'profile', 'timestamp']
     list_filter = ['timestamp']
-    search_fields = ['follower_profile__username', 'profile__username']
+    # Exact usernames are looked up in the unique index
+    search_fields = ['follower_profile__username__exact', 'profile__username__exact']
+    list_select_related = ['follower_profile', 'profile']
+    raw_id_fields = ['follower_profile', 'profile']
 
 
 @admin.register(Comment)
-class CommentAdmin(admin.ModelAdmin):
+class CommentAdmin(LargeTableAdminMixin, admin.ModelAdmin):
     """
     Admin configuration for Comment model.
     """
     list_display = ['profile', 'post', 'text', 'timestamp']
     list_filter = ['timestamp']
     search_fields = ['text', 'profile__username']
+    list_select_related = ['profile', 'post__profile']
+    raw_id_fields = ['post', 'profile']
 
 
 @admin.register(Like)
-class LikeAdmin(admin.ModelAdmin):
+class LikeAdmin(LargeTableAdminMixin, admin.ModelAdmin):
     """
     Admin configuration for Like model.
     """
     list_display = ['profile', 'post', 'timestamp']
     list_filter = ['timestamp']
-    search_fields = ['profile__username']
+    search_fields = ['profile__username__exact']
+    list_select_related = ['profile', 'post__profile']
+    raw_id_fields = ['post', 'profile']
+
+
+@admin.register(TagEntry)
+class TagEntryAdmin(LargeTableAdminMixin, admin.ModelAdmin):
+    """
+    Admin configuration for TagEntry model.
+    """
+    list_display = ['tag', 'post', 'comment', 'timestamp']
+    # Normalized tags such as '#sunset' are looked up in the tag index
+    search_fields = ['tag__exact']
+    list_select_related = ['post__profile', 'comment__profile', 'comment__post__profile']
+    raw_id_fields = ['post', 'comment']
+
+
+@admin.register(MediaBlob)
+class MediaBlobAdmin(admin.ModelAdmin):
+    """
+    Admin configuration for MediaBlob model.
+    """
+    list_display = ['name', 'size', 'refcount', 'created']
+    search_fields = ['name']
+    readonly_fields = ['name', 'size', 'refcount', 'created']
+
+
+@admin.register(PurgeJob)
+class PurgeJobAdmin(admin.ModelAdmin):
+    """
+    Admin configuration for PurgeJob model, showing the progress of background purges.
+    """
+    list_display = ['target_type', 'target_id', 'status', 'progress_percent', 'deleted_rows', 'total_rows', 'created', 'finished']
+    list_filter = ['status', 'target_type']
+    readonly_fields = ['target_type', 'target_id', 'user_id', 'status', 'total_rows', 'deleted_rows',
+                       'error', 'created', 'started', 'finished']
+
+    @admin.display(description='Progress')
+    def progress_percent(self, obj):
+        return f"{obj.progress()}%"
+
+
+admin.site.unregister(User)
+
+
+@admin.register(User)
+class MiniInstaUserAdmin(UserAdmin):
+    """
+    Admin configuration for User model that purges the user's profiles in the
+    background before deleting the account.
+    """
+    def get_deleted_objects(self, objs, request):
+        """
+        List only the selected users on the confirmation page.
+        """
+        return [str(obj) for obj in objs], {}, set(), []
+
+    def delete_model(self, request, obj):
+        """
+        Deactivate the user and delete it once its profiles are purged.
+        """
+        profiles = list(Profile.objects.filter(user=obj))
+        if not profiles:
+            obj.delete()
+        # The last job deletes the account after every profile is purged
+        for index, profile in enumerate(profiles):
+            profile.tombstone(delete_user=index == len(profiles) - 1)
+
+    def delete_queryset(self, request, queryset):
+        """
+        Delete each selected user as delete_model does.
+        """
+        for obj in queryset:
+            self.delete_model(request, obj)
@@ -0,0 +1,726 @@
+"""
+File: api.py
+Author: Anthony Xie
+Email: xiea@bu.edu
+Description: JSON endpoints for the Mini Insta application.
+Contains read-only endpoints for profiles, posts, the news feed, comments
+and search, batch endpoints that let clients sync many follow or like
+actions in a single request, and the chunked photo upload endpoints.
+
+Read endpoints serialize with values() rather than model instances. The
+fields= query parameter limits the selected columns (and therefore the
+joins), and lists are paginated with keyset cursors. Before anything is
+serialized, one aggregate query over the rows of the response reads their
+newest modified time and their count and ids. Those make the ETag, so a
+conditional request that still matches is answered 304 without building
+the payload, and edits and deletions both change it. Single objects also
+carry Last-Modified; lists do not, since a timestamp cannot show that a
+row has left the list.
+"""
+
+import json
+
+from django.db import transaction
+from django.db.models import Count, Max, Min, Q, Sum
+from django.http import JsonResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from django.views.generic import View
+
+from .batch import apply_batch
+from .coalesce import discard_pending
+from .conditional import make_etag
+from .events import publish_like_counts
+from .models import Profile, Post, Photo, Follow, Comment, Like
+from .pagination import keyset_page, parse_cursor
+from .ratelimit import RateLimitMixin
+from .uploads import CHUNK_SIZE, UploadError, get_upload, start_upload, write_chunk
+from .views import CustomLoginRequiredMixin
+
+# Maximum number of operations accepted in one batch request
+MAX_BATCH_SIZE = 500
+
+# Default and maximum number of rows in one page of a list endpoint
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+
+# Public field names mapped to the ORM lookups that produce them
+PROFILE_FIELDS = {
+    'id': 'pk',
+    'username': 'username',
+    'display_name': 'display_name',
+    'profile_image_url': 'profile_image_url',
+    'bio_text': 'bio_text',
+    'join_date': 'join_date',
+}
+
+POST_FIELDS = {
+    'id': 'pk',
+    'profile': 'profile_id',
+    'username': 'profile__username',
+    'caption': 'caption',
+    'timestamp': 'timestamp',
+    # Loaded with one extra query for the whole page
+    'photos': None,
+}
+
+COMMENT_FIELDS = {
+    'id': 'pk',
+    'post': 'post_id',
+    'profile': 'profile_id',
+    'username': 'profile__username',
+    'text': 'text',
+    'timestamp': 'timestamp',
+}
+
+
+class ApiError(Exception):
+    """
+    Error raised by read endpoints to return a JSON error response.
+    """
+    def __init__(self, message, status=400):
+        """
+        Store the error message and HTTP status.
+
+        Parameters:
+            message: The error message returned to the client.
+            status: The HTTP status code.
+        """
+        super().__init__(message)
+        self.status = status
+
+
+class ApiLoginRequiredMixin(CustomLoginRequiredMixin):
+    """
+    Login mixin for JSON endpoints that answers 401 instead of redirecting.
+    """
+    def handle_no_permission(self):
+        """
+        Return a JSON error for unauthenticated requests.
+
+        Returns:
+            JsonResponse: A 401 response.
+        """
+        return JsonResponse({'error': 'Authentication required.'}, status=401)
+
+
+def parse_operations(request, target_key, op_names):
+    """
+    Parse the operations list from a JSON batch request body.
+
+    The body must look like {"operations": [{"op": ..., target_key: <id>}, ...]}.
+
+    Parameters:
+        request: The HTTP request.
+        target_key: The name of the id field in each operation.
+        op_names: The operation names that are accepted.
+
+    Returns:
+        list: One (op, target_id) tuple per operation, or None for malformed ones.
+
+    Raises:
+        ValueError: If the body is not a valid batch request.
+    """
+    try:
+        payload = json.loads(request.body)
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError('Request body must be valid JSON.')
+
+    operations = payload.get('operations') if isinstance(payload, dict) else None
+    if not isinstance(operations, list):
+        raise ValueError("Request body must contain an 'operations' list.")
+    if len(operations) > MAX_BATCH_SIZE:
+        raise ValueError(f'A batch may contain at most {MAX_BATCH_SIZE} operations.')
+
+    parsed = []
+    for operation in operations:
+        target_id = operation.get(target_key) if isinstance(operation, dict) else None
+        if (not isinstance(operation, dict) or operation.get('op') not in op_names
+                or not isinstance(target_id, int) or isinstance(target_id, bool)):
+            parsed.append(None)
+        else:
+            parsed.append((operation['op'], target_id))
+    return parsed
+
+
+class BatchRateLimitMixin(RateLimitMixin):
+    """
+    Rate limit mixin that charges a batch request one token per operation,
+    so batching does not get around the limit of the single-action views.
+    """
+    def get_rate_limit_cost(self, request):
+        """
+        Return the number of operations in the request body.
+
+        Parameters:
+            request: The HTTP request.
+
+        Returns:
+            int: The operation count, or 1 if the body is malformed.
+        """
+        try:
+            operations = json.loads(request.body).get('operations')
+        except (ValueError, UnicodeDecodeError, AttributeError):
+            return 1
+        return max(1, len(operations)) if isinstance(operations, list) else 1
+
+
+class BulkFollowView(ApiLoginRequiredMixin, BatchRateLimitMixin, View):
+    """
+    JSON endpoint to follow and unfollow many profiles at once.
+    Shares the follow rate limit with the follow and unfollow views.
+    """
+    rate_limit_scope = 'follow'
+
+    def post(self, request):
+        """
+        Handle a batch of follow/unfollow operations.
+
+        The body is {"operations": [{"op": "follow" | "unfollow", "profile": <id>}, ...]}.
+
+        Parameters:
+            request: The HTTP request.
+
+        Returns:
+            JsonResponse: Per-operation results.
+        """
+        follower_profile = self.get_user_profile()
+        if follower_profile is None:
+            return JsonResponse({'error': 'No profile for this user.'}, status=403)
+
+        try:
+            parsed = parse_operations(request, 'profile', {'follow', 'unfollow'})
+        except ValueError as error:
+            return JsonResponse({'error': str(error)}, status=400)
+
+        target_ids = [item[1] for item in parsed if item is not None]
+        valid_ids = set(Profile.objects.filter(pk__in=target_ids).values_list('pk', flat=True))
+
+        results = apply_batch(
+            Follow, 'follower_profile', 'profile', follower_profile.pk, parsed,
+            add_op='follow', valid_ids=valid_ids, forbidden_ids={follower_profile.pk},
+        )
+        return JsonResponse({'results': results})
+
+
+class BulkLikeView(ApiLoginRequiredMixin, BatchRateLimitMixin, View):
+    """
+    JSON endpoint to like and unlike many posts at once.
+    Shares the like rate limit with the like and unlike views.
+    """
+    rate_limit_scope = 'like'
+
+    def post(self, request):
+        """
+        Handle a batch of like/unlike operations.
+
+        The body is {"operations": [{"op": "like" | "unlike", "post": <id>}, ...]}.
+
+        Parameters:
+            request: The HTTP request.
+
+        Returns:
+            JsonResponse: Per-operation results.
+        """
+        profile = self.get_user_profile()
+        if profile is None:
+            return JsonResponse({'error': 'No profile for this user.'}, status=403)
+
+        try:
+            parsed = parse_operations(request, 'post', {'like', 'unlike'})
+        except ValueError as error:
+            return JsonResponse({'error': str(error)}, status=400)
+
+        target_ids = [item[1] for item in parsed if item is not None]
+        owners = dict(Post.objects.filter(pk__in=target_ids).values_list('pk', 'profile_id'))
+
+        # Users cannot like their own posts
+        own_posts = {pk for pk, owner_id in owners.items() if owner_id == profile.pk}
+
+        with transaction.atomic():
+            results = apply_batch(
+                Like, 'profile', 'post', profile.pk, parsed,
+                add_op='like', valid_ids=set(owners), forbidden_ids=own_posts,
+            )
+            # The batch is newer than any like or unlike still waiting to be written
+            discard_pending(profile.pk, [item[1] for item in parsed if item is not None])
+        # Connected pages learn the new counts of the posts that changed
+        changed = {result['id'] for result in results if result.get('status') in ('created', 'deleted')}
+        if changed:
+            publish_like_counts(changed)
+        return JsonResponse({'results': results})
+
+
+def upload_state(upload):
+    """
+    Return the JSON description of a chunked upload.
+
+    Parameters:
+        upload: The PhotoUpload.
+
+    Returns:
+        dict: The upload id, its draft post, size, resume offset and photo.
+    """
+    return {
+        'id': str(upload.pk),
+        'post': upload.post_id,
+        'size': upload.size,
+        'offset': upload.received,
+        'chunk_size': CHUNK_SIZE,
+        'photo': upload.photo_id,
+    }
+
+
+def upload_error(error):
+    """
+    Return the JSON response for an UploadError, with the offset to resume from.
+
+    Parameters:
+        error: The UploadError.
+
+    Returns:
+        JsonResponse: The error response.
+    """
+    data = {'error': str(error)}
+    if error.offset is not None:
+        data['offset'] = error.offset
+    return JsonResponse(data, status=error.status)
+
+
+class UploadStartView(ApiLoginRequiredMixin, View):
+    """
+    JSON endpoint to start a chunked photo upload to a draft post.
+    """
+    def post(self, request):
+        """
+        Start an upload.
+
+        The body is {"filename": ..., "size": <bytes>, "sha256": <hex digest>},
+        with "post": <draft id> to add the photo to an existing draft.
+
+        Parameters:
+            request: The HTTP request.
+
+        Returns:
+            JsonResponse: The new upload's state, with status 201.
+        """
+        profile = self.get_user_profile()
+        if profile is None:
+            return JsonResponse({'error': 'No profile for this user.'}, status=403)
+
+        try:
+            payload = json.loads(request.body)
+        except (ValueError, UnicodeDecodeError):
+            return JsonResponse({'error': 'Request body must be valid JSON.'}, status=400)
+        if not isinstance(payload, dict):
+            return JsonResponse({'error': 'Request body must be a JSON object.'}, status=400)
+        post_id = payload.get('post')
+        if post_id is not None and (not isinstance(post_id, int) or isinstance(post_id, bool)):
+            return JsonResponse({'error': 'post must be the id of a draft post.'}, status=400)
+
+        try:
+            upload = start_upload(profile, payload.get('filename'), payload.get('size'),
+                                  payload.get('sha256'), post_id)
+        except UploadError as error:
+            return upload_error(error)
+        return JsonResponse(upload_state(upload), status=201)
+
+
+class UploadChunkView(ApiLoginRequiredMixin, View):
+    """
+    JSON endpoint to send the chunks of an upload and to ask where to resume.
+    """
+    def get(self, request, pk):
+        """
+        Return an upload's state, whose offset is where to resume sending.
+
+        Parameters:
+            request: The HTTP request.
+            pk: The upload id.
+
+        Returns:
+            JsonResponse: The upload's state.
+        """
+        try:
+            upload = get_upload(pk, self.get_user_profile())
+        except UploadError as error:
+            return upload_error(error)
+        return JsonResponse(upload_state(upload))
+
+    def put(self, request, pk):
+        """
+        Append one chunk, sent as the raw request body.
+
+        The Upload-Offset header gives the chunk's byte offset and the
+        Upload-Checksum header its digest as "sha256 <hex digest>". The body
+        is streamed to disk rather than read into memory.
+
+        Parameters:
+            request: The HTTP request.
+            pk: The upload id.
+
+        Returns:
+            JsonResponse: The upload's state, with "photo" set once it is complete.
+        """
+        offset = request.headers.get('Upload-Offset', '')
+        length = request.headers.get('Content-Length', '')
+        algorithm, _, checksum = request.headers.get('Upload-Checksum', '').partition(' ')
+        if not offset.isdigit() or not length.isdigit() or algorithm != 'sha256':
+            return JsonResponse({'error': 'Upload-Offset, Content-Length and a sha256 '
+                                          'Upload-Checksum are required.'}, status=400)
+        try:
+            upload = get_upload(pk, self.get_user_profile())
+            write_chunk(upload, int(offset), int(length), request, checksum)
+        except UploadError as error:
+            return upload_error(error)
+        return JsonResponse(upload_state(upload))
+
+
+class ApiReadView(View):
+    """
+    Base class for read-only JSON endpoints backed by values() querysets.
+    """
+    model = None
+    field_map = {}
+    # Columns whose newest value is the time the response last changed
+    modified_fields = ('modified',)
+
+    def get_queryset(self):
+        """
+        Return the QuerySet of model rows served by this endpoint.
+
+        Returns:
+            QuerySet: The rows to serialize, every live row of model by default.
+        """
+        return self.model.objects.all()
+
+    def get_field_names(self):
+        """
+        Return the public field names requested with the fields= parameter.
+
+        The id is always included. Without fields=, every field is returned.
+
+        Returns:
+            list: Public field names.
+
+        Raises:
+            ApiError: If an unknown field is requested.
+        """
+        raw = self.request.GET.get('fields')
+        if not raw:
+            return list(self.field_map)
+
+        names = [name.strip() for name in raw.split(',') if name.strip()]
+        unknown = [name for name in names if name not in self.field_map]
+        if unknown:
+            raise ApiError(f"Unknown fields: {', '.join(unknown)}")
+        if 'id' not in names:
+            names.insert(0, 'id')
+        return list(dict.fromkeys(names))
+
+    def get_values(self, queryset, names):
+        """
+        Turn a queryset into a values() queryset selecting only what is needed.
+
+        Parameters:
+            queryset: The QuerySet to project.
+            names: The public field names to return.
+
+        Returns:
+            QuerySet: A values() queryset.
+        """
+        return queryset.values(*[self.field_map[name] for name in names if self.field_map[name]])
+
+    def to_json(self, rows, names):
+        """
+        Rename values() rows to their public field names.
+
+        Parameters:
+            rows: Dictionaries returned by a values() queryset.
+            names: The public field names to return.
+
+        Returns:
+            list: Dictionaries keyed by public field name.
+        """
+        return [
+            {name: row[self.field_map[name]] for name in names if self.field_map[name]}
+            for row in rows
+        ]
+
+    def add_extra_fields(self, rows, items, names):
+        """
+        Hook to add fields that are not plain columns, such as post photos.
+
+        Parameters:
+            rows: The values() rows of the page.
+            items: The serialized dictionaries, updated in place.
+            names: The public field names requested.
+        """
+
+    def get_validators(self, queryset):
+        """
+        Return the ETag and last modified time of the rows a response will
+        contain, read with one aggregate query.
+
+        The count, the highest and lowest id and the sum of the ids change
+        when a row joins or leaves the response, and the newest modified
+        time changes when one is edited.
+
+        Parameters:
+            queryset: The rows of the response, already filtered and sliced.
+
+        Returns:
+            tuple: The ETag, and the modified time as a timestamp or None.
+        """
+        modified = {f'modified_{index}': Max(field) for index, field in enumerate(self.modified_fields)}
+        state = queryset.aggregate(count=Count('pk'), high=Max('pk'), low=Min('pk'), total=Sum('pk'), **modified)
+        times = [state[key] for key in modified if state[key] is not None]
+        last_modified = int(max(times).timestamp()) if times else None
+        etag = make_etag(self.request.get_full_path(), self.request.user.pk, state['count'],
+                         state['high'], state['low'], state['total'], last_modified)
+        return etag, last_modified
+
+    def respond(self, validators, build, last_modified=True):
+        """
+        Return 304 Not Modified if the client's copy is current, or else
+        build the JSON response and attach its validators.
+
+        Parameters:
+            validators: The (etag, last_modified) pair from get_validators.
+            build: A function returning the JSON-serializable response data.
+            last_modified: False to leave out the Last-Modified header.
+
+        Returns:
+            HttpResponse: The JSON or 304 response.
+        """
+        etag, modified = validators
+        if not last_modified:
+            modified = None
+        response = get_conditional_response(self.request, etag=etag, last_modified=modified)
+        if response is not None:
+            return response
+
+        response = JsonResponse(build())
+        response['ETag'] = etag
+        if modified is not None:
+            response['Last-Modified'] = http_date(modified)
+        return response
+
+    def dispatch(self, request, *args, **kwargs):
+        """
+        Convert ApiError exceptions into JSON error responses.
+
+        Parameters:
+            request: The HTTP request.
+            *args: Additional positional arguments.
+            **kwargs: Additional keyword arguments.
+
+        Returns:
+            HttpResponse: The endpoint response.
+        """
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        except ApiError as error:
+            return JsonResponse({'error': str(error)}, status=error.status)
+
+
+class ApiListView(ApiReadView):
+    """
+    Base class for JSON list endpoints with keyset pagination.
+
+    Clients pass after=<next> from the previous page to continue, and
+    limit=<n> to change the page size.
+    """
+    def get(self, request, *args, **kwargs):
+        """
+        Return one page of rows.
+
+        Parameters:
+            request: The HTTP request.
+            *args: Additional positional arguments.
+            **kwargs: Additional keyword arguments.
+
+        Returns:
+            HttpResponse: The JSON page.
+        """
+        names = self.get_field_names()
+        limit = parse_cursor(request.GET.get('limit')) or DEFAULT_LIMIT
+        limit = max(1, min(limit, MAX_LIMIT))
+        cursor = parse_cursor(request.GET.get('after'))
+
+        queryset = self.get_queryset()
+        # The page and the extra row that decides whether there is a next page
+        page = queryset.order_by('-pk')
+        if cursor is not None:
+            page = page.filter(pk__lt=cursor)
+
+        def build():
+            rows, next_cursor = keyset_page(self.get_values(queryset, names), 'pk', cursor, limit)
+            items = self.to_json(rows, names)
+            self.add_extra_fields(rows, items, names)
+            return {'results': items, 'next': next_cursor}
+
+        return self.respond(self.get_validators(page[:limit + 1]), build, last_modified=False)
+
+
+class ApiDetailView(ApiReadView):
+    """
+    Base class for JSON endpoints returning a single row by primary key.
+    """
+    def get(self, request, *args, **kwargs):
+        """
+        Return a single row.
+
+        Parameters:
+            request: The HTTP request.
+            *args: Additional positional arguments.
+            **kwargs: Additional keyword arguments, including pk.
+
+        Returns:
+            HttpResponse: The JSON object.
+        """
+        names = self.get_field_names()
+        queryset = self.get_queryset().filter(pk=kwargs['pk'])
+        validators = self.get_validators(queryset)
+        if validators[1] is None:
+            raise ApiError('Not found.', status=404)
+
+        def build():
+            rows = list(self.get_values(queryset, names)[:1])
+            if not rows:
+                raise ApiError('Not found.', status=404)
+            items = self.to_json(rows, names)
+            self.add_extra_fields(rows, items, names)
+            return items[0]
+
+        return self.respond(validators, build)
+
+
+class ProfileApiMixin:
+    """
+    Field configuration shared by the profile endpoints.
+    """
+    model = Profile
+    field_map = PROFILE_FIELDS
+
+
+class PostApiMixin:
+    """
+    Field configuration shared by the post endpoints.
+    """
+    model = Post
+    field_map = POST_FIELDS
+    # Photo changes bump the post's modified time; usernames live on the profile
+    modified_fields = ('modified', 'profile__modified')
+
+    def add_extra_fields(self, rows, items, names):
+        """
+        Add photo URLs for the whole page of posts with a single query.
+
+        Parameters:
+            rows: The values() rows of the page.
+            items: The serialized dictionaries, updated in place.
+            names: The public field names requested.
+        """
+        if 'photos' not in names:
+            return
+        photos = {}
+        for photo in Photo.objects.filter(post_id__in=[row['pk'] for row in rows]).order_by('pk'):
+            photos.setdefault(photo.post_id, []).append(photo.get_image_url())
+        for row, item in zip(rows, items):
+            item['photos'] = photos.get(row['pk'], [])
+
+
+class ProfileListApiView(ProfileApiMixin, ApiListView):
+    """
+    JSON endpoint listing profiles, newest first.
+    """
+
+
+class ProfileDetailApiView(ProfileApiMixin, ApiDetailView):
+    """
+    JSON endpoint for a single profile.
+    """
+
+
+class PostListApiView(PostApiMixin, ApiListView):
+    """
+    JSON endpoint listing posts, newest first, optionally for one profile.
+    """
+    def get_queryset(self):
+        """
+        Return all posts, or the posts of the profile given with profile=.
+
+        Returns:
+            QuerySet: Post rows.
+        """
+        queryset = super().get_queryset()
+        profile_id = parse_cursor(self.request.GET.get('profile'))
+        if profile_id is not None:
+            queryset = queryset.filter(profile_id=profile_id)
+        return queryset
+
+
+class PostDetailApiView(PostApiMixin, ApiDetailView):
+    """
+    JSON endpoint for a single post.
+    """
+
+
+class FeedApiView(ApiLoginRequiredMixin, PostApiMixin, ApiListView):
+    """
+    JSON endpoint for the logged-in user's news feed.
+    """
+    def get_queryset(self):
+        """
+        Return posts by followed profiles and by the user's own profile.
+
+        Returns:
+            QuerySet: Post rows.
+
+        Raises:
+            ApiError: If the user has no profile.
+        """
+        profile = self.get_user_profile()
+        if profile is None:
+            raise ApiError('No profile for this user.', status=403)
+        followed = Follow.objects.filter(follower_profile=profile).values('profile_id')
+        return Post.objects.filter(Q(profile_id__in=followed) | Q(profile=profile))
+
+
+class CommentListApiView(ApiListView):
+    """
+    JSON endpoint listing the comments on a post, newest first.
+    """
+    model = Comment
+    field_map = COMMENT_FIELDS
+    # Comments are not edited, and adding or removing one bumps the post
+    modified_fields = ('post__modified',)
+
+    def get_queryset(self):
+        """
+        Return the comments of the post given in the URL.
+
+        Returns:
+            QuerySet: Comment rows.
+        """
+        return Comment.objects.filter(post_id=self.kwargs['pk'], post__deleted=False)
+
+
+class SearchApiView(ProfileApiMixin, ApiListView):
+    """
+    JSON endpoint searching profiles by username or display name.
+    """
+    def get_queryset(self):
+        """
+        Return profiles matching the q= parameter.
+
+        Returns:
+            QuerySet: Profile rows.
+        """
+        query = self.request.GET.get('q', '')
+        if not query:
+            return Profile.objects.none()
+        return Profile.objects.filter(
+            Q(username__icontains=query) | Q(display_name__icontains=query)
+        )
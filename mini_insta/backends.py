@@ -0,0 +1,75 @@
+"""
+File: backends.py
+Author: Anthony Xie
+Email: xiea@bu.edu
+Description: Authentication backend that caches the logged-in user.
+
+Django loads the User row on every authenticated request. CachedModelBackend
+keeps it in the sessions cache for USER_CACHE_SECONDS, so together with the
+cached_db session engine an authenticated request reads neither the session
+nor the user from the database. Saving or deleting a user drops its cached
+copy (see mini_insta.signals), so password changes, deactivation and the
+session auth hash check see the current row.
+"""
+
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import caches
+
+# Seconds a cached user is trusted without being saved
+USER_CACHE_SECONDS = 300
+
+
+def _user_cache():
+    """
+    Return the cache users are stored in, shared with the sessions.
+    """
+    return caches[getattr(settings, 'SESSION_CACHE_ALIAS', 'default')]
+
+
+def user_cache_key(user_id):
+    """
+    Return the cache key of a user.
+
+    Parameters:
+        user_id: The primary key of the user.
+
+    Returns:
+        str: The cache key.
+    """
+    return f'mini_insta:auth:user:{user_id}'
+
+
+def forget_user(user_id):
+    """
+    Drop a user's cached copy, so the next request reads the row again.
+
+    Parameters:
+        user_id: The primary key of the user.
+    """
+    _user_cache().delete(user_cache_key(user_id))
+
+
+class CachedModelBackend(ModelBackend):
+    """
+    ModelBackend that reads the logged-in user from the cache when it can.
+    """
+    def get_user(self, user_id):
+        """
+        Return the active user with the given primary key.
+
+        Parameters:
+            user_id: The primary key stored in the session.
+
+        Returns:
+            User: The user, or None if it does not exist or is inactive.
+        """
+        cache = _user_cache()
+        key = user_cache_key(user_id)
+        user = cache.get(key)
+        if user is None:
+            user = super().get_user(user_id)
+            if user is None:
+                return None
+            cache.set(key, user, USER_CACHE_SECONDS)
+        return user if self.user_can_authenticate(user) else None
@@ -0,0 +1,117 @@
+"""
+File: batch.py
+Author: Anthony Xie
+Email: xiea@bu.edu
+Description: Set-based application of follow and like operations.
+Used by the batch JSON endpoints.
+"""
+
+from django.db import router, transaction
+from django.db.models.signals import post_save
+
+
+def existing_targets(model, actor_id_field, actor_id, target_id_field, target_ids):
+    """
+    Return which of the given targets the actor already has a row for.
+
+    Parameters:
+        model: Follow or Like.
+        actor_id_field: The name of the actor's foreign key column.
+        actor_id: The primary key of the acting Profile.
+        target_id_field: The name of the target's foreign key column.
+        target_ids: The target ids to look up.
+
+    Returns:
+        set: The target ids that have a row.
+    """
+    return set(model.objects.filter(
+        **{actor_id_field: actor_id, f'{target_id_field}__in': list(target_ids)}
+    ).values_list(target_id_field, flat=True))
+
+
+def apply_batch(model, actor_field, target_field, actor_id, parsed, add_op, valid_ids, forbidden_ids):
+    """
+    Apply a batch of add/remove operations in a single transaction.
+
+    When a target appears more than once, the last operation for it wins and
+    the earlier ones are reported as superseded. New rows are inserted with
+    one bulk_create(ignore_conflicts=True) and removed rows with one
+    set-based delete, so the model's unique_together constraint still holds
+    when the same batch is retried or races with another request. The
+    actor's row is locked before anything is read, so batches for the same
+    actor apply one after another and the rows read back after the insert
+    are exactly the ones this batch created; other writers of the actor's
+    rows take the same lock.
+
+    Parameters:
+        model: Follow or Like.
+        actor_field: The name of the foreign key to the acting profile.
+        target_field: The name of the foreign key to the target object.
+        actor_id: The primary key of the acting Profile.
+        parsed: The list returned by parse_operations.
+        add_op: The name of the operation that creates a row.
+        valid_ids: The set of target ids that exist.
+        forbidden_ids: The set of target ids the actor may not add.
+
+    Returns:
+        list: One result dictionary per operation, in request order.
+    """
+    actor_id_field = f'{actor_field}_id'
+    target_id_field = f'{target_field}_id'
+
+    # Only the last operation for each target is applied
+    final = {}
+    for index, item in enumerate(parsed):
+        if item is not None:
+            final[item[1]] = (index, item[0])
+
+    actor_model = model._meta.get_field(actor_field).related_model
+    statuses = {}
+    with transaction.atomic():
+        list(actor_model.objects.select_for_update().filter(pk=actor_id).values_list('pk', flat=True))
+        existing = existing_targets(model, actor_id_field, actor_id, target_id_field, final)
+
+        to_create = []
+        to_delete = []
+        for target_id, (index, op) in final.items():
+            if target_id not in valid_ids:
+                statuses[index] = 'not_found'
+            elif op == add_op:
+                if target_id in forbidden_ids:
+                    statuses[index] = 'forbidden'
+                elif target_id in existing:
+                    statuses[index] = 'unchanged'
+                else:
+                    to_create.append(target_id)
+                    statuses[index] = 'created'
+            elif target_id in existing:
+                to_delete.append(target_id)
+                statuses[index] = 'deleted'
+            else:
+                statuses[index] = 'unchanged'
+
+        if to_create:
+            model.objects.bulk_create(
+                [model(**{actor_id_field: actor_id, target_id_field: target_id}) for target_id in to_create],
+                ignore_conflicts=True,
+            )
+            # bulk_create skips post_save and returns no ids with ignore_conflicts,
+            # so read the new rows back and notify the receivers of each one
+            using = router.db_for_write(model)
+            created = model.objects.using(using).filter(
+                **{actor_id_field: actor_id, f'{target_id_field}__in': to_create}
+            )
+            for instance in created:
+                post_save.send(sender=model, instance=instance, created=True, update_fields=None,
+                               raw=False, using=using)
+
+        if to_delete:
+            model.objects.filter(**{actor_id_field: actor_id, f'{target_id_field}__in': to_delete}).delete()
+
+    results = []
+    for index, item in enumerate(parsed):
+        if item is None:
+            results.append({'status': 'invalid'})
+        else:
+            results.append({'op': item[0], 'id': item[1], 'status': statuses.get(index, 'superseded')})
+    return results
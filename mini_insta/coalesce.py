@@ -0,0 +1,233 @@
+"""
+File: coalesce.py
+Author: Anthony Xie
+Email: xiea@bu.edu
+Description: Write coalescing for likes and unlikes.
+
+A like or unlike request stores the state it asks for in a PendingLike row,
+one per (profile, post), replacing whatever state was pending before. Once
+a row has not changed for MINI_INSTA_LIKE_COALESCE_SECONDS it is flushed:
+the Like row is created or deleted only if the final state differs from
+the stored one, so a burst of toggles costs one small upsert each and at
+most one Like write with its score, modified and event updates.
+
+Pending rows live in the database, so every worker sees them and none are
+lost when a worker is killed. The process that stored a row flushes it on a
+timer and at shutdown, and every web process flushes rows left by others
+every RECOVERY_INTERVAL seconds while it serves requests. Set the window to
+0 to write likes synchronously.
+"""
+
+import atexit
+import logging
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from .batch import apply_batch
+from .events import publish_like_counts
+from .models import Post, Like, PendingLike
+
+logger = logging.getLogger(__name__)
+
+# Seconds between a web process's checks for pending likes left by other processes
+RECOVERY_INTERVAL = 60
+
+
+def coalesce_window():
+    """
+    Return the number of seconds a pending like waits before it is written.
+    """
+    return getattr(settings, 'MINI_INSTA_LIKE_COALESCE_SECONDS', 1.0)
+
+
+def _write_likes(states):
+    """
+    Write final like states, skipping those that match the stored rows.
+
+    Parameters:
+        states: Dictionary mapping (profile_id, post_id) to True or False.
+
+    Returns:
+        set: The primary keys of the posts whose likes changed.
+    """
+    by_profile = {}
+    for (profile_id, post_id), liked in states.items():
+        by_profile.setdefault(profile_id, []).append(('like' if liked else 'unlike', post_id))
+
+    # Posts deleted since the request was made are skipped
+    post_ids = {post_id for profile_id, post_id in states}
+    valid_ids = set(Post.objects.filter(pk__in=post_ids).values_list('pk', flat=True))
+
+    changed = set()
+    for profile_id, operations in by_profile.items():
+        results = apply_batch(
+            Like, 'profile', 'post', profile_id, operations,
+            add_op='like', valid_ids=valid_ids, forbidden_ids=set(),
+        )
+        changed.update(result['id'] for result in results if result.get('status') in ('created', 'deleted'))
+    if changed:
+        publish_like_counts(changed)
+    return changed
+
+
+def set_like(profile_id, post_id, liked):
+    """
+    Record that a profile should, or should not, like a post.
+
+    Parameters:
+        profile_id: The primary key of the liking profile.
+        post_id: The primary key of the post.
+        liked: True for a like, False for an unlike.
+    """
+    with transaction.atomic():
+        if coalesce_window() <= 0:
+            _write_likes({(profile_id, post_id): liked})
+            return
+        PendingLike.objects.update_or_create(profile_id=profile_id, post_id=post_id, defaults={'liked': liked})
+        transaction.on_commit(like_flusher.schedule)
+
+
+def discard_pending(profile_id, post_ids):
+    """
+    Drop the pending likes of a profile that a direct write supersedes.
+
+    Parameters:
+        profile_id: The primary key of the profile.
+        post_ids: The primary keys of the posts written directly.
+    """
+    PendingLike.objects.filter(profile_id=profile_id, post_id__in=list(post_ids)).delete()
+
+
+def flush_likes(settled_for=None):
+    """
+    Write every pending like that has not changed for a while.
+
+    Each row is removed only if it still holds the state that was read, so
+    a toggle that arrives during the flush stays pending, and two processes
+    flushing at once never write the same row twice.
+
+    Parameters:
+        settled_for: Seconds a row must be unchanged, the coalesce window by default.
+
+    Returns:
+        int: The number of pending likes flushed.
+    """
+    if settled_for is None:
+        settled_for = coalesce_window()
+    cutoff = timezone.now() - timedelta(seconds=settled_for)
+    rows = list(PendingLike.objects.filter(updated__lte=cutoff)
+                .values_list('pk', 'profile_id', 'post_id', 'liked', 'updated'))
+    if not rows:
+        return 0
+
+    with transaction.atomic():
+        states = {}
+        for pk, profile_id, post_id, liked, updated in rows:
+            claimed, _ = PendingLike.objects.filter(pk=pk, liked=liked, updated=updated).delete()
+            if claimed:
+                states[(profile_id, post_id)] = liked
+        _write_likes(states)
+    return len(states)
+
+
+def pending_like_state(post, profile):
+    """
+    Return a post's like count and a profile's like state, including pending likes.
+
+    Parameters:
+        post: The Post.
+        profile: The viewing Profile, or None.
+
+    Returns:
+        tuple: (like_count, viewer_likes).
+    """
+    like_count = post.get_likes()
+    viewer_likes = bool(profile) and post.is_liked_by(profile)
+    stored = Like.objects.filter(post=OuterRef('post'), profile=OuterRef('profile'))
+    pending = post.pending_likes.annotate(stored=Exists(stored)).values_list('profile_id', 'liked', 'stored')
+    for profile_id, liked, is_stored in pending:
+        like_count += int(liked) - int(is_stored)
+        if profile and profile_id == profile.pk:
+            viewer_likes = liked
+    return like_count, viewer_likes
+
+
+class LikeFlusher:
+    """
+    Timer that flushes pending likes once they settle.
+    """
+    def __init__(self):
+        """
+        Create an idle flusher.
+        """
+        self._lock = threading.Lock()
+        self._timer = None
+        self._scheduled = False
+        self._checked = time.monotonic()
+
+    def schedule(self):
+        """
+        Make sure a flush runs after the coalesce window.
+        """
+        with self._lock:
+            self._scheduled = True
+            if self._timer is None:
+                self._timer = threading.Timer(coalesce_window(), self._flush_in_thread)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def start_if_due(self):
+        """
+        Schedule a flush if RECOVERY_INTERVAL has passed since the last check,
+        so likes left pending by a stopped process are written.
+        """
+        now = time.monotonic()
+        with self._lock:
+            if now - self._checked < RECOVERY_INTERVAL:
+                return
+            self._checked = now
+        self.schedule()
+
+    def _flush_in_thread(self):
+        """
+        Flush from the timer thread, and schedule again while likes remain pending.
+        """
+        try:
+            flush_likes()
+            remaining = PendingLike.objects.exists()
+        except Exception:
+            logger.exception('Failed to flush pending likes')
+            remaining = True
+        finally:
+            connection.close()
+        with self._lock:
+            self._timer = None
+        if remaining:
+            self.schedule()
+
+    def flush_at_exit(self):
+        """
+        Write the likes this process stored before it shuts down.
+        """
+        with self._lock:
+            if not self._scheduled:
+                return
+            if self._timer is not None:
+                self._timer.cancel()
+        try:
+            flush_likes(settled_for=0)
+        except Exception:
+            logger.exception('Failed to flush pending likes at shutdown')
+
+
+like_flusher = LikeFlusher()
+
+# Write pending likes when a worker shuts down; rows it cannot write are
+# picked up by the other workers
+atexit.register(like_flusher.flush_at_exit)
@@ -0,0 +1,175 @@
+"""
+File: conditional.py
+Author: Anthony Xie
+Email: xiea@bu.edu
+Description: Validator functions for conditional GET on Mini Insta pages.
+
+Each function is meant for django.views.decorators.http.condition. The
+validators come from the modified columns on Profile and Post, which the
+signal handlers bump whenever something shown on the page changes, so a
+repeat visit costs one small query and a 304 instead of a full render.
+
+Pages look different for each logged-in user, so the viewer is part of the
+ETag. Last-Modified is only sent to anonymous visitors, because a timestamp
+alone cannot tell two viewers apart.
+"""
+
+import hashlib
+
+from django.db.models import Max, Q
+
+from .models import Profile, Post
+
+
+def make_etag(*parts):
+    """
+    Build a weak ETag from the given parts.
+
+    Parameters:
+        *parts: Values that together identify one version of a page.
+
+    Returns:
+        str: A quoted weak ETag.
+    """
+    digest = hashlib.md5(':'.join(str(part) for part in parts).encode()).hexdigest()
+    return f'W/"{digest}"'
+
+
+def _viewer_profile_id(request):
+    """
+    Return the primary key of the logged-in user's profile.
+
+    Parameters:
+        request: The HTTP request.
+
+    Returns:
+        int: The profile primary key, or None for anonymous users.
+    """
+    if not request.user.is_authenticated:
+        return None
+    return Profile.objects.filter(user=request.user).values_list('pk', flat=True).first()
+
+
+def _profile_state(request, pk):
+    """
+    Return the validator inputs for a profile page, computed once per request.
+
+    Parameters:
+        request: The HTTP request.
+        pk: The primary key of the profile being shown.
+
+    Returns:
+        tuple: (modified, viewer_id, follows_modified), or None if the profile does not exist.
+    """
+    if not hasattr(request, '_profile_state'):
+        modified = Profile.objects.filter(pk=pk).values_list('modified', flat=True).first()
+        state = None
+        if modified is not None:
+            viewer_id = _viewer_profile_id(request)
+            # The viewer's suggestions come from the viewer's follows and those
+            # of the profiles it follows, and every follow or unfollow bumps
+            # both profiles' modified time, so the newest of those times is
+            # the same in every worker and never builds or searches the graph
+            follows_modified = None
+            if viewer_id:
+                follows_modified = (Profile.objects
+                                    .filter(Q(pk=viewer_id) | Q(followed_by__follower_profile_id=viewer_id))
+                                    .aggregate(newest=Max('modified'))['newest'])
+            state = (modified, viewer_id, follows_modified)
+        request._profile_state = state
+    return request._profile_state
+
+
+def profile_etag(request, pk, **kwargs):
+    """
+    Return the ETag of a profile page.
+
+    Parameters:
+        request: The HTTP request.
+        pk: The primary key of the profile.
+
+    Returns:
+        str: The ETag, or None if the profile does not exist.
+    """
+    state = _profile_state(request, pk)
+    if state is None:
+        return None
+    modified, viewer_id, follows_modified = state
+    return make_etag('profile', pk, modified.timestamp(), viewer_id, follows_modified and follows_modified.timestamp())
+
+
+def profile_last_modified(request, pk, **kwargs):
+    """
+    Return the Last-Modified time of a profile page for anonymous visitors.
+
+    Parameters:
+        request: The HTTP request.
+        pk: The primary key of the profile.
+
+    Returns:
+        datetime: The modified time, or None.
+    """
+    state = _profile_state(request, pk)
+    if state is None or request.user.is_authenticated:
+        return None
+    return state[0]
+
+
+def _post_state(request, pk):
+    """
+    Return the validator inputs for a post page, computed once per request.
+
+    Parameters:
+        request: The HTTP request.
+        pk: The primary key of the post being shown.
+
+    Returns:
+        tuple: (modified, viewer_id, pending_like), or None if the post does not exist.
+    """
+    if not hasattr(request, '_post_state'):
+        # Likes that are not written yet must still change the page
+        row = (Post.objects.filter(pk=pk)
+               .annotate(pending_like=Max('pending_likes__updated'))
+               .values_list('modified', 'profile__modified', 'pending_like').first())
+        state = None
+        if row is not None:
+            modified, profile_modified, pending_like = row
+            state = (max(modified, profile_modified), _viewer_profile_id(request), pending_like)
+        request._post_state = state
+    return request._post_state
+
+
+def post_etag(request, pk, **kwargs):
+    """
+    Return the ETag of a post page.
+
+    Parameters:
+        request: The HTTP request.
+        pk: The primary key of the post.
+
+    Returns:
+        str: The ETag, or None if the post does not exist.
+    """
+    state = _post_state(request, pk)
+    if state is None:
+        return None
+    modified, viewer_id, pending_like = state
+    return make_etag('post', pk, modified.timestamp(), viewer_id, pending_like and pending_like.timestamp())
+
+
+def post_last_modified(request, pk, **kwargs):
+    """
+    Return the Last-Modified time of a post page for anonymous visitors.
+
+    Parameters:
+        request: The HTTP request.
+        pk: The primary key of the post.
+
+    Returns:
+        datetime: The modified time, or None.
+    """
+    state = _post_state(request, pk)
+    if state is None or request.user.is_authenticated:
+        return None
+    modified, viewer_id, pending_like = state
+    return max(modified, pending_like) if pending_like else modified
@@ -0,0 +1,64 @@
+"""
+File: directory.py
+Author: Anthony Xie
+Email: xiea@bu.edu
+Description: Page cache for the Mini Insta profile directory.
+
+Rendered directory pages are stored in the default cache under a key that
+includes a directory version. Saving or deleting a profile bumps the
+version, so every cached page is replaced on its next request. With a
+shared cache backend the bump reaches all workers at once; with the
+per-process default cache, other workers pick up changes when their pages
+expire after CACHE_SECONDS.
+"""
+
+import time
+
+from django.core.cache import cache
+
+# Profiles shown on one directory page
+PAGE_SIZE = 48
+
+# Seconds a rendered page is kept even if no profile changes
+CACHE_SECONDS = 300
+
+# Sort orders offered by the directory: name -> (label, ordering)
+SORTS = {
+    'name': ('Name', ['display_name', 'id']),
+    'newest': ('Newest', ['-join_date', '-id']),
+}
+DEFAULT_SORT = 'name'
+
+VERSION_KEY = 'mini_insta:directory:version'
+
+
+def directory_version():
+    """
+    Return the current directory version, starting one if there is none.
+
+    Returns:
+        int: The version number.
+    """
+    return cache.get_or_set(VERSION_KEY, time.time_ns, None)
+
+
+def bump_directory_version():
+    """
+    Invalidate every cached directory page.
+    """
+    # A timestamp never repeats an earlier version, even after eviction
+    cache.set(VERSION_KEY, time.time_ns(), None)
+
+
+def page_cache_key(sort, page):
+    """
+    Return the cache key of one rendered directory page.
+
+    Parameters:
+        sort: The sort order name.
+        page: The page number requested.
+
+    Returns:
+        str: The cache key.
+    """
+    return f'mini_insta:directory:{directory_version()}:{sort}:{page}'
@@ -0,0 +1,233 @@
+"""
+File: events.py
+Author: Anthony Xie
+Email: xiea@bu.edu
+Description: In-process event bus and Server-Sent Events streams for live updates.
+
+Views publish new posts, comments and like counts to topics on the event
+bus once their transaction commits. Each open feed or post page holds one
+EventSource connection, served by an async view that subscribes to the
+topics it shows and writes each event as it arrives. An idle connection is
+just a suspended coroutine and a small queue, so one ASGI process can hold
+thousands of them without a thread each.
+
+Topics are 'profile:<id>' for everything about a profile's posts and
+'post:<id>' for one post. The bus lives in one process: clients only hear
+about writes made by the process they are connected to, so a deployment
+with several ASGI processes needs sticky routing or a shared broker in
+place of this bus. Under WSGI the stream views answer 204 No Content,
+which tells EventSource not to reconnect, and pages keep working without
+live updates.
+"""
+
+import asyncio
+import json
+import threading
+
+from django.db import transaction
+from django.db.models import Count
+from django.template.loader import render_to_string
+
+from .models import Post
+
+# Events buffered for one slow client before the oldest are dropped
+QUEUE_SIZE = 100
+
+# Seconds between keep-alive comments on an idle stream
+HEARTBEAT_SECONDS = 15
+
+# Milliseconds the browser waits before reconnecting a dropped stream
+RETRY_MILLISECONDS = 5000
+
+
+class Subscription:
+    """
+    One connected client's queue of events, owned by the event loop serving it.
+    """
+    def __init__(self, topics, loop, queue_size=QUEUE_SIZE):
+        """
+        Create a subscription for a set of topics.
+
+        Parameters:
+            topics: The topic names to receive events for.
+            loop: The event loop of the connection.
+            queue_size: The number of events buffered before dropping old ones.
+        """
+        self.topics = frozenset(topics)
+        self.loop = loop
+        self.queue = asyncio.Queue(queue_size)
+
+    def deliver(self, message):
+        """
+        Queue a message, dropping the oldest one if the client is not keeping up.
+        Must be called on the subscription's event loop.
+
+        Parameters:
+            message: The encoded event.
+        """
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(message)
+
+
+class EventBus:
+    """
+    Topic-based publish/subscribe bus that is safe to publish to from any thread.
+    """
+    def __init__(self):
+        """
+        Create a bus with no subscribers.
+        """
+        self._lock = threading.Lock()
+        self._topics = {}
+
+    def subscribe(self, topics):
+        """
+        Subscribe the running event loop to a set of topics.
+
+        Parameters:
+            topics: The topic names to receive events for.
+
+        Returns:
+            Subscription: The new subscription.
+        """
+        subscription = Subscription(topics, asyncio.get_running_loop())
+        with self._lock:
+            for topic in subscription.topics:
+                self._topics.setdefault(topic, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        """
+        Stop delivering events to a subscription.
+
+        Parameters:
+            subscription: The Subscription returned by subscribe.
+        """
+        with self._lock:
+            for topic in subscription.topics:
+                subscribers = self._topics.get(topic)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._topics[topic]
+
+    def has_subscribers(self):
+        """
+        Return whether any client is connected, so publishers can skip rendering events.
+        """
+        return bool(self._topics)
+
+    def publish(self, topics, event, data):
+        """
+        Send an event to every subscriber of any of the topics, once each.
+
+        Parameters:
+            topics: The topic names to publish to.
+            event: The event type, such as 'post' or 'comment'.
+            data: A JSON-serializable payload.
+        """
+        with self._lock:
+            subscribers = set()
+            for topic in topics:
+                subscribers.update(self._topics.get(topic, ()))
+        if not subscribers:
+            return
+
+        # Encode once for every client
+        message = f'event: {event}\ndata: {json.dumps(data)}\n\n'
+        for subscription in subscribers:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.deliver, message)
+            except RuntimeError:
+                # The connection's loop has closed; its stream unsubscribes itself
+                pass
+
+
+event_bus = EventBus()
+
+
+async def event_stream(subscription, heartbeat=HEARTBEAT_SECONDS):
+    """
+    Yield Server-Sent Events for a subscription until the client disconnects.
+
+    Parameters:
+        subscription: The Subscription to read from.
+        heartbeat: Seconds of silence before a keep-alive comment is sent.
+
+    Yields:
+        str: Encoded events and keep-alive comments.
+    """
+    try:
+        yield f'retry: {RETRY_MILLISECONDS}\n\n'
+        while True:
+            try:
+                yield await asyncio.wait_for(subscription.queue.get(), heartbeat)
+            except asyncio.TimeoutError:
+                # Keeps proxies from closing the connection and detects dead clients
+                yield ': ping\n\n'
+    finally:
+        event_bus.unsubscribe(subscription)
+
+
+def publish_post(post):
+    """
+    Publish a new post to its author's followers once the transaction commits.
+
+    Parameters:
+        post: The new Post.
+    """
+    def send():
+        if not event_bus.has_subscribers():
+            return
+        post_with_profile = Post.objects.select_related('profile').get(pk=post.pk)
+        html = render_to_string('mini_insta/feed_post.html', {'post': post_with_profile})
+        event_bus.publish([f'profile:{post.profile_id}'], 'post', {'post': post.pk, 'html': html})
+
+    transaction.on_commit(send)
+
+
+def publish_comment(comment):
+    """
+    Publish a new comment to the post's viewers once the transaction commits.
+
+    Parameters:
+        comment: The new Comment.
+    """
+    def send():
+        if not event_bus.has_subscribers():
+            return
+        post = Post.objects.only('pk', 'profile_id', 'comment_count').get(pk=comment.post_id)
+        html = render_to_string('mini_insta/comment_list.html', {
+            'post': post,
+            'comments': [comment],
+            'next_cursor': None,
+        })
+        event_bus.publish(
+            [f'post:{post.pk}', f'profile:{post.profile_id}'],
+            'comment',
+            {'post': post.pk, 'count': post.comment_count, 'html': html},
+        )
+
+    transaction.on_commit(send)
+
+
+def publish_like_counts(post_ids):
+    """
+    Publish the current like counts of posts once the transaction commits.
+
+    Parameters:
+        post_ids: The primary keys of the posts whose likes changed.
+    """
+    def send():
+        if not event_bus.has_subscribers():
+            return
+        counts = Post.objects.filter(pk__in=post_ids).annotate(like_count=Count('likes'))
+        for post_id, profile_id, like_count in counts.values_list('pk', 'profile_id', 'like_count'):
+            event_bus.publish(
+                [f'post:{post_id}', f'profile:{profile_id}'],
+                'likes',
+                {'post': post_id, 'count': like_count},
+            )
+
+    transaction.on_commit(send)
@@ -0,0 +1,281 @@
+"""
+File: graph.py
+Author: Anthony Xie
+Email: xiea@bu.edu
+Description: In-memory index of the follow graph used for profile suggestions.
+
+The index maps each profile id to a sorted array of the profile ids it
+follows. It is built once per process from the Follow table, kept current
+by the follow/unfollow signal handlers, and rebuilt periodically so that
+writes made by other worker processes are picked up. Only the first build
+runs in a request; later rebuilds run on a background thread while the old
+index keeps answering, and edges added or removed during a rebuild are
+replayed onto the new index before it is swapped in. Friend-of-friend
+suggestions are computed from it with a fixed budget of edges visited and
+cached per profile in a small LRU cache. A follow change drops the cached
+suggestions of every profile that reached them through the follower.
+
+Follows made through another worker process reach this index only when it
+is next rebuilt, so suggestions can lag other workers' writes by up to
+REBUILD_INTERVAL seconds.
+"""
+
+import heapq
+import logging
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+
+from django.db import connection
+
+from .models import Follow, Profile
+
+logger = logging.getLogger(__name__)
+
+# Number of suggestions shown to a profile
+SUGGESTION_COUNT = 5
+
+# Maximum number of second-hop edges visited when computing suggestions
+EDGE_BUDGET = 5000
+
+# Number of profiles whose suggestions are kept in the cache
+CACHE_SIZE = 1024
+
+# Seconds before cached suggestions are recomputed
+CACHE_TTL = 300
+
+# Seconds before the whole index is rebuilt from the database
+REBUILD_INTERVAL = 600
+
+
+def _set_edge(following, follower_id, profile_id, adding):
+    """
+    Add or remove one edge of an adjacency map, keeping neighbor arrays sorted.
+
+    Parameters:
+        following: Follower ids mapped to sorted arrays of followed ids.
+        follower_id: The primary key of the following profile.
+        profile_id: The primary key of the followed profile.
+        adding: True to add the edge, False to remove it.
+    """
+    neighbors = following.get(follower_id)
+    if neighbors is None:
+        if not adding:
+            return
+        neighbors = following[follower_id] = array('q')
+    index = bisect_left(neighbors, profile_id)
+    present = index < len(neighbors) and neighbors[index] == profile_id
+    if adding and not present:
+        neighbors.insert(index, profile_id)
+    elif not adding and present:
+        del neighbors[index]
+
+
+class FollowGraph:
+    """
+    Adjacency index of the follow graph with array-backed neighbor lists.
+    """
+    def __init__(self):
+        """
+        Create an empty, unbuilt index.
+        """
+        self._lock = threading.RLock()
+        self._following = {}
+        self._built_at = None
+        self._cache = OrderedDict()
+        # Edge changes made while a build is loading, or None when none is
+        self._deltas = None
+        self._rebuild_thread = None
+        # Held for a whole build, so only one runs at a time
+        self._build_lock = threading.Lock()
+
+    def _load(self):
+        """
+        Read every follow edge from the database.
+
+        Returns:
+            dict: Follower ids mapped to sorted arrays of followed ids.
+        """
+        following = {}
+        edges = Follow.objects.order_by('follower_profile_id', 'profile_id').values_list(
+            'follower_profile_id', 'profile_id'
+        )
+        for follower_id, profile_id in edges.iterator(chunk_size=5000):
+            neighbors = following.get(follower_id)
+            if neighbors is None:
+                neighbors = following[follower_id] = array('q')
+            neighbors.append(profile_id)
+        return following
+
+    def build(self):
+        """
+        Load every follow edge from the database into a new index and swap it in.
+        """
+        with self._build_lock:
+            self._build()
+
+    def _build(self):
+        """
+        Load a new index while logging concurrent edge changes, replay them
+        onto it and swap it in. The caller holds the build lock.
+        """
+        with self._lock:
+            self._deltas = []
+        try:
+            following = self._load()
+        except Exception:
+            with self._lock:
+                self._deltas = None
+            raise
+
+        with self._lock:
+            for adding, follower_id, profile_id in self._deltas:
+                _set_edge(following, follower_id, profile_id, adding)
+            self._deltas = None
+            self._following = following
+            self._built_at = time.monotonic()
+            self._cache.clear()
+
+    def _rebuild_in_thread(self):
+        """
+        Rebuild from the background thread and release its database connection.
+        """
+        try:
+            self.build()
+        except Exception:
+            logger.exception('Failed to rebuild the follow graph')
+        finally:
+            connection.close()
+            with self._lock:
+                self._rebuild_thread = None
+
+    def _ensure_built(self):
+        """
+        Build the index on first use, and start a background rebuild once it is stale.
+        """
+        if self._built_at is None:
+            with self._build_lock:
+                if self._built_at is None:
+                    self._build()
+            return
+        with self._lock:
+            stale = time.monotonic() - self._built_at > REBUILD_INTERVAL
+            if stale and self._rebuild_thread is None:
+                self._rebuild_thread = threading.Thread(
+                    target=self._rebuild_in_thread, name='mini-insta-follow-graph', daemon=True
+                )
+                self._rebuild_thread.start()
+
+    def _record(self, adding, follower_id, profile_id):
+        """
+        Apply an edge change to the index, and log it for a build in progress.
+
+        Parameters:
+            adding: True to add the edge, False to remove it.
+            follower_id: The primary key of the following profile.
+            profile_id: The primary key of the followed profile.
+        """
+        with self._lock:
+            if self._deltas is not None:
+                self._deltas.append((adding, follower_id, profile_id))
+            if self._built_at is not None:
+                _set_edge(self._following, follower_id, profile_id, adding)
+            # Suggestions of the follower and of every profile that follows it are affected
+            stale = [cached_id for cached_id, (cached_at, suggestions, direct) in self._cache.items()
+                     if cached_id == follower_id or follower_id in direct]
+            for cached_id in stale:
+                del self._cache[cached_id]
+
+    def add_edge(self, follower_id, profile_id):
+        """
+        Record that follower_id now follows profile_id.
+
+        Parameters:
+            follower_id: The primary key of the following profile.
+            profile_id: The primary key of the followed profile.
+        """
+        self._record(True, follower_id, profile_id)
+
+    def remove_edge(self, follower_id, profile_id):
+        """
+        Record that follower_id no longer follows profile_id.
+
+        Parameters:
+            follower_id: The primary key of the following profile.
+            profile_id: The primary key of the followed profile.
+        """
+        self._record(False, follower_id, profile_id)
+
+    def suggest_ids(self, profile_id, count=SUGGESTION_COUNT):
+        """
+        Return ids of profiles followed by the profiles profile_id follows.
+
+        Candidates are ranked by the number of mutual connections. At most
+        EDGE_BUDGET second-hop edges are visited, so the cost is bounded no
+        matter how large the neighborhood is.
+
+        Parameters:
+            profile_id: The primary key of the profile to suggest for.
+            count: The maximum number of suggestions.
+
+        Returns:
+            list: Suggested profile ids, best first.
+        """
+        self._ensure_built()
+        with self._lock:
+            entry = self._cache.get(profile_id)
+            if entry is not None and time.monotonic() - entry[0] < CACHE_TTL:
+                self._cache.move_to_end(profile_id)
+                return entry[1][:count]
+
+            direct = self._following.get(profile_id, array('q'))
+            mutuals = {}
+            budget = EDGE_BUDGET
+            for friend_id in direct:
+                for candidate_id in self._following.get(friend_id, ()):
+                    budget -= 1
+                    if candidate_id != profile_id:
+                        mutuals[candidate_id] = mutuals.get(candidate_id, 0) + 1
+                    if budget <= 0:
+                        break
+                if budget <= 0:
+                    break
+
+            # Skip profiles that are already followed
+            for friend_id in direct:
+                mutuals.pop(friend_id, None)
+
+            best = heapq.nlargest(max(count, SUGGESTION_COUNT), mutuals.items(),
+                                  key=lambda item: (item[1], -item[0]))
+            suggestions = [candidate_id for candidate_id, mutual_count in best]
+
+            # The followed ids are kept so a follow change by one of them can drop this entry
+            self._cache[profile_id] = (time.monotonic(), suggestions, frozenset(direct))
+            self._cache.move_to_end(profile_id)
+            while len(self._cache) > CACHE_SIZE:
+                self._cache.popitem(last=False)
+
+        return suggestions[:count]
+
+
+follow_graph = FollowGraph()
+
+
+def get_suggested_profiles(profile, count=SUGGESTION_COUNT):
+    """
+    Return suggested profiles for a profile to follow.
+
+    Parameters:
+        profile: The Profile to suggest for, or None.
+        count: The maximum number of suggestions.
+
+    Returns:
+        list: Profile objects, best suggestion first.
+    """
+    if profile is None:
+        return []
+    ids = follow_graph.suggest_ids(profile.pk, count)
+    profiles = Profile.objects.in_bulk(ids)
+    return [profiles[pk] for pk in ids if pk in profiles]
@@ -0,0 +1,468 @@
+"""
+File: imageproxy.py
+Author: Anthony Xie
+Email: xiea@bu.edu
+Description: Caching proxy for external profile and photo images.
+
+Profile pictures and photos added by URL live on other hosts, so without
+the proxy every page view waits on those hosts and downloads the
+full-size originals. proxy_url() turns an external URL into a URL on this
+site that names the image and a display width. The first request for it
+fetches the original once, shrinks it to that width, recompresses it and
+stores the result in a size-bounded cache directory. Later requests are
+served from disk with headers that let browsers keep the image for a year.
+
+Proxy URLs are signed, so the proxy only fetches URLs this site put on
+its own pages. It refuses hosts that resolve to private, loopback or
+otherwise non-public addresses, including through redirects, and connects
+to the address it checked rather than resolving the name again, unless
+IMAGE_PROXY_ALLOW_PRIVATE is set (as the tests do for their local stub
+server). When a fetch fails, the client is redirected to the original URL
+and the failure is remembered for a few minutes.
+"""
+
+import hashlib
+import http.client
+import io
+import ipaddress
+import os
+import socket
+import tempfile
+import threading
+import urllib.error
+import urllib.request
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+from django.urls import reverse
+from PIL import Image, ImageOps
+
+# Widths images are resized to; requests are rounded up to one of these so
+# each source image has at most a few cached variants
+IMAGE_WIDTHS = (160, 320, 640, 1080)
+
+# Seconds to wait for an external host
+FETCH_TIMEOUT = 5
+
+# Largest original the proxy downloads
+MAX_SOURCE_BYTES = 10 * 1024 * 1024
+
+# Quality of recompressed JPEG images
+JPEG_QUALITY = 82
+
+# Seconds a failed fetch is remembered before it is tried again
+FAILURE_SECONDS = 300
+
+# Seconds browsers and shared caches may keep a proxied image
+BROWSER_CACHE_SECONDS = 365 * 24 * 60 * 60
+
+SIGNING_SALT = 'mini_insta.imageproxy'
+
+
+class ImageFetchError(Exception):
+    """
+    Raised when an external image cannot be fetched or decoded.
+    """
+
+
+def is_enabled():
+    """
+    Return whether external images are served through the proxy.
+    """
+    return getattr(settings, 'IMAGE_PROXY_ENABLED', False)
+
+
+def proxy_url(url, width):
+    """
+    Return the proxied URL of an external image at a display width.
+
+    Parameters:
+        url: The external image URL.
+        width: The widest the image is displayed, in pixels.
+
+    Returns:
+        str: The proxy URL, or url unchanged if the proxy is off or url is not external.
+    """
+    if not url or not is_enabled() or urlsplit(url).scheme not in ('http', 'https'):
+        return url
+    width = next((size for size in IMAGE_WIDTHS if size >= width), IMAGE_WIDTHS[-1])
+    # Unlike signing.dumps, Signer adds no timestamp, so an image keeps one
+    # URL and browsers can cache it
+    token = signing.Signer(salt=SIGNING_SALT).sign_object([url, width], compress=True)
+    return reverse('image_proxy', kwargs={'token': token})
+
+
+def read_token(token):
+    """
+    Return the URL and width signed into a proxy URL.
+
+    Parameters:
+        token: The signed token from the proxy URL.
+
+    Returns:
+        tuple: The external URL and the width, or None if the token is invalid.
+    """
+    try:
+        url, width = signing.Signer(salt=SIGNING_SALT).unsign_object(token)
+    except (signing.BadSignature, TypeError, ValueError):
+        return None
+    if width not in IMAGE_WIDTHS:
+        return None
+    return url, width
+
+
+def _check_url(url):
+    """
+    Refuse URLs that are not http(s).
+
+    Parameters:
+        url: The URL about to be fetched.
+
+    Raises:
+        ImageFetchError: If the URL may not be fetched.
+    """
+    parts = urlsplit(url)
+    if parts.scheme not in ('http', 'https') or not parts.hostname:
+        raise ImageFetchError(f'Unsupported URL {url}')
+
+
+def _check_host(host, port):
+    """
+    Resolve a host and refuse it unless every address is public.
+
+    Parameters:
+        host: The host name.
+        port: The port about to be connected to.
+
+    Returns:
+        list: The checked (address, port) pairs to connect to.
+
+    Raises:
+        ImageFetchError: If the host cannot be resolved or is not public.
+    """
+    try:
+        addresses = socket.getaddrinfo(host, port, proto=socket.IPPROTO_TCP)
+    except (socket.gaierror, UnicodeError) as error:
+        raise ImageFetchError(f'Cannot resolve {host}') from error
+    for address in addresses:
+        if not ipaddress.ip_address(address[4][0].split('%')[0]).is_global:
+            raise ImageFetchError(f'{host} is not a public host')
+    return [address[4][:2] for address in addresses]
+
+
+def _connect_checked(address, timeout, source_address):
+    """
+    Open a socket to a host through the addresses _check_host approved.
+    Connecting to the checked address, rather than letting the socket look
+    the name up again, means a DNS answer that changes between the check
+    and the connection cannot point the proxy at a private host.
+
+    Parameters:
+        address: The (host, port) pair http.client asks for.
+        timeout: The socket timeout.
+        source_address: The local address to bind, if any.
+
+    Returns:
+        socket.socket: The connected socket.
+    """
+    if getattr(settings, 'IMAGE_PROXY_ALLOW_PRIVATE', False):
+        return socket.create_connection(address, timeout, source_address)
+    error = None
+    for checked in _check_host(*address):
+        try:
+            return socket.create_connection(checked, timeout, source_address)
+        except OSError as connect_error:
+            error = connect_error
+    raise error
+
+
+class _CheckedHTTPConnection(http.client.HTTPConnection):
+    """
+    HTTP connection that only connects to checked public addresses.
+    """
+    def __init__(self, *args, **kwargs):
+        """
+        Create the connection with the checked socket factory.
+        """
+        super().__init__(*args, **kwargs)
+        self._create_connection = _connect_checked
+
+
+class _CheckedHTTPSConnection(http.client.HTTPSConnection):
+    """
+    HTTPS connection that only connects to checked public addresses.
+    The certificate is still verified against the host name.
+    """
+    def __init__(self, *args, **kwargs):
+        """
+        Create the connection with the checked socket factory.
+        """
+        super().__init__(*args, **kwargs)
+        self._create_connection = _connect_checked
+
+
+class _CheckedHTTPHandler(urllib.request.HTTPHandler):
+    """
+    Handler that opens http URLs through _CheckedHTTPConnection.
+    """
+    def http_open(self, req):
+        """
+        Open the request on a checked connection.
+        """
+        return self.do_open(_CheckedHTTPConnection, req)
+
+
+class _CheckedHTTPSHandler(urllib.request.HTTPSHandler):
+    """
+    Handler that opens https URLs through _CheckedHTTPSConnection.
+    """
+    def https_open(self, req):
+        """
+        Open the request on a checked connection.
+        """
+        return self.do_open(_CheckedHTTPSConnection, req, context=self._context)
+
+
+class _CheckedRedirectHandler(urllib.request.HTTPRedirectHandler):
+    """
+    Redirect handler that refuses redirects to anything but http(s).
+    """
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        """
+        Check the redirect target before following it.
+        """
+        _check_url(newurl)
+        return super().redirect_request(req, fp, code, msg, headers, newurl)
+
+
+# Environment proxies are ignored: a connection through one would skip the host check
+_opener = urllib.request.build_opener(
+    urllib.request.ProxyHandler({}), _CheckedHTTPHandler, _CheckedHTTPSHandler, _CheckedRedirectHandler,
+)
+
+
+def fetch(url):
+    """
+    Download an external image.
+
+    Parameters:
+        url: The image URL.
+
+    Returns:
+        bytes: The image file.
+
+    Raises:
+        ImageFetchError: If the URL is refused, unreachable or too large.
+    """
+    _check_url(url)
+    request = urllib.request.Request(url, headers={'User-Agent': 'mini-insta-image-proxy'})
+    try:
+        with _opener.open(request, timeout=FETCH_TIMEOUT) as response:
+            data = response.read(MAX_SOURCE_BYTES + 1)
+    except (urllib.error.URLError, OSError, ValueError) as error:
+        raise ImageFetchError(f'Cannot fetch {url}: {error}') from error
+    if len(data) > MAX_SOURCE_BYTES:
+        raise ImageFetchError(f'{url} is larger than {MAX_SOURCE_BYTES} bytes')
+    return data
+
+
+def resize(data, width):
+    """
+    Shrink an image to a width and recompress it.
+    Images are never enlarged. Images with transparency are kept as PNG;
+    everything else becomes a progressive JPEG.
+
+    Parameters:
+        data: The original image file.
+        width: The target width in pixels.
+
+    Returns:
+        tuple: The encoded image and its file extension.
+
+    Raises:
+        ImageFetchError: If the data is not an image Pillow can read.
+    """
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            image = ImageOps.exif_transpose(image)
+            if image.width > width:
+                image = image.resize((width, max(1, round(image.height * width / image.width))),
+                                     Image.Resampling.LANCZOS)
+            output = io.BytesIO()
+            if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+                image.save(output, 'PNG', optimize=True)
+                return output.getvalue(), 'png'
+            image.convert('RGB').save(output, 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+            return output.getvalue(), 'jpg'
+    except (OSError, ValueError, Image.DecompressionBombError) as error:
+        raise ImageFetchError(f'Cannot decode image: {error}') from error
+
+
+class DiskLRUCache:
+    """
+    Directory of files bounded in total size, evicting the least recently used.
+
+    A file's modification time records its last use: hits touch it, and
+    eviction deletes the oldest files until the directory is back under a
+    fraction of its budget. Each process tracks the directory size from its
+    own writes and rescans it before evicting, so several processes can
+    share one directory.
+    """
+    # Fraction of the budget eviction frees down to, so it does not run on every write
+    LOW_WATER = 0.9
+
+    def __init__(self, directory, max_bytes):
+        """
+        Create a cache over a directory.
+
+        Parameters:
+            directory: The directory the files are stored in.
+            max_bytes: The most bytes the files may take up.
+        """
+        self.directory = str(directory)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._size = None
+
+    def _path(self, name):
+        """
+        Return the path of a file, spread over subdirectories by its first characters.
+        """
+        return os.path.join(self.directory, name[:2], name)
+
+    def get(self, name):
+        """
+        Return the path of a cached file and mark it as recently used.
+
+        Parameters:
+            name: The file name.
+
+        Returns:
+            str: The file path, or None if it is not cached.
+        """
+        path = self._path(name)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def put(self, name, data):
+        """
+        Store a file, evicting old files if the cache is over budget.
+
+        Parameters:
+            name: The file name.
+            data: The file contents.
+
+        Returns:
+            str: The file path.
+        """
+        path = self._path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temporary file and rename, so readers never see a partial file
+        descriptor, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        with os.fdopen(descriptor, 'wb') as file:
+            file.write(data)
+        os.replace(temp_path, path)
+
+        with self._lock:
+            if self._size is None:
+                self._size = self._scan()[1]
+            else:
+                self._size += len(data)
+            if self._size > self.max_bytes:
+                self._evict(keep=path)
+        return path
+
+    def _scan(self):
+        """
+        Return the cached files, oldest first, and their total size.
+        """
+        entries = []
+        for root, dirs, names in os.walk(self.directory):
+            for name in names:
+                try:
+                    stat = os.stat(os.path.join(root, name))
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, os.path.join(root, name)))
+        entries.sort()
+        return entries, sum(size for mtime, size, path in entries)
+
+    def _evict(self, keep=None):
+        """
+        Delete the least recently used files until the cache is under its low-water mark.
+
+        Parameters:
+            keep: A path that must not be evicted, such as the file just written.
+        """
+        entries, size = self._scan()
+        target = self.max_bytes * self.LOW_WATER
+        for mtime, file_size, path in entries:
+            if size <= target:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            size -= file_size
+        self._size = size
+
+
+_image_cache = None
+
+
+def image_cache():
+    """
+    Return the cache of resized images, created on first use and again if
+    its settings change.
+    """
+    global _image_cache
+    directory = str(getattr(settings, 'IMAGE_PROXY_DIR', os.path.join(settings.BASE_DIR, 'cache', 'images')))
+    max_bytes = getattr(settings, 'IMAGE_PROXY_MAX_BYTES', 256 * 1024 * 1024)
+    if _image_cache is None or (_image_cache.directory, _image_cache.max_bytes) != (directory, max_bytes):
+        _image_cache = DiskLRUCache(directory, max_bytes)
+    return _image_cache
+
+
+def _failure_key(url):
+    """
+    Return the cache key that records a failed fetch of a URL.
+    """
+    return f'mini_insta:imageproxy:failed:{hashlib.sha256(url.encode()).hexdigest()}'
+
+
+def get_image(url, width):
+    """
+    Return the path of a resized image, fetching and resizing it on a cache miss.
+
+    Parameters:
+        url: The external image URL.
+        width: One of IMAGE_WIDTHS.
+
+    Returns:
+        str: The path of the cached file.
+
+    Raises:
+        ImageFetchError: If the image cannot be fetched now or failed recently.
+    """
+    digest = hashlib.sha256(url.encode()).hexdigest()
+    images = image_cache()
+    for extension in ('jpg', 'png'):
+        path = images.get(f'{digest}-{width}.{extension}')
+        if path:
+            return path
+
+    if cache.get(_failure_key(url)):
+        raise ImageFetchError(f'{url} failed recently')
+    try:
+        data, extension = resize(fetch(url), width)
+    except ImageFetchError:
+        cache.set(_failure_key(url), True, FAILURE_SECONDS)
+        raise
+    return images.put(f'{digest}-{width}.{extension}', data)
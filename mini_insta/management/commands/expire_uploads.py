@@ -0,0 +1,27 @@
+"""
+File: expire_uploads.py
+Author: Anthony Xie
+Email: xiea@bu.edu
+Description: Django management command to remove abandoned chunked uploads.
+Deletes unfinished uploads with their partial files, and tombstones draft
+posts that were never published, once they are older than --hours. Purges
+of the drafts that this process does not finish are picked up by
+purge_deleted.
+"""
+
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from mini_insta.uploads import UPLOAD_EXPIRY, expire_uploads
+
+class Command(BaseCommand):
+    help = 'Remove unfinished chunked uploads and unpublished draft posts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=float, default=UPLOAD_EXPIRY.total_seconds() / 3600,
+                            help='Age after which uploads and drafts are removed')
+
+    def handle(self, *args, **options):
+        uploads, drafts = expire_uploads(timedelta(hours=options['hours']))
+        self.stdout.write(self.style.SUCCESS(f'Removed {uploads} uploads and {drafts} draft posts'))
@@ -0,0 +1,31 @@
+"""
+File: purge_deleted.py
+Author: Anthony Xie
+Email: xiea@bu.edu
+Description: Django management command to finish purging deleted posts and profiles.
+Runs every pending purge job, and any running job whose worker has stopped
+sending heartbeats, in this process instead of a background thread.
+"""
+
+from django.core.management.base import BaseCommand
+
+from mini_insta.models import PurgeJob
+from mini_insta.purge import run_pending_jobs, BATCH_SIZE, BATCH_PAUSE
+
+class Command(BaseCommand):
+    help = 'Run pending and interrupted purge jobs for deleted posts and profiles'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE,
+                            help='Rows deleted per transaction')
+        parser.add_argument('--pause', type=float, default=BATCH_PAUSE,
+                            help='Seconds to wait between batches')
+
+    def handle(self, *args, **options):
+        count = run_pending_jobs(
+            include_interrupted=True,
+            batch_size=options['batch_size'],
+            pause=options['pause'],
+        )
+        failed = PurgeJob.objects.filter(status='failed').count()
+        self.stdout.write(self.style.SUCCESS(f'Ran {count} purge jobs ({failed} failed in total)'))
@@ -0,0 +1,19 @@
+"""
+File: rebuild_explore_scores.py
+Author: Anthony Xie
+Email: xiea@bu.edu
+Description: Django management command to recompute the Explore scores.
+Backfills PostScore and ProfileScore from existing posts, likes, comments and follows.
+"""
+
+from django.core.management.base import BaseCommand
+from mini_insta.ranking import rebuild_scores
+
+class Command(BaseCommand):
+    help = 'Recompute Explore engagement scores for all posts and profiles'
+
+    def handle(self, *args, **options):
+        num_posts, num_profiles = rebuild_scores()
+        self.stdout.write(
+            self.style.SUCCESS(f'Rebuilt scores for {num_posts} posts and {num_profiles} profiles')
+        )
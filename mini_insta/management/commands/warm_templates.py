@@ -0,0 +1,33 @@
+"""
+File: warm_templates.py
+Author: Anthony Xie
+Email: xiea@bu.edu
+Description: Django management command to compile every project template.
+Run at deploy time to time template compilation and to fail the deploy on a
+template that does not compile, before any worker serves it. Workers compile
+templates into their own cache at startup when WARM_UP_WORKERS is on.
+"""
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.template.exceptions import TemplateDoesNotExist, TemplateSyntaxError
+
+from cs412.warmup import warm_url_resolvers, warm_templates
+
+class Command(BaseCommand):
+    help = 'Compile every template of every installed app and report errors'
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        try:
+            url_count = warm_url_resolvers()
+            template_count = warm_templates(strict=True)
+        except (TemplateDoesNotExist, TemplateSyntaxError) as error:
+            raise CommandError(f'Template failed to compile: {error}')
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Compiled {template_count} templates and {url_count} URL names '
+                f'in {time.perf_counter() - start:.2f}s'
+            )
+        )
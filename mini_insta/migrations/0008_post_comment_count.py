@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-19 00:15
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def backfill_comment_counts(apps, schema_editor):
+    """
+    Store the current number of comments on every post.
+    """
+    Post = apps.get_model('mini_insta', 'Post')
+    Comment = apps.get_model('mini_insta', 'Comment')
+    counts = (Comment.objects
+              .filter(post=models.OuterRef('pk'))
+              .order_by()
+              .values('post')
+              .annotate(total=models.Count('pk'))
+              .values('total'))
+    Post.objects.update(comment_count=Coalesce(models.Subquery(counts), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mini_insta', '0007_profile_post_modified'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_comment_counts, migrations.RunPython.noop),
+    ]
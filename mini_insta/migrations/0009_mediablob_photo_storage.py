@@ -0,0 +1,52 @@
+# Generated by Django 5.2.18 on 2026-10-19 00:40
+
+import os
+
+import mini_insta.storage
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_media_blobs(apps, schema_editor):
+    """
+    Count the photos that reference each existing uploaded file.
+    """
+    Photo = apps.get_model('mini_insta', 'Photo')
+    MediaBlob = apps.get_model('mini_insta', 'MediaBlob')
+    counts = (Photo.objects
+              .exclude(image_file='')
+              .exclude(image_file__isnull=True)
+              .order_by()
+              .values('image_file')
+              .annotate(total=models.Count('pk')))
+    blobs = []
+    for row in counts:
+        path = os.path.join(settings.MEDIA_ROOT, row['image_file'])
+        size = os.path.getsize(path) if os.path.exists(path) else 0
+        blobs.append(MediaBlob(name=row['image_file'], size=size, refcount=row['total']))
+    MediaBlob.objects.bulk_create(blobs)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mini_insta', '0008_post_comment_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MediaBlob',
+            fields=[
+                ('name', models.CharField(max_length=255, primary_key=True, serialize=False)),
+                ('size', models.BigIntegerField(default=0)),
+                ('refcount', models.PositiveIntegerField(default=0)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='photo',
+            name='image_file',
+            field=models.ImageField(blank=True, null=True, storage=mini_insta.storage.ContentAddressedStorage(), upload_to='photos/'),
+        ),
+        migrations.RunPython(backfill_media_blobs, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-19 01:50
+
+from django.conf import settings
+from django.db import migrations, models
+from django.utils.text import Truncator
+
+
+def backfill_bio_previews(apps, schema_editor):
+    """
+    Compute the directory bio preview of every existing profile.
+    """
+    Profile = apps.get_model('mini_insta', 'Profile')
+    profiles = list(Profile.objects.exclude(bio_text='').only('pk', 'bio_text'))
+    for profile in profiles:
+        profile.bio_preview = Truncator(profile.bio_text).words(15)
+    Profile.objects.bulk_update(profiles, ['bio_preview'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mini_insta', '0009_mediablob_photo_storage'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='bio_preview',
+            field=models.CharField(blank=True, editable=False, max_length=500),
+        ),
+        migrations.RunPython(backfill_bio_previews, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='profile',
+            index=models.Index(fields=['display_name', 'id'], name='profile_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='profile',
+            index=models.Index(fields=['-join_date', '-id'], name='profile_joined_idx'),
+        ),
+    ]
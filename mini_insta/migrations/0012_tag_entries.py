@@ -0,0 +1,59 @@
+# Generated by Django 5.2.18 on 2026-10-19 02:50
+
+import re
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+HASHTAG_RE = re.compile(r'(?<![\w#&])#(\w+)')
+MENTION_RE = re.compile(r'(?<![\w@])@(\w+)')
+
+
+def extract_tags(text):
+    """
+    Return the normalized hashtags and mentions in text, as mini_insta.tags does.
+    """
+    tags = {f'#{match.lower()}'[:100] for match in HASHTAG_RE.findall(text or '')}
+    tags.update(f'@{match.lower()}'[:100] for match in MENTION_RE.findall(text or ''))
+    return tags
+
+
+def backfill_tag_entries(apps, schema_editor):
+    """
+    Index the hashtags and mentions of every existing caption and comment.
+    """
+    Post = apps.get_model('mini_insta', 'Post')
+    Comment = apps.get_model('mini_insta', 'Comment')
+    TagEntry = apps.get_model('mini_insta', 'TagEntry')
+    entries = []
+    for post in Post.objects.exclude(caption='').only('pk', 'caption', 'timestamp').iterator():
+        for tag in extract_tags(post.caption):
+            entries.append(TagEntry(tag=tag, post_id=post.pk, timestamp=post.timestamp))
+    for comment in Comment.objects.only('pk', 'post_id', 'text', 'timestamp').iterator():
+        for tag in extract_tags(comment.text):
+            entries.append(TagEntry(tag=tag, post_id=comment.post_id, comment_id=comment.pk, timestamp=comment.timestamp))
+    TagEntry.objects.bulk_create(entries, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mini_insta', '0011_tombstones'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TagEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tag', models.CharField(max_length=100)),
+                ('timestamp', models.DateTimeField()),
+                ('comment', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='tag_entries', to='mini_insta.comment')),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tag_entries', to='mini_insta.post')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['tag', '-timestamp', '-id'], name='tag_entry_idx')],
+            },
+        ),
+        migrations.RunPython(backfill_tag_entries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 04:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mini_insta', '0013_chunked_uploads'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='purgejob',
+            name='worker',
+            field=models.CharField(blank=True, max_length=32),
+        ),
+        migrations.AddField(
+            model_name='purgejob',
+            name='heartbeat',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
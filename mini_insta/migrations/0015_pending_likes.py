@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-19 04:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mini_insta', '0014_purgejob_heartbeat'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PendingLike',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('liked', models.BooleanField()),
+                ('updated', models.DateTimeField(auto_now=True, db_index=True)),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pending_likes', to='mini_insta.post')),
+                ('profile', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pending_likes', to='mini_insta.profile')),
+            ],
+            options={
+                'unique_together': {('post', 'profile')},
+            },
+        ),
+    ]
@@ -6,8 +6,40 @@ Description: Data models for the Mini Insta application.
 Contains the Profile model that represents user profiles.
 """
 
-from django.db import models
+import uuid
+
+from django.core.exceptions import ValidationError
+from django.db import models, transaction
+from django.db.models import F
 from django.contrib.auth.models import User
+from django.utils import timezone
+from django.utils.text import Truncator
+
+from .imageproxy import proxy_url
+from .storage import photo_storage
+
+
+class LiveManager(models.Manager):
+    """
+    Manager that hides rows flagged as deleted while they wait to be purged.
+    """
+    def get_queryset(self):
+        """
+        Return the rows that are not flagged as deleted.
+        """
+        return super().get_queryset().filter(deleted=False)
+
+
+class PublishedManager(LiveManager):
+    """
+    Manager that also hides draft posts whose photos are still being uploaded.
+    """
+    def get_queryset(self):
+        """
+        Return the rows that are neither deleted nor drafts.
+        """
+        return super().get_queryset().filter(draft=False)
+
 
 class Profile(models.Model):
     """
@@ -18,7 +50,29 @@ class Profile(models.Model):
     display_name = models.CharField(max_length=100)
     profile_image_url = models.URLField(max_length=500)
     bio_text = models.TextField(max_length=500, blank=True)
+    # The bio shortened for the profile directory, computed on save
+    bio_preview = models.CharField(max_length=500, blank=True, editable=False)
     join_date = models.DateTimeField(auto_now_add=True)
+    # Bumped whenever anything shown on the profile page changes
+    modified = models.DateTimeField(auto_now=True)
+    # Set when the profile is deleted; its rows are purged in the background
+    deleted = models.BooleanField(default=False, db_index=True)
+
+    objects = LiveManager()
+    all_objects = models.Manager()
+
+    # Number of words of the bio shown in the profile directory
+    BIO_PREVIEW_WORDS = 15
+
+    # Width the profile picture is proxied at, enough for the largest avatar
+    IMAGE_WIDTH = 320
+
+    class Meta:
+        indexes = [
+            # The profile directory is sorted by name or by newest first
+            models.Index(fields=['display_name', 'id'], name='profile_name_idx'),
+            models.Index(fields=['-join_date', '-id'], name='profile_joined_idx'),
+        ]
 
     def __str__(self):
         """
@@ -26,6 +80,48 @@ class Profile(models.Model):
         """
         return f"{self.username} ({self.display_name})"
 
+    def save(self, *args, **kwargs):
+        """
+        Refresh the bio preview before saving the profile.
+        """
+        self.bio_preview = Truncator(self.bio_text).words(self.BIO_PREVIEW_WORDS)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'bio_text' in update_fields:
+            kwargs['update_fields'] = set(update_fields) | {'bio_preview'}
+        super().save(*args, **kwargs)
+
+    def validate_unique(self, exclude=None):
+        """
+        Also check the username against deleted profiles that are not purged yet.
+        Model validation looks rows up through the default manager, which hides
+        them, but the database's unique constraint still sees them.
+        """
+        super().validate_unique(exclude)
+        if exclude and 'username' in exclude:
+            return
+        taken = Profile.all_objects.filter(username=self.username, deleted=True).exclude(pk=self.pk)
+        if taken.exists():
+            raise ValidationError({'username': self.unique_error_message(Profile, ('username',))})
+
+    def get_image_url(self):
+        """
+        Return the URL of the profile picture, through the image proxy when it is enabled.
+        """
+        return proxy_url(self.profile_image_url, self.IMAGE_WIDTH)
+
+    def tombstone(self, delete_user=False):
+        """
+        Hide this profile and its posts now and purge their rows in the background.
+
+        Parameters:
+            delete_user: Whether to also delete the profile's user after the purge.
+
+        Returns:
+            PurgeJob: The scheduled job.
+        """
+        from .purge import tombstone_profile
+        return tombstone_profile(self, delete_user)
+
     def get_absolute_url(self):
         """
         Return the URL to access this profile.
@@ -41,12 +137,14 @@ class Profile(models.Model):
 
     def get_followers(self):
         """
-        Return a list of Profile objects who are following this profile.
+        Return a QuerySet of Profile objects who are following this profile.
+        Each profile is annotated with follow_id, the primary key of the Follow
+        row, and ordered by most recent follow first.
         """
-        # Get all Follow objects where this profile is being followed
-        follow_objects = Follow.objects.filter(profile=self)
-        # Return the follower profiles
-        return [follow.follower_profile for follow in follow_objects]
+        return (Profile.objects
+                .filter(following__profile=self)
+                .annotate(follow_id=models.F('following__pk'))
+                .order_by('-follow_id'))
 
     def get_num_followers(self):
         """
@@ -56,12 +154,14 @@ class Profile(models.Model):
 
     def get_following(self):
         """
-        Return a list of Profile objects that this profile is following.
+        Return a QuerySet of Profile objects that this profile is following.
+        Each profile is annotated with follow_id, the primary key of the Follow
+        row, and ordered by most recent follow first.
         """
-        # Get all Follow objects where this profile is the follower
-        follow_objects = Follow.objects.filter(follower_profile=self)
-        # Return the followed profiles
-        return [follow.profile for follow in follow_objects]
+        return (Profile.objects
+                .filter(followed_by__follower_profile=self)
+                .annotate(follow_id=models.F('followed_by__pk'))
+                .order_by('-follow_id'))
 
     def get_num_following(self):
         """
@@ -77,6 +177,17 @@ class Post(models.Model):
     profile = models.ForeignKey(Profile, on_delete=models.CASCADE, related_name='posts')
     caption = models.TextField(max_length=500, blank=True)
     timestamp = models.DateTimeField(auto_now_add=True)
+    # Bumped whenever anything shown on the post page changes
+    modified = models.DateTimeField(auto_now=True)
+    # Kept in sync by signal handlers so pages never count the comments
+    comment_count = models.PositiveIntegerField(default=0)
+    # Set when the post is deleted; its rows are purged in the background
+    deleted = models.BooleanField(default=False, db_index=True)
+    # Set while the post's photos are uploaded in chunks, until it is published
+    draft = models.BooleanField(default=False)
+
+    objects = PublishedManager()
+    all_objects = models.Manager()
 
     def __str__(self):
         """
@@ -84,6 +195,24 @@ class Post(models.Model):
         """
         return f"Post by {self.profile.username} at {self.timestamp}"
 
+    def publish(self):
+        """
+        Make a draft post visible, dated from now, with its current caption.
+        """
+        self.draft = False
+        self.timestamp = timezone.now()
+        self.save(update_fields=['caption', 'draft', 'timestamp', 'modified'])
+
+    def tombstone(self):
+        """
+        Hide this post now and purge its rows in the background.
+
+        Returns:
+            PurgeJob: The scheduled job.
+        """
+        from .purge import tombstone_post
+        return tombstone_post(self)
+
     def get_photos(self):
         """
         Return all photos associated with this post.
@@ -93,8 +222,9 @@ class Post(models.Model):
     def get_all_comments(self):
         """
         Return all comments for this post, ordered by most recent first.
+        The commenting profile is loaded in the same query.
         """
-        return self.comments.all().order_by('-timestamp')
+        return self.comments.select_related('profile').order_by('-timestamp')
 
     def get_likes(self):
         """
@@ -121,16 +251,28 @@ class Photo(models.Model):
     """
     post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='photos')
     image_url = models.URLField(max_length=500, blank=True)
-    image_file = models.ImageField(upload_to='photos/', blank=True, null=True)
+    image_file = models.ImageField(upload_to='photos/', storage=photo_storage, blank=True, null=True)
     timestamp = models.DateTimeField(auto_now_add=True)
 
+    # Width external photos are proxied at, the widest a photo is shown
+    IMAGE_WIDTH = 1080
+
+    def save(self, *args, **kwargs):
+        """
+        Save the photo in one transaction with the file reference its
+        storage takes, so the reference is dropped if the row is not written.
+        """
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
     def get_image_url(self):
         """
         Return the URL for the image, prioritizing uploaded file over URL.
+        External URLs go through the image proxy when it is enabled.
         """
         if self.image_file:
             return self.image_file.url
-        return self.image_url
+        return proxy_url(self.image_url, self.IMAGE_WIDTH)
 
     def __str__(self):
         """
@@ -139,6 +281,30 @@ class Photo(models.Model):
         return f"Photo for {self.post} at {self.timestamp}"
 
 
+class PhotoUpload(models.Model):
+    """
+    Model tracking a photo uploaded in chunks to a draft post.
+    Chunks are appended to a partial file by mini_insta.uploads, and the
+    received byte count is where an interrupted upload resumes.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='uploads')
+    filename = models.CharField(max_length=255)
+    size = models.BigIntegerField()
+    # Hex SHA-256 of the whole file, declared by the client and checked at the end
+    sha256 = models.CharField(max_length=64)
+    received = models.BigIntegerField(default=0)
+    # Set once the file is complete and attached to the post
+    photo = models.OneToOneField(Photo, on_delete=models.SET_NULL, null=True, blank=True, related_name='upload')
+    created = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        """
+        Return string representation of the PhotoUpload.
+        """
+        return f"Upload of {self.filename} ({self.received}/{self.size} bytes)"
+
+
 class Follow(models.Model):
     """
     Model representing a follow relationship between two profiles.
@@ -173,6 +339,25 @@ class Follow(models.Model):
             profile=target_profile
         ).exists()
 
+    @staticmethod
+    def followed_ids(follower_profile, target_profiles):
+        """
+        Return which of target_profiles follower_profile is following, in one query.
+
+        Parameters:
+            follower_profile: The Profile object that might be following.
+            target_profiles: An iterable of Profile objects to check.
+
+        Returns:
+            set: Primary keys of the target profiles that are followed.
+        """
+        if follower_profile is None:
+            return set()
+        return set(Follow.objects.filter(
+            follower_profile=follower_profile,
+            profile__in=[profile.pk for profile in target_profiles]
+        ).values_list('profile_id', flat=True))
+
 
 class Comment(models.Model):
     """
@@ -206,3 +391,200 @@ class Like(models.Model):
         Return string representation of the Like.
         """
         return f"{self.profile.username} likes {self.post}"
+
+
+class PendingLike(models.Model):
+    """
+    Model recording the latest like or unlike of a post that is not written yet.
+    Rows are maintained by mini_insta.coalesce, which turns each into at most
+    one Like write once the profile stops toggling.
+    """
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='pending_likes')
+    profile = models.ForeignKey(Profile, on_delete=models.CASCADE, related_name='pending_likes')
+    # Whether the profile should like the post
+    liked = models.BooleanField()
+    updated = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        unique_together = ('post', 'profile')
+
+    def __str__(self):
+        """
+        Return string representation of the PendingLike.
+        """
+        return f"{self.profile.username} {'likes' if self.liked else 'unlikes'} {self.post} (pending)"
+
+
+class TagEntry(models.Model):
+    """
+    Model recording one hashtag or @mention in a post caption or comment.
+    Rows are maintained by mini_insta.tags and ordered on (tag, timestamp, id)
+    so a tag page is an index range scan.
+    """
+    # Normalized tag with its prefix, e.g. '#sunset' or '@anthony'
+    tag = models.CharField(max_length=100)
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='tag_entries')
+    # Set when the tag appears in a comment rather than the caption
+    comment = models.ForeignKey(Comment, on_delete=models.CASCADE, null=True, blank=True, related_name='tag_entries')
+    # Time of the caption or comment, copied so the index can order by it
+    timestamp = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['tag', '-timestamp', '-id'], name='tag_entry_idx'),
+        ]
+
+    def __str__(self):
+        """
+        Return string representation of the TagEntry.
+        """
+        return f"{self.tag} in {self.post}"
+
+
+class PostScore(models.Model):
+    """
+    Model storing the time-decayed engagement score of a post for the Explore page.
+    Scores are kept in log space and updated incrementally by mini_insta.ranking.
+    """
+    post = models.OneToOneField(Post, on_delete=models.CASCADE, primary_key=True, related_name='explore_score')
+    score = models.FloatField(null=True, blank=True, db_index=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        """
+        Return string representation of the PostScore.
+        """
+        return f"Score {self.score} for post {self.post_id}"
+
+
+class ProfileScore(models.Model):
+    """
+    Model storing the time-decayed engagement score of a profile for the Explore page.
+    Scores are kept in log space and updated incrementally by mini_insta.ranking.
+    """
+    profile = models.OneToOneField(Profile, on_delete=models.CASCADE, primary_key=True, related_name='explore_score')
+    score = models.FloatField(null=True, blank=True, db_index=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        """
+        Return string representation of the ProfileScore.
+        """
+        return f"Score {self.score} for profile {self.profile_id}"
+
+
+class MediaBlob(models.Model):
+    """
+    Model counting the photos that share one stored media file.
+    Files are content-addressed by mini_insta.storage, so identical uploads
+    share a file, which is deleted when its last photo is deleted.
+    """
+    name = models.CharField(max_length=255, primary_key=True)
+    size = models.BigIntegerField(default=0)
+    refcount = models.PositiveIntegerField(default=0)
+    created = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        """
+        Return string representation of the MediaBlob.
+        """
+        return f"{self.name} ({self.refcount} references)"
+
+    @staticmethod
+    def acquire(name, size):
+        """
+        Add a reference to a stored file. Called by the storage as it stores
+        the file, inside the transaction that saves the photo.
+
+        Parameters:
+            name: The stored file name.
+            size: The file size in bytes.
+        """
+        blob, created = MediaBlob.objects.select_for_update().get_or_create(
+            name=name, defaults={'size': size, 'refcount': 1}
+        )
+        if not created:
+            MediaBlob.objects.filter(pk=name).update(refcount=F('refcount') + 1)
+
+    @staticmethod
+    def release(file):
+        """
+        Remove a reference to a stored file and delete the file after the
+        transaction commits if nothing references it anymore.
+
+        Parameters:
+            file: The FieldFile of the photo that referenced it.
+        """
+        name, storage = file.name, file.storage
+        MediaBlob.objects.filter(pk=name, refcount__gt=0).update(refcount=F('refcount') - 1)
+        deleted, _ = MediaBlob.objects.filter(pk=name, refcount=0).delete()
+        if deleted:
+            transaction.on_commit(lambda: MediaBlob.delete_unused_file(name, storage))
+
+    @staticmethod
+    def delete_unused_file(name, storage):
+        """
+        Delete a released file unless a photo has taken a new reference to it.
+
+        The check and the delete hold the database write lock, which storing
+        the same file takes before it checks for an existing copy, so the
+        two cannot interleave.
+
+        Parameters:
+            name: The stored file name.
+            storage: The storage holding the file.
+        """
+        with transaction.atomic():
+            # A write statement takes SQLite's write lock even when it matches no rows
+            MediaBlob.objects.filter(pk=name, refcount=0).delete()
+            if not MediaBlob.objects.select_for_update().filter(pk=name).exists():
+                storage.delete(name)
+
+
+class PurgeJob(models.Model):
+    """
+    Model tracking the background purge of a deleted post or profile.
+    Dependent rows are deleted in small batches by mini_insta.purge, and
+    the counters record how far the purge has progressed.
+    """
+    TARGET_CHOICES = [('post', 'Post'), ('profile', 'Profile')]
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    target_type = models.CharField(max_length=10, choices=TARGET_CHOICES)
+    target_id = models.BigIntegerField()
+    # User account to delete once the profile is purged, if any
+    user_id = models.IntegerField(null=True, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending', db_index=True)
+    total_rows = models.PositiveIntegerField(default=0)
+    deleted_rows = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    started = models.DateTimeField(null=True, blank=True)
+    finished = models.DateTimeField(null=True, blank=True)
+    # Token of the worker running the job and the last time it made progress
+    worker = models.CharField(max_length=32, blank=True)
+    heartbeat = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        """
+        Return string representation of the PurgeJob.
+        """
+        return f"Purge of {self.target_type} {self.target_id} ({self.status})"
+
+    def progress(self):
+        """
+        Return the percentage of rows deleted so far.
+
+        Returns:
+            int: A number from 0 to 100.
+        """
+        if self.status == 'done':
+            return 100
+        if not self.total_rows:
+            return 0
+        return min(100, 100 * self.deleted_rows // self.total_rows)
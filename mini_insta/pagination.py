@@ -0,0 +1,107 @@
+"""
+File: pagination.py
+Author: Anthony Xie
+Email: xiea@bu.edu
+Description: Keyset (cursor) pagination helpers for the Mini Insta application.
+
+Offset pagination makes the database walk past every skipped row, so deep
+pages get slower as lists grow. Keyset pagination instead remembers the key
+of the last row shown and asks for the rows after it, which is a single
+index range scan no matter how deep the page is.
+"""
+
+from datetime import datetime, timedelta, timezone
+
+# Default number of rows in one page
+PAGE_SIZE = 50
+
+
+def parse_cursor(value):
+    """
+    Parse a cursor value taken from a query string.
+
+    Parameters:
+        value: The raw cursor string, or None.
+
+    Returns:
+        int: The cursor, or None if it is missing or invalid.
+    """
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def keyset_page(queryset, key, cursor=None, page_size=PAGE_SIZE):
+    """
+    Return one page of a queryset ordered by a descending integer key.
+
+    Parameters:
+        queryset: The QuerySet to paginate; values() querysets are supported.
+        key: The name of the integer field or annotation to page on.
+        cursor: The key of the last row of the previous page, or None.
+        page_size: The maximum number of rows in the page.
+
+    Returns:
+        tuple: (rows, next_cursor) where next_cursor is None on the last page.
+    """
+    queryset = queryset.order_by(f'-{key}')
+    if cursor is not None:
+        queryset = queryset.filter(**{f'{key}__lt': cursor})
+
+    # Fetch one extra row to find out whether another page exists
+    rows = list(queryset[:page_size + 1])
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        last = rows[-1]
+        return rows, last[key] if isinstance(last, dict) else getattr(last, key)
+    return rows, None
+
+
+def parse_time_cursor(value):
+    """
+    Parse a cursor made by time_keyset_page.
+
+    Parameters:
+        value: The raw cursor string, or None.
+
+    Returns:
+        tuple: (timestamp, pk), or None if the cursor is missing or invalid.
+    """
+    try:
+        micros, pk = value.split('_')
+        timestamp = datetime.fromtimestamp(int(micros) / 1_000_000, tz=timezone.utc)
+        return timestamp, int(pk)
+    except (AttributeError, ValueError, OverflowError, OSError):
+        return None
+
+
+def time_keyset_page(queryset, cursor=None, page_size=PAGE_SIZE):
+    """
+    Return one page of a queryset ordered by descending timestamp, then pk.
+
+    Timestamps are not unique, so the cursor holds both the timestamp and
+    the pk of the last row shown.
+
+    Parameters:
+        queryset: The QuerySet to paginate; its model needs a timestamp field.
+        cursor: A (timestamp, pk) tuple from parse_time_cursor, or None.
+        page_size: The maximum number of rows in the page.
+
+    Returns:
+        tuple: (rows, next_cursor) where next_cursor is a string, or None on the last page.
+    """
+    queryset = queryset.order_by('-timestamp', '-pk')
+    if cursor is not None:
+        timestamp, pk = cursor
+        # The timestamp bound starts the index range scan; rows sharing the
+        # cursor's timestamp are then cut off by pk
+        queryset = queryset.filter(timestamp__lte=timestamp).exclude(timestamp=timestamp, pk__gte=pk)
+
+    rows = list(queryset[:page_size + 1])
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        last = rows[-1]
+        micros = (last.timestamp - datetime(1970, 1, 1, tzinfo=timezone.utc)) // timedelta(microseconds=1)
+        return rows, f'{micros}_{last.pk}'
+    return rows, None
@@ -0,0 +1,324 @@
+"""
+File: purge.py
+Author: Anthony Xie
+Email: xiea@bu.edu
+Description: Tombstoned deletes and background purges for posts and profiles.
+
+Deleting a popular post or an active profile through the ORM makes Django's
+cascade collector load every related photo, comment, like and follow and
+delete them while holding SQLite's write lock. Instead, a delete flags the
+post or profile as deleted, which hides it immediately through its
+LiveManager, and records a PurgeJob. A background thread then deletes the
+dependent rows in small transactions, pausing between batches so other
+writes get the lock, and counts its progress on the job. Media files are
+released through the usual Photo signals as their rows are deleted.
+
+A worker claims a job by writing its own token to it, and each batch
+refreshes the job's heartbeat only while the token is still its own. A job
+whose heartbeat is older than STALE_AFTER, because the process running it
+was recycled or killed, is taken over by the next worker that looks. Each
+web process looks every RECOVERY_INTERVAL seconds while it serves
+requests, and the purge_deleted management command looks once.
+"""
+
+import logging
+import threading
+import time
+import uuid
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .backends import forget_user
+from .directory import bump_directory_version
+from .models import (Profile, Post, Photo, PhotoUpload, Follow, Comment, Like, PostScore, ProfileScore, PurgeJob,
+                     TagEntry)
+
+logger = logging.getLogger(__name__)
+
+# Rows deleted per transaction
+BATCH_SIZE = 200
+
+# Seconds to wait between batches so other writers can take the lock
+BATCH_PAUSE = 0.05
+
+# Time without a heartbeat after which a running job is taken over
+STALE_AFTER = timedelta(minutes=2)
+
+# Seconds between a web process's checks for pending and stalled jobs
+RECOVERY_INTERVAL = 60
+
+
+class JobTakenOver(Exception):
+    """
+    Raised when another worker has claimed the job a worker was running.
+    """
+
+
+def _post_steps(post_id):
+    """
+    Return the querysets to empty, in order, to purge a post.
+
+    Parameters:
+        post_id: The primary key of the post.
+
+    Returns:
+        list: QuerySets whose rows are deleted batch by batch.
+    """
+    return [
+        TagEntry.objects.filter(post_id=post_id),
+        Like.objects.filter(post_id=post_id),
+        Comment.objects.filter(post_id=post_id),
+        PhotoUpload.objects.filter(post_id=post_id),
+        Photo.objects.filter(post_id=post_id),
+        Post.all_objects.filter(pk=post_id),
+    ]
+
+
+def _profile_steps(profile_id):
+    """
+    Return the querysets to empty, in order, to purge a profile and its posts.
+
+    Parameters:
+        profile_id: The primary key of the profile.
+
+    Returns:
+        list: QuerySets whose rows are deleted batch by batch.
+    """
+    return [
+        TagEntry.objects.filter(Q(post__profile_id=profile_id) | Q(comment__profile_id=profile_id)),
+        Like.objects.filter(Q(post__profile_id=profile_id) | Q(profile_id=profile_id)),
+        Comment.objects.filter(Q(post__profile_id=profile_id) | Q(profile_id=profile_id)),
+        PhotoUpload.objects.filter(post__profile_id=profile_id),
+        Photo.objects.filter(post__profile_id=profile_id),
+        Post.all_objects.filter(profile_id=profile_id),
+        Follow.objects.filter(Q(profile_id=profile_id) | Q(follower_profile_id=profile_id)),
+        Profile.all_objects.filter(pk=profile_id),
+    ]
+
+
+def _steps(job):
+    """
+    Return the purge steps of a job.
+
+    Parameters:
+        job: The PurgeJob.
+
+    Returns:
+        list: QuerySets whose rows are deleted batch by batch.
+    """
+    if job.target_type == 'post':
+        return _post_steps(job.target_id)
+    return _profile_steps(job.target_id)
+
+
+def _schedule(target_type, target_id, user_id=None):
+    """
+    Record a purge job with its estimated size and start the purge after commit.
+
+    Parameters:
+        target_type: 'post' or 'profile'.
+        target_id: The primary key of the target.
+        user_id: The user account to delete after the purge, if any.
+
+    Returns:
+        PurgeJob: The new job.
+    """
+    job = PurgeJob(target_type=target_type, target_id=target_id, user_id=user_id)
+    job.total_rows = sum(queryset.count() for queryset in _steps(job))
+    job.save()
+    transaction.on_commit(purge_worker.start)
+    return job
+
+
+def tombstone_post(post):
+    """
+    Hide a post immediately and schedule the purge of its rows.
+
+    Parameters:
+        post: The Post to delete.
+
+    Returns:
+        PurgeJob: The scheduled job.
+    """
+    with transaction.atomic():
+        Post.all_objects.filter(pk=post.pk).update(deleted=True)
+        PostScore.objects.filter(post_id=post.pk).delete()
+        Profile.all_objects.filter(pk=post.profile_id).update(modified=timezone.now())
+        return _schedule('post', post.pk)
+
+
+def tombstone_profile(profile, delete_user=False):
+    """
+    Hide a profile and its posts immediately and schedule the purge of their rows.
+
+    Parameters:
+        profile: The Profile to delete.
+        delete_user: Whether to deactivate the profile's user now and delete it after the purge.
+
+    Returns:
+        PurgeJob: The scheduled job.
+    """
+    with transaction.atomic():
+        Profile.all_objects.filter(pk=profile.pk).update(deleted=True)
+        Post.all_objects.filter(profile_id=profile.pk).update(deleted=True)
+        PostScore.objects.filter(post__profile_id=profile.pk).delete()
+        ProfileScore.objects.filter(profile_id=profile.pk).delete()
+        user_id = None
+        if delete_user and profile.user_id:
+            User.objects.filter(pk=profile.user_id).update(is_active=False)
+            # update() sends no signals, so drop the cached user here
+            transaction.on_commit(lambda: forget_user(profile.user_id))
+            user_id = profile.user_id
+        transaction.on_commit(bump_directory_version)
+        return _schedule('profile', profile.pk, user_id)
+
+
+def claim_job(job, token):
+    """
+    Claim a pending job, or a running job whose heartbeat is stale.
+
+    The update only matches while the job still has the status, worker and
+    heartbeat that were read, so of two workers reading the same job, only
+    one claims it.
+
+    Parameters:
+        job: The PurgeJob as it was read.
+        token: The claiming worker's token.
+
+    Returns:
+        bool: Whether the job was claimed.
+    """
+    now = timezone.now()
+    if job.status == 'running':
+        if job.heartbeat is not None and job.heartbeat > now - STALE_AFTER:
+            return False
+    elif job.status != 'pending':
+        return False
+    return bool(PurgeJob.objects.filter(
+        pk=job.pk, status=job.status, worker=job.worker, heartbeat=job.heartbeat,
+    ).update(status='running', worker=token, heartbeat=now, started=job.started or now))
+
+
+def run_job(job, batch_size=BATCH_SIZE, pause=BATCH_PAUSE):
+    """
+    Delete the rows of one purge job in batches, recording progress.
+
+    Parameters:
+        job: The PurgeJob to run.
+        batch_size: The number of rows deleted per transaction.
+        pause: Seconds to sleep between batches.
+    """
+    token = uuid.uuid4().hex
+    if not claim_job(job, token):
+        return
+    mine = PurgeJob.objects.filter(pk=job.pk, worker=token)
+    try:
+        for queryset in _steps(job):
+            model = queryset.model
+            while True:
+                with transaction.atomic():
+                    ids = list(queryset.values_list('pk', flat=True)[:batch_size])
+                    if not ids:
+                        break
+                    # Deleting by primary key keeps each collector run small,
+                    # and still sends the signals that maintain counts and files
+                    model._base_manager.filter(pk__in=ids).delete()
+                    # Counting progress is the heartbeat, and fails once another worker took the job
+                    if not mine.update(deleted_rows=F('deleted_rows') + len(ids), heartbeat=timezone.now()):
+                        raise JobTakenOver()
+                if pause:
+                    time.sleep(pause)
+
+        with transaction.atomic():
+            if job.user_id:
+                User.objects.filter(pk=job.user_id).delete()
+            if not mine.update(status='done', finished=timezone.now()):
+                raise JobTakenOver()
+    except JobTakenOver:
+        logger.warning('Purge job %s was taken over by another worker', job.pk)
+    except Exception as e:
+        logger.exception('Purge job %s failed', job.pk)
+        mine.update(status='failed', error=str(e), finished=timezone.now())
+
+
+def run_pending_jobs(include_interrupted=False, **kwargs):
+    """
+    Run every pending purge job, oldest first.
+
+    Parameters:
+        include_interrupted: Also take over running jobs whose heartbeat is
+            older than STALE_AFTER, left by a worker that stopped.
+        **kwargs: Options passed to run_job.
+
+    Returns:
+        int: The number of jobs run.
+    """
+    statuses = ['pending', 'running'] if include_interrupted else ['pending']
+    count = 0
+    for job in PurgeJob.objects.filter(status__in=statuses).order_by('pk'):
+        run_job(job, **kwargs)
+        count += 1
+    return count
+
+
+class PurgeWorker:
+    """
+    Background thread that runs pending purge jobs one at a time.
+    """
+    def __init__(self):
+        """
+        Create an idle worker.
+        """
+        self._lock = threading.Lock()
+        self._thread = None
+        self._wanted = False
+        self._checked = time.monotonic()
+
+    def start(self):
+        """
+        Make sure a thread is running pending jobs.
+        """
+        with self._lock:
+            self._wanted = True
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='mini-insta-purge', daemon=True)
+                self._thread.start()
+
+    def start_if_due(self):
+        """
+        Start the worker if RECOVERY_INTERVAL has passed since the last check,
+        so jobs nobody started and jobs cut off by a stopped process are
+        picked up without waiting for another delete.
+        """
+        now = time.monotonic()
+        with self._lock:
+            if now - self._checked < RECOVERY_INTERVAL:
+                return
+            self._checked = now
+        self.start()
+
+    def _run(self):
+        """
+        Run jobs until no more are pending, then exit.
+        """
+        try:
+            while True:
+                with self._lock:
+                    if not self._wanted:
+                        self._thread = None
+                        return
+                    self._wanted = False
+                run_pending_jobs(include_interrupted=True)
+        except Exception:
+            logger.exception('Purge worker stopped')
+            with self._lock:
+                self._thread = None
+        finally:
+            connection.close()
+
+
+purge_worker = PurgeWorker()
@@ -0,0 +1,248 @@
+"""
+File: ranking.py
+Author: Anthony Xie
+Email: xiea@bu.edu
+Description: Incrementally maintained engagement scores for the Explore page.
+
+Each like, comment and follow adds a weighted contribution to the score of
+the post and/or profile it touches. Contributions decay exponentially with
+a fixed half-life. Instead of rewriting every row as time passes, scores are
+stored as log(sum(weight * 2 ** (age_from_epoch / half_life))), which ranks
+rows exactly like the decayed sum does at any moment in time. A write then
+only needs to touch the one score row it affects, and serving the top N is
+an ordered read over the indexed score column.
+"""
+
+import math
+from datetime import datetime, timezone
+
+from django.db import transaction
+
+from .models import Post, Follow, Comment, Like, PostScore, ProfileScore
+
+# Reference point for the log-space scores; only differences matter.
+SCORE_EPOCH = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+# Half-lives (in hours) of an interaction's contribution to a score
+POST_HALF_LIFE_HOURS = 24
+PROFILE_HALF_LIFE_HOURS = 72
+
+# Relative weight of each kind of interaction
+POST_WEIGHT = 1.0
+LIKE_WEIGHT = 1.0
+COMMENT_WEIGHT = 2.0
+FOLLOW_WEIGHT = 3.0
+
+# Default number of entries shown on the Explore page
+EXPLORE_SIZE = 24
+
+
+def log_weight(weight, when, half_life_hours):
+    """
+    Return the log-space contribution of an interaction.
+
+    Parameters:
+        weight: The relative weight of the interaction.
+        when: The datetime at which the interaction happened.
+        half_life_hours: The half-life of the contribution in hours.
+
+    Returns:
+        float: log(weight) plus the decay exponent relative to SCORE_EPOCH.
+    """
+    hours = (when - SCORE_EPOCH).total_seconds() / 3600.0
+    return math.log(weight) + hours * math.log(2) / half_life_hours
+
+
+def add_log(score, value):
+    """
+    Add a log-space value to a log-space score.
+
+    Parameters:
+        score: The current score, or None for an empty score.
+        value: The log-space value to add.
+
+    Returns:
+        float: log(exp(score) + exp(value)), computed without overflow.
+    """
+    if score is None:
+        return value
+    high, low = max(score, value), min(score, value)
+    return high + math.log1p(math.exp(low - high))
+
+
+def subtract_log(score, value):
+    """
+    Remove a log-space value from a log-space score.
+
+    Parameters:
+        score: The current score, or None for an empty score.
+        value: The log-space value to remove.
+
+    Returns:
+        float: log(exp(score) - exp(value)), or None if nothing remains.
+    """
+    if score is None or value >= score - 1e-9:
+        return None
+    return score + math.log1p(-math.exp(value - score))
+
+
+def _apply(model, pk, value, removing=False):
+    """
+    Add or remove a contribution on a single score row.
+
+    Removals never create rows, so they are safe to run while the scored
+    object itself is being cascade-deleted.
+
+    Parameters:
+        model: PostScore or ProfileScore.
+        pk: The primary key of the scored post or profile.
+        value: The log-space contribution.
+        removing: True to subtract the contribution instead of adding it.
+    """
+    with transaction.atomic():
+        if removing:
+            row = model.objects.select_for_update().filter(pk=pk).first()
+            if row is None:
+                return
+            row.score = subtract_log(row.score, value)
+        else:
+            # A new row is inserted with its score, so it takes one write
+            row, created = model.objects.select_for_update().get_or_create(pk=pk, defaults={'score': value})
+            if created:
+                return
+            row.score = add_log(row.score, value)
+        row.save(update_fields=['score', 'updated'])
+
+
+def record_post(post):
+    """
+    Seed the score of a newly created post so it can surface on Explore.
+
+    Parameters:
+        post: The Post that was created.
+    """
+    _apply(PostScore, post.pk, log_weight(POST_WEIGHT, post.timestamp, POST_HALF_LIFE_HOURS))
+
+
+def record_like(like, removing=False):
+    """
+    Update the post and author scores for a like or unlike.
+
+    Parameters:
+        like: The Like that was created or deleted.
+        removing: True if the like was deleted.
+    """
+    _apply(PostScore, like.post_id,
+           log_weight(LIKE_WEIGHT, like.timestamp, POST_HALF_LIFE_HOURS), removing)
+    author_id = Post.objects.filter(pk=like.post_id).values_list('profile_id', flat=True).first()
+    if author_id is not None:
+        _apply(ProfileScore, author_id,
+               log_weight(LIKE_WEIGHT, like.timestamp, PROFILE_HALF_LIFE_HOURS), removing)
+
+
+def record_comment(comment, removing=False):
+    """
+    Update the post and author scores for a new or deleted comment.
+
+    Parameters:
+        comment: The Comment that was created or deleted.
+        removing: True if the comment was deleted.
+    """
+    _apply(PostScore, comment.post_id,
+           log_weight(COMMENT_WEIGHT, comment.timestamp, POST_HALF_LIFE_HOURS), removing)
+    author_id = Post.objects.filter(pk=comment.post_id).values_list('profile_id', flat=True).first()
+    if author_id is not None:
+        _apply(ProfileScore, author_id,
+               log_weight(COMMENT_WEIGHT, comment.timestamp, PROFILE_HALF_LIFE_HOURS), removing)
+
+
+def record_follow(follow, removing=False):
+    """
+    Update the followed profile's score for a follow or unfollow.
+
+    Parameters:
+        follow: The Follow that was created or deleted.
+        removing: True if the follow was deleted.
+    """
+    _apply(ProfileScore, follow.profile_id,
+           log_weight(FOLLOW_WEIGHT, follow.timestamp, PROFILE_HALF_LIFE_HOURS), removing)
+
+
+def top_posts(limit=EXPLORE_SIZE):
+    """
+    Return the highest scoring posts, read straight from the score index.
+
+    Parameters:
+        limit: The maximum number of posts to return.
+
+    Returns:
+        list: Post objects with their profile and photos preloaded.
+    """
+    scores = (PostScore.objects
+              .filter(score__isnull=False)
+              .select_related('post__profile')
+              .prefetch_related('post__photos')
+              .order_by('-score')[:limit])
+    return [row.post for row in scores]
+
+
+def top_profiles(limit=EXPLORE_SIZE):
+    """
+    Return the highest scoring profiles, read straight from the score index.
+
+    Parameters:
+        limit: The maximum number of profiles to return.
+
+    Returns:
+        list: Profile objects in descending score order.
+    """
+    scores = (ProfileScore.objects
+              .filter(score__isnull=False)
+              .select_related('profile')
+              .order_by('-score')[:limit])
+    return [row.profile for row in scores]
+
+
+def rebuild_scores():
+    """
+    Recompute every score from scratch.
+
+    This is only needed to backfill existing data or to recover from drift;
+    normal operation keeps the scores current one write at a time.
+
+    Returns:
+        tuple: The number of post and profile score rows written.
+    """
+    post_scores = {}
+    profile_scores = {}
+    authors = dict(Post.objects.values_list('pk', 'profile_id'))
+
+    for pk, timestamp in Post.objects.values_list('pk', 'timestamp').iterator():
+        post_scores[pk] = add_log(post_scores.get(pk),
+                                  log_weight(POST_WEIGHT, timestamp, POST_HALF_LIFE_HOURS))
+
+    for model, weight in ((Like, LIKE_WEIGHT), (Comment, COMMENT_WEIGHT)):
+        for post_id, timestamp in model.objects.values_list('post_id', 'timestamp').iterator():
+            post_scores[post_id] = add_log(post_scores.get(post_id),
+                                           log_weight(weight, timestamp, POST_HALF_LIFE_HOURS))
+            author_id = authors[post_id]
+            profile_scores[author_id] = add_log(profile_scores.get(author_id),
+                                                log_weight(weight, timestamp, PROFILE_HALF_LIFE_HOURS))
+
+    for profile_id, timestamp in Follow.objects.values_list('profile_id', 'timestamp').iterator():
+        profile_scores[profile_id] = add_log(profile_scores.get(profile_id),
+                                             log_weight(FOLLOW_WEIGHT, timestamp, PROFILE_HALF_LIFE_HOURS))
+
+    with transaction.atomic():
+        PostScore.objects.all().delete()
+        ProfileScore.objects.all().delete()
+        PostScore.objects.bulk_create(
+            [PostScore(post_id=pk, score=score) for pk, score in post_scores.items()],
+            batch_size=500,
+        )
+        ProfileScore.objects.bulk_create(
+            [ProfileScore(profile_id=pk, score=score) for pk, score in profile_scores.items()],
+            batch_size=500,
+        )
+
+    return len(post_scores), len(profile_scores)
@@ -0,0 +1,202 @@
+"""
+File: ratelimit.py
+Author: Anthony Xie
+Email: xiea@bu.edu
+Description: Rate limiting for Mini Insta write endpoints.
+
+Each (scope, user) pair may spend up to `capacity` tokens per window of
+capacity / refill_rate seconds. Spending is counted with a sliding window:
+the count of the current fixed window plus the share of the previous
+window's count that still overlaps the last `window` seconds. A request is
+rejected with 429 Too Many Requests when that total would exceed the
+capacity.
+
+Counts are kept with cache.add() and cache.incr() in the 'ratelimit' cache,
+so requests never overwrite each other's counts. In production that cache
+is a FileLockedCache shared by every worker process, whose incr() is atomic
+across processes; with the development LocMemCache each process counts on
+its own. If the cache fails, an in-process cache is used instead.
+"""
+
+import os
+import time
+from contextlib import contextmanager
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.http import HttpResponse
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+# Alias of the cache that holds the counts
+RATE_LIMIT_CACHE = 'ratelimit'
+
+# Counts used when the cache backend cannot be reached
+_local_cache = LocMemCache('mini_insta-ratelimit', {})
+
+
+class FileLockedCache(FileBasedCache):
+    """
+    File-based cache whose add() and incr() are atomic across processes.
+
+    FileBasedCache checks for a key before adding it and implements incr()
+    as a get() followed by a set(), so two workers can read the same count
+    and both write count + 1. Here both happen under an exclusive lock on a
+    file in the cache directory. Without fcntl (on Windows) the lock is skipped.
+    """
+    @contextmanager
+    def _locked(self):
+        """
+        Hold the cache directory's lock file for the duration of the block.
+        """
+        if fcntl is None:
+            yield
+            return
+        os.makedirs(self._dir, exist_ok=True)
+        with open(os.path.join(self._dir, 'counters.lock'), 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        """
+        Set a key only if it is not already set, under the lock.
+        """
+        with self._locked():
+            return super().add(key, value, timeout, version)
+
+    def incr(self, key, delta=1, version=None):
+        """
+        Add delta to a stored number under the lock. decr() goes through here too.
+        """
+        with self._locked():
+            return super().incr(key, delta, version)
+
+
+def _window_counts(store, current_key, previous_key, cost, timeout):
+    """
+    Add cost to the current window's count.
+
+    Parameters:
+        store: The cache holding the counts.
+        current_key: The key of the current window's count.
+        previous_key: The key of the previous window's count.
+        cost: The number of tokens to spend.
+        timeout: Seconds a window's count is kept.
+
+    Returns:
+        tuple: The current count including cost, and the previous window's count.
+    """
+    store.add(current_key, 0, timeout)
+    return store.incr(current_key, cost), store.get(previous_key, 0)
+
+
+def take_token(key, capacity, refill_rate, cost=1):
+    """
+    Try to spend tokens from the limit counted under key.
+
+    Parameters:
+        key: The counter key.
+        capacity: The most tokens that may be spent per window.
+        refill_rate: Tokens per second; the window is capacity / refill_rate seconds.
+        cost: The number of tokens this request needs.
+
+    Returns:
+        tuple: (allowed, retry_after) where retry_after is in seconds, or
+            None if the request costs more than the capacity and can never pass.
+    """
+    if cost > capacity:
+        return False, None
+
+    window = capacity / refill_rate
+    index, offset = divmod(time.time(), window)
+    current_key = f'{key}:{int(index)}'
+    previous_key = f'{key}:{int(index) - 1}'
+    # Share of the previous window still inside the last `window` seconds
+    overlap = 1 - offset / window
+    # Keep a count until it no longer overlaps the sliding window
+    timeout = int(2 * window) + 1
+
+    try:
+        store = caches[RATE_LIMIT_CACHE]
+        count, previous = _window_counts(store, current_key, previous_key, cost, timeout)
+    except Exception:
+        store = _local_cache
+        count, previous = _window_counts(store, current_key, previous_key, cost, timeout)
+
+    if previous * overlap + count <= capacity:
+        return True, 0
+
+    # Rejected requests do not count against the limit
+    try:
+        store.decr(current_key, cost)
+    except Exception:
+        pass
+    if previous and count <= capacity:
+        # Wait until enough of the previous window has slid out
+        retry_after = (overlap - (capacity - count) / previous) * window
+    else:
+        retry_after = overlap * window
+    return False, retry_after
+
+
+class RateLimitMixin:
+    """
+    Mixin that rate limits a view per logged-in user and scope.
+
+    The user id stands in for the profile id, since the two are one-to-one
+    and it is available without a database query. Views that share a scope
+    must use the same capacity and refill rate.
+    """
+    rate_limit_scope = None
+    rate_limit_capacity = 30
+    rate_limit_refill_rate = 0.5
+
+    def get_rate_limit_cost(self, request):
+        """
+        Return the number of tokens a request spends.
+
+        Parameters:
+            request: The HTTP request.
+
+        Returns:
+            int: The cost, 1 by default.
+        """
+        return 1
+
+    def dispatch(self, request, *args, **kwargs):
+        """
+        Reject the request with 429 if the user is over the limit.
+
+        Parameters:
+            request: The HTTP request.
+            *args: Additional positional arguments.
+            **kwargs: Additional keyword arguments.
+
+        Returns:
+            HttpResponse: The view response or a 429 response.
+        """
+        if request.user.is_authenticated:
+            scope = self.rate_limit_scope or self.__class__.__name__
+            allowed, retry_after = take_token(
+                f'ratelimit:{scope}:{request.user.pk}',
+                self.rate_limit_capacity,
+                self.rate_limit_refill_rate,
+                self.get_rate_limit_cost(request),
+            )
+            if not allowed:
+                if retry_after is None:
+                    return HttpResponse(
+                        f'At most {self.rate_limit_capacity} actions can be sent at once.', status=429
+                    )
+                response = HttpResponse('Too many requests. Please slow down.', status=429)
+                response['Retry-After'] = str(int(retry_after) + 1)
+                return response
+        return super().dispatch(request, *args, **kwargs)
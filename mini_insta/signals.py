@@ -0,0 +1,229 @@
+"""
+File: signals.py
+Author: Anthony Xie
+Email: xiea@bu.edu
+Description: Signal handlers for the Mini Insta application.
+Keeps the Explore engagement scores, the follow graph index, the stored
+comment counts, the modified timestamps used for conditional GET, the
+profile directory page cache, the reference counts of stored photo files,
+the hashtag and mention index, the cached logged-in users and the partial
+files of chunked uploads current as users, profiles, posts, photos,
+uploads, likes, comments and follows are written or removed, and lets the
+purge worker and the like flusher pick up work left by stopped processes
+as requests arrive.
+"""
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import F
+from django.core.signals import request_started
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import ranking
+from .coalesce import like_flusher
+from .directory import bump_directory_version
+from .graph import follow_graph
+from .backends import forget_user
+from .models import Profile, Post, Photo, PhotoUpload, Follow, Comment, Like, MediaBlob
+from .purge import purge_worker
+from .tags import index_post, index_comment
+from .uploads import part_path, remove_part_file
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, update_fields=None, **kwargs):
+    """
+    Seed the Explore score of a newly created or newly published post.
+    """
+    if instance.draft:
+        return
+    if created or (update_fields and 'draft' in update_fields):
+        ranking.record_post(instance)
+
+
+@receiver(post_save, sender=Like)
+def like_saved(sender, instance, created, **kwargs):
+    """
+    Add a new like to the Explore scores.
+    """
+    if created:
+        ranking.record_like(instance)
+
+
+@receiver(post_delete, sender=Like)
+def like_deleted(sender, instance, **kwargs):
+    """
+    Remove a deleted like from the Explore scores.
+    """
+    ranking.record_like(instance, removing=True)
+
+
+@receiver(post_save, sender=Comment)
+def comment_saved(sender, instance, created, **kwargs):
+    """
+    Add a new comment to the Explore scores.
+    """
+    if created:
+        ranking.record_comment(instance)
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    """
+    Remove a deleted comment from the Explore scores.
+    """
+    ranking.record_comment(instance, removing=True)
+
+
+@receiver(post_save, sender=Follow)
+def follow_saved(sender, instance, created, **kwargs):
+    """
+    Add a new follow to the Explore scores and the follow graph index.
+    """
+    if created:
+        ranking.record_follow(instance)
+        transaction.on_commit(
+            lambda: follow_graph.add_edge(instance.follower_profile_id, instance.profile_id)
+        )
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    """
+    Remove a deleted follow from the Explore scores and the follow graph index.
+    """
+    ranking.record_follow(instance, removing=True)
+    transaction.on_commit(
+        lambda: follow_graph.remove_edge(instance.follower_profile_id, instance.profile_id)
+    )
+
+
+def touch_post(post_id):
+    """
+    Mark a post and its author's profile as modified.
+
+    Parameters:
+        post_id: The primary key of the post.
+    """
+    now = timezone.now()
+    Post.objects.filter(pk=post_id).update(modified=now)
+    Profile.objects.filter(posts__pk=post_id).update(modified=now)
+
+
+@receiver([post_save, post_delete], sender=Like)
+@receiver([post_save, post_delete], sender=Comment)
+@receiver([post_save, post_delete], sender=Photo)
+def post_content_changed(sender, instance, **kwargs):
+    """
+    Mark the post and its author as modified when a like, comment or photo changes.
+    """
+    touch_post(instance.post_id)
+
+
+@receiver([post_save, post_delete], sender=Post)
+def profile_posts_changed(sender, instance, **kwargs):
+    """
+    Mark the author's profile as modified when one of its posts changes.
+    """
+    Profile.objects.filter(pk=instance.profile_id).update(modified=timezone.now())
+
+
+@receiver([post_save, post_delete], sender=Follow)
+def profile_follows_changed(sender, instance, **kwargs):
+    """
+    Mark both profiles of a follow relationship as modified.
+    """
+    Profile.objects.filter(
+        pk__in=[instance.profile_id, instance.follower_profile_id]
+    ).update(modified=timezone.now())
+
+
+@receiver(post_save, sender=Comment)
+def comment_count_increased(sender, instance, created, **kwargs):
+    """
+    Increment the stored comment count of the post.
+    """
+    if created:
+        Post.objects.filter(pk=instance.post_id).update(comment_count=F('comment_count') + 1)
+
+
+@receiver(post_delete, sender=Comment)
+def comment_count_decreased(sender, instance, **kwargs):
+    """
+    Decrement the stored comment count of the post.
+    """
+    Post.objects.filter(pk=instance.post_id, comment_count__gt=0).update(
+        comment_count=F('comment_count') - 1
+    )
+
+
+@receiver(post_delete, sender=Photo)
+def photo_file_released(sender, instance, **kwargs):
+    """
+    Drop a deleted photo's reference to its stored file, deleting the file
+    when no photo uses it anymore. Runs for each photo of a deleted post.
+    """
+    if instance.image_file:
+        MediaBlob.release(instance.image_file)
+
+
+@receiver([post_save, post_delete], sender=Profile)
+def profile_directory_changed(sender, instance, **kwargs):
+    """
+    Invalidate the cached profile directory pages when a profile changes.
+    """
+    transaction.on_commit(bump_directory_version)
+
+
+@receiver(post_save, sender=Post)
+def post_tags_changed(sender, instance, **kwargs):
+    """
+    Index the hashtags and mentions of a saved caption, once it is published.
+    """
+    if not instance.draft:
+        index_post(instance)
+
+
+@receiver(post_save, sender=Comment)
+def comment_tags_changed(sender, instance, **kwargs):
+    """
+    Index the hashtags and mentions of a saved comment.
+    """
+    index_comment(instance)
+
+
+@receiver([post_save, post_delete], sender=User)
+def user_changed(sender, instance, **kwargs):
+    """
+    Drop the cached copy of a saved or deleted user.
+    """
+    forget_user(instance.pk)
+
+
+@receiver(post_delete, sender=PhotoUpload)
+def upload_deleted(sender, instance, **kwargs):
+    """
+    Delete the partial file of a removed upload after the transaction commits.
+    """
+    # The path is taken now, since deleting the row clears instance.pk
+    path = part_path(instance)
+    transaction.on_commit(lambda: remove_part_file(path))
+
+
+@receiver(request_started)
+def recover_purge_jobs(sender, **kwargs):
+    """
+    Every so often, start the purge worker to finish jobs that were never
+    started or whose worker stopped.
+    """
+    purge_worker.start_if_due()
+
+
+@receiver(request_started)
+def recover_pending_likes(sender, **kwargs):
+    """
+    Every so often, flush likes left pending by a process that stopped.
+    """
+    like_flusher.start_if_due()
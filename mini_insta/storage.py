@@ -0,0 +1,141 @@
+"""
+File: storage.py
+Author: Anthony Xie
+Email: xiea@bu.edu
+Description: Content-addressed media storage for Mini Insta photo uploads.
+
+Uploaded files are named after the SHA-256 of their bytes, so the same
+image uploaded twice is stored once and both Photo rows point at it.
+MediaBlob rows count the references, and the last Photo to let go of a
+file deletes it. Storing a file takes its reference before checking
+whether a copy already exists, in the same transaction, so the copy cannot
+be deleted by a photo releasing it at the same moment.
+
+Uploads larger than FILE_UPLOAD_MAX_MEMORY_SIZE are streamed to a
+temporary file on disk in chunks and hashed on the way in, so they are
+never held in memory and never read a second time to be hashed. Smaller
+uploads stay in memory and are hashed as they are written to storage.
+"""
+
+import hashlib
+import os
+import tempfile
+
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from django.utils.deconstruct import deconstructible
+
+
+class HashingUploadHandler(TemporaryFileUploadHandler):
+    """
+    Upload handler that streams each file to disk and hashes it as it arrives.
+
+    The finished file carries its hex digest in a sha256 attribute, which
+    ContentAddressedStorage uses instead of reading the file again.
+    """
+    def new_file(self, *args, **kwargs):
+        """
+        Start a temporary file and a new hash for the next uploaded file.
+        """
+        super().new_file(*args, **kwargs)
+        self.hasher = hashlib.sha256()
+
+    def receive_data_chunk(self, raw_data, start):
+        """
+        Hash a chunk and write it to the temporary file.
+
+        Parameters:
+            raw_data: The bytes of the chunk.
+            start: The offset of the chunk in the file.
+        """
+        self.hasher.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        """
+        Finish the temporary file and attach its digest.
+
+        Parameters:
+            file_size: The total number of bytes received.
+
+        Returns:
+            TemporaryUploadedFile: The uploaded file.
+        """
+        uploaded_file = super().file_complete(file_size)
+        uploaded_file.sha256 = self.hasher.hexdigest()
+        return uploaded_file
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    File system storage that stores each distinct file once, under its hash.
+
+    A file saved as photos/beach.jpg is stored as photos/ab/cd/abcd....jpg,
+    keeping the directory from the upload_to path and the extension.
+    """
+    def get_available_name(self, name, max_length=None):
+        """
+        Return the name unchanged, since an existing file with the same name
+        has the same contents and is meant to be shared.
+        """
+        return name
+
+    def _save(self, name, content):
+        """
+        Store content under its digest unless a copy is already stored, and
+        take a MediaBlob reference to it.
+
+        Parameters:
+            name: The name requested by the field's upload_to.
+            content: The File being saved.
+
+        Returns:
+            str: The content-addressed name that was stored.
+        """
+        directory = os.path.dirname(name)
+        extension = os.path.splitext(name)[1].lower()
+        os.makedirs(self.path(directory), exist_ok=True)
+
+        digest = getattr(content, 'sha256', None)
+        temp_path = None
+        if digest is None or not hasattr(content, 'temporary_file_path'):
+            # Copy the file next to its destination in chunks, hashing as we go
+            hasher = hashlib.sha256()
+            with tempfile.NamedTemporaryFile(dir=self.path(directory), delete=False) as temp_file:
+                temp_path = temp_file.name
+                for chunk in content.chunks():
+                    hasher.update(chunk)
+                    temp_file.write(chunk)
+            digest = hasher.hexdigest()
+
+        stored_name = os.path.join(directory, digest[:2], digest[2:4], digest + extension).replace(os.sep, '/')
+        full_path = self.path(stored_name)
+
+        # Imported here because the models module imports this one
+        from .models import MediaBlob
+
+        with transaction.atomic():
+            # Taking the reference holds the database write lock, which the
+            # deletion of a released file also takes, so a copy found here
+            # stays until the photo using it is deleted. A copy whose
+            # deletion already ran is missing and is written again.
+            MediaBlob.acquire(stored_name, content.size)
+            if os.path.exists(full_path):
+                if temp_path:
+                    os.remove(temp_path)
+                return stored_name
+
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            if temp_path:
+                os.replace(temp_path, full_path)
+            else:
+                file_move_safe(content.temporary_file_path(), full_path, allow_overwrite=True)
+            if self.file_permissions_mode is not None:
+                os.chmod(full_path, self.file_permissions_mode)
+        return stored_name
+
+
+photo_storage = ContentAddressedStorage()
@@ -0,0 +1,132 @@
+"""
+File: tags.py
+Author: Anthony Xie
+Email: xiea@bu.edu
+Description: Hashtag and @mention extraction and indexing for Mini Insta.
+
+Captions and comments are scanned for #hashtags and @mentions when they are
+saved, and each tag is recorded as a TagEntry row. Entries are indexed on
+(tag, timestamp, id), so a tag page is a range scan of that index starting
+at the cursor, never a LIKE search through every caption.
+"""
+
+import re
+
+from django.utils.html import escape
+from django.urls import reverse
+
+from .models import TagEntry
+
+# Longest tag that is indexed, matching TagEntry.tag
+MAX_TAG_LENGTH = 100
+
+HASHTAG_RE = re.compile(r'(?<![\w#&])#(\w+)')
+MENTION_RE = re.compile(r'(?<![\w@])@(\w+)')
+
+
+def normalize_tag(kind, text):
+    """
+    Return the indexed form of a hashtag or mention.
+
+    Parameters:
+        kind: '#' for a hashtag or '@' for a mention.
+        text: The tag text without its prefix.
+
+    Returns:
+        str: The lowercased tag with its prefix, e.g. '#sunset'.
+    """
+    return f'{kind}{text.lower()}'[:MAX_TAG_LENGTH]
+
+
+def extract_tags(text):
+    """
+    Return the distinct hashtags and mentions in a piece of text.
+
+    Parameters:
+        text: A caption or comment.
+
+    Returns:
+        set: Normalized tags such as '#sunset' and '@anthony'.
+    """
+    if not text:
+        return set()
+    tags = {normalize_tag('#', match) for match in HASHTAG_RE.findall(text)}
+    tags.update(normalize_tag('@', match) for match in MENTION_RE.findall(text))
+    return tags
+
+
+def _sync_entries(existing, wanted, make_entry):
+    """
+    Add and remove entries so the indexed tags match the wanted tags.
+
+    Parameters:
+        existing: QuerySet of the entries currently indexed for the text.
+        wanted: The set of tags now in the text.
+        make_entry: Callable building an unsaved TagEntry for a tag.
+    """
+    current = set(existing.values_list('tag', flat=True))
+    removed = current - wanted
+    if removed:
+        existing.filter(tag__in=removed).delete()
+    added = wanted - current
+    if added:
+        TagEntry.objects.bulk_create([make_entry(tag) for tag in sorted(added)])
+
+
+def index_post(post):
+    """
+    Index the hashtags and mentions in a post's caption.
+
+    Parameters:
+        post: The saved Post.
+    """
+    _sync_entries(
+        TagEntry.objects.filter(post=post, comment__isnull=True),
+        extract_tags(post.caption),
+        lambda tag: TagEntry(tag=tag, post=post, timestamp=post.timestamp),
+    )
+
+
+def index_comment(comment):
+    """
+    Index the hashtags and mentions in a comment.
+
+    Parameters:
+        comment: The saved Comment.
+    """
+    _sync_entries(
+        TagEntry.objects.filter(comment=comment),
+        extract_tags(comment.text),
+        lambda tag: TagEntry(tag=tag, post_id=comment.post_id, comment=comment, timestamp=comment.timestamp),
+    )
+
+
+def _tag_link(kind, match):
+    """
+    Return the HTML link for one hashtag or mention match.
+
+    Parameters:
+        kind: '#' for a hashtag or '@' for a mention.
+        match: The regular expression match of the tag.
+
+    Returns:
+        str: An anchor element linking to the tag page.
+    """
+    name = 'hashtag' if kind == '#' else 'mention'
+    url = reverse(name, args=[match.group(1).lower()])
+    return f'<a href="{url}" style="color: #3897f0; text-decoration: none;">{kind}{match.group(1)}</a>'
+
+
+def link_tags(text):
+    """
+    Escape text and link its hashtags and mentions to their tag pages.
+
+    Parameters:
+        text: A caption or comment.
+
+    Returns:
+        str: HTML that is safe to mark as safe.
+    """
+    html = escape(text)
+    html = HASHTAG_RE.sub(lambda match: _tag_link('#', match), html)
+    return MENTION_RE.sub(lambda match: _tag_link('@', match), html)
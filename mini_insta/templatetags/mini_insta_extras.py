@@ -6,7 +6,9 @@ Description: Custom template tags and filters for Mini Insta.
 """
 
 from django import template
+from django.utils.safestring import mark_safe
 from mini_insta.models import Follow
+from mini_insta.tags import link_tags
 
 register = template.Library()
 
@@ -42,3 +44,17 @@ def call_method(obj, arg):
     if callable(obj):
         return obj(arg)
     return None
+
+
+@register.filter(name='link_tags')
+def link_tags_filter(text):
+    """
+    Template filter to escape a caption or comment and link its hashtags and mentions.
+
+    Parameters:
+        text: The caption or comment text.
+
+    Returns:
+        str: Safe HTML with each tag linked to its tag page.
+    """
+    return mark_safe(link_tags(text))
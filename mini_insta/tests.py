@@ -1,3 +1,1295 @@
-from django.test import TestCase
+"""
+File: tests.py
+Author: Anthony Xie
+Email: xiea@bu.edu
+Description: Tests for the Mini Insta application.
+"""
 
-# Create your tests here.
+import hashlib
+import io
+import json
+import os
+import shutil
+import socket
+import tempfile
+import threading
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import cache, caches
+from django.core.files.base import ContentFile
+from django.db import connection
+from django.db.models.signals import post_delete, post_save
+from django.test import LiveServerTestCase, RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from cs412 import profiling, replay
+
+from . import batch
+from .coalesce import flush_likes, like_flusher
+from .forms import CreateProfileForm
+from .graph import REBUILD_INTERVAL, FollowGraph, follow_graph
+from .imageproxy import ImageFetchError, fetch, proxy_url
+from .models import (Profile, Post, Photo, PhotoUpload, Follow, Comment, Like, MediaBlob, PurgeJob, PostScore,
+                     PendingLike, ProfileScore, TagEntry)
+from .purge import STALE_AFTER, claim_job, purge_worker, run_job, run_pending_jobs, tombstone_post, tombstone_profile
+from .ranking import top_posts
+from .tags import extract_tags, index_comment, index_post, link_tags
+from .uploads import expire_uploads, part_path
+from .views import COMMENTS_PAGE_SIZE
+
+
+class AdminQueryCountTests(TestCase):
+    """
+    Check that the admin pages of the large tables run the same number of
+    queries however many rows there are, and never count a whole table.
+    """
+    CHANGELISTS = ['profile', 'post', 'photo', 'follow', 'comment', 'like', 'tagentry']
+    CHANGE_FORMS = ['post', 'photo', 'follow', 'comment', 'like']
+
+    def setUp(self):
+        """
+        Log in as a superuser and create a first batch of rows.
+        """
+        admin_user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(admin_user)
+        # Load the session and user into their cache before counting
+        self.client.get(reverse('admin:index'))
+        self.created = 0
+        self.add_rows(3)
+
+    def add_rows(self, count):
+        """
+        Add profiles that each post, comment, like and follow.
+
+        Parameters:
+            count: The number of profiles to add.
+        """
+        previous = None
+        for _ in range(count):
+            self.created += 1
+            profile = Profile.objects.create(username=f'user{self.created}', display_name=f'User {self.created}')
+            post = Post.objects.create(profile=profile, caption=f'Post #tag{self.created}')
+            index_post(post)
+            Photo.objects.create(post=post, image_url='https://example.com/photo.jpg')
+            comment = Comment.objects.create(post=post, profile=profile, text=f'Hi @user{self.created}')
+            index_comment(comment)
+            Like.objects.create(post=post, profile=profile)
+            if previous is not None:
+                Follow.objects.create(profile=previous, follower_profile=profile)
+            previous = profile
+
+    def capture(self, url):
+        """
+        Request an admin page twice and return the SQL the second request ran.
+
+        Parameters:
+            url: The page URL.
+
+        Returns:
+            list: The SQL of each query.
+        """
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return [query['sql'] for query in queries.captured_queries]
+
+    def test_changelist_queries_do_not_grow(self):
+        """
+        Each changelist runs a fixed number of queries and no COUNT.
+        """
+        urls = [reverse(f'admin:mini_insta_{name}_changelist') for name in self.CHANGELISTS]
+        before = {url: self.capture(url) for url in urls}
+        self.add_rows(10)
+        for url in urls:
+            after = self.capture(url)
+            self.assertEqual(len(after), len(before[url]), url)
+            self.assertFalse([sql for sql in after if 'COUNT(' in sql], url)
+
+    def test_change_form_queries_do_not_grow(self):
+        """
+        Change forms show raw id inputs instead of loading every related row.
+        """
+        urls = [reverse(f'admin:mini_insta_{name}_add') for name in self.CHANGE_FORMS]
+        before = {url: len(self.capture(url)) for url in urls}
+        self.add_rows(10)
+        for url in urls:
+            self.assertEqual(len(self.capture(url)), before[url], url)
+
+    def test_filtered_changelist_is_counted(self):
+        """
+        A searched changelist reports its exact number of results.
+        """
+        response = self.client.get(reverse('admin:mini_insta_like_changelist'), {'q': 'user2'})
+        self.assertEqual(response.context['cl'].result_count, 1)
+
+
+class AdminDeleteTests(TestCase):
+    """
+    Check that deleting from the admin tombstones objects instead of cascading.
+    """
+    def test_delete_tombstones_post_and_profile(self):
+        """
+        Deleting a post or a profile hides it and schedules its purge.
+        """
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+        profile = Profile.objects.create(username='owner', display_name='Owner')
+        post = Post.objects.create(profile=profile)
+        with mock.patch.object(purge_worker, 'start'), self.captureOnCommitCallbacks(execute=True):
+            for obj in (post, profile):
+                url = reverse(f'admin:mini_insta_{obj._meta.model_name}_delete', args=[obj.pk])
+                self.assertEqual(self.client.post(url, {'post': 'yes'}).status_code, 302)
+        self.assertTrue(Post.all_objects.get(pk=post.pk).deleted)
+        self.assertTrue(Profile.all_objects.get(pk=profile.pk).deleted)
+        self.assertEqual(list(PurgeJob.objects.values_list('target_type', flat=True).order_by('pk')),
+                         ['post', 'profile'])
+
+    def test_delete_user_from_changelist(self):
+        """
+        Deleting users from the user changelist purges their profiles, then
+        deletes the accounts, and deletes users without a profile at once.
+        """
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+        member = User.objects.create_user('member', password='password')
+        profile = Profile.objects.create(user=member, username='member', display_name='Member')
+        bystander = User.objects.create_user('bystander', password='password')
+        with mock.patch.object(purge_worker, 'start'), self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('admin:auth_user_changelist'), {
+                'action': 'delete_selected', '_selected_action': [member.pk, bystander.pk], 'post': 'yes',
+            })
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(User.objects.filter(pk=bystander.pk).exists())
+        self.assertFalse(User.objects.get(pk=member.pk).is_active)
+        self.assertTrue(Profile.all_objects.get(pk=profile.pk).deleted)
+
+        run_pending_jobs(pause=0)
+        self.assertFalse(User.objects.filter(pk=member.pk).exists())
+        self.assertFalse(Profile.all_objects.filter(pk=profile.pk).exists())
+
+
+class StubImageHandler(BaseHTTPRequestHandler):
+    """
+    Local stand-in for an external image host, counting the requests it serves.
+    """
+    requests = 0
+
+    def do_GET(self):
+        """
+        Serve an 800x400 PNG, or 404 for /missing.png.
+        """
+        type(self).requests += 1
+        if self.path == '/missing.png':
+            self.send_error(404)
+            return
+        output = io.BytesIO()
+        Image.new('RGB', (800, 400), (200, 80, 40)).save(output, 'PNG')
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/png')
+        self.send_header('Content-Length', str(len(output.getvalue())))
+        self.end_headers()
+        self.wfile.write(output.getvalue())
+
+    def log_message(self, format, *args):
+        """
+        Keep the test output quiet.
+        """
+
+
+class ImageProxyTests(TestCase):
+    """
+    Check the image proxy against a local HTTP server.
+    """
+    @classmethod
+    def setUpClass(cls):
+        """
+        Start the stub image server.
+        """
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), StubImageHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.base_url = f'http://127.0.0.1:{cls.server.server_port}'
+
+    @classmethod
+    def tearDownClass(cls):
+        """
+        Stop the stub image server.
+        """
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        """
+        Point the proxy at an empty cache directory and reset the request count.
+        """
+        cache.clear()
+        StubImageHandler.requests = 0
+        self.cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cache_dir)
+        settings_override = override_settings(IMAGE_PROXY_ENABLED=True, IMAGE_PROXY_DIR=self.cache_dir,
+                                              IMAGE_PROXY_ALLOW_PRIVATE=True)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def get_image(self, url):
+        """
+        Request a proxy URL and return the response and its image.
+
+        Parameters:
+            url: The proxy URL.
+
+        Returns:
+            tuple: The response and the decoded image.
+        """
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response, Image.open(io.BytesIO(b''.join(response.streaming_content)))
+
+    def cache_size(self):
+        """
+        Return the total size of the files in the cache directory.
+        """
+        return sum(os.path.getsize(os.path.join(root, name))
+                   for root, dirs, names in os.walk(self.cache_dir) for name in names)
+
+    def test_photo_urls_are_proxied(self):
+        """
+        External photo URLs are proxied only while the proxy is enabled.
+        """
+        photo = Photo(image_url=f'{self.base_url}/photo.png')
+        self.assertTrue(photo.get_image_url().startswith('/mini_insta/image/'))
+        self.assertEqual(photo.get_image_url(), photo.get_image_url())
+        with override_settings(IMAGE_PROXY_ENABLED=False):
+            self.assertEqual(photo.get_image_url(), f'{self.base_url}/photo.png')
+
+    def test_image_is_fetched_once_and_resized(self):
+        """
+        The first request fetches and resizes the image; later ones are served from disk.
+        """
+        url = proxy_url(f'{self.base_url}/photo.png', 600)
+        response, image = self.get_image(url)
+        self.assertEqual(image.size, (640, 320))
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.get_image(url)
+        self.assertEqual(StubImageHandler.requests, 1)
+
+    def test_failures_redirect_to_original(self):
+        """
+        Missing images and private hosts send the client to the original URL.
+        """
+        missing = f'{self.base_url}/missing.png'
+        self.assertRedirects(self.client.get(proxy_url(missing, 160)), missing, fetch_redirect_response=False)
+        # The failure is remembered, so the host is not asked again
+        self.client.get(proxy_url(missing, 160))
+        self.assertEqual(StubImageHandler.requests, 1)
+
+        photo = f'{self.base_url}/photo.png'
+        with override_settings(IMAGE_PROXY_ALLOW_PRIVATE=False):
+            self.assertRedirects(self.client.get(proxy_url(photo, 160)), photo, fetch_redirect_response=False)
+        self.assertEqual(StubImageHandler.requests, 1)
+
+    def test_connects_to_checked_address(self):
+        """
+        The host is resolved once, and the connection goes to the address that passed the check.
+        """
+        public = [(socket.AF_INET, socket.SOCK_STREAM, socket.IPPROTO_TCP, '', ('8.8.8.8', 80))]
+        with override_settings(IMAGE_PROXY_ALLOW_PRIVATE=False), \
+                mock.patch('socket.getaddrinfo', return_value=public) as resolve, \
+                mock.patch('socket.create_connection', side_effect=OSError('refused')) as connect:
+            with self.assertRaises(ImageFetchError):
+                fetch('http://images.example/photo.png')
+        self.assertEqual(resolve.call_count, 1)
+        self.assertEqual(connect.call_args[0][0], ('8.8.8.8', 80))
+
+    def test_tampered_token_is_rejected(self):
+        """
+        Only URLs signed by proxy_url are fetched.
+        """
+        url = proxy_url(f'{self.base_url}/photo.png', 160)
+        self.assertEqual(self.client.get(url[:-3] + 'abc/').status_code, 404)
+
+    def test_cache_stays_within_budget(self):
+        """
+        Least recently used images are evicted once the cache is over its size limit.
+        """
+        first = proxy_url(f'{self.base_url}/photo.png?1', 1080)
+        self.get_image(first)
+        budget = self.cache_size() * 2.5
+        with override_settings(IMAGE_PROXY_MAX_BYTES=budget):
+            for number in range(2, 6):
+                self.get_image(proxy_url(f'{self.base_url}/photo.png?{number}', 1080))
+                self.assertLessEqual(self.cache_size(), budget)
+            # The first image was evicted and has to be fetched again
+            self.get_image(first)
+        self.assertEqual(StubImageHandler.requests, 6)
+
+
+class ChunkedUploadTests(TestCase):
+    """
+    Check chunked, resumable photo uploads to draft posts.
+    """
+    def setUp(self):
+        """
+        Log in as a user with a profile and use empty media and upload directories.
+        """
+        self.user = User.objects.create_user('uploader', password='password')
+        self.profile = Profile.objects.create(user=self.user, username='uploader', display_name='Uploader')
+        self.client.force_login(self.user)
+        for setting in ('MEDIA_ROOT', 'CHUNKED_UPLOAD_DIR'):
+            directory = tempfile.mkdtemp()
+            self.addCleanup(shutil.rmtree, directory)
+            settings_override = override_settings(**{setting: directory})
+            settings_override.enable()
+            self.addCleanup(settings_override.disable)
+
+        output = io.BytesIO()
+        Image.new('RGB', (300, 200), (10, 120, 200)).save(output, 'PNG')
+        self.image = output.getvalue()
+
+    def start(self, data=None, **fields):
+        """
+        Start an upload of data and return its state.
+        """
+        data = self.image if data is None else data
+        payload = {'filename': 'photo.png', 'size': len(data), 'sha256': hashlib.sha256(data).hexdigest()}
+        payload.update(fields)
+        response = self.client.post(reverse('api_uploads'), json.dumps(payload), content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        return response.json()
+
+    def put(self, upload, offset, chunk, checksum=None):
+        """
+        Send one chunk of an upload.
+        """
+        return self.client.put(
+            reverse('api_upload', kwargs={'pk': upload['id']}), chunk,
+            content_type='application/octet-stream',
+            headers={'Upload-Offset': str(offset),
+                     'Upload-Checksum': 'sha256 ' + (checksum or hashlib.sha256(chunk).hexdigest())},
+        )
+
+    def test_upload_resumes_and_publishes(self):
+        """
+        Chunks build the file, the finished file becomes a photo of a hidden
+        draft, and submitting the form publishes the draft.
+        """
+        upload = self.start()
+        half = len(self.image) // 2
+        self.assertEqual(self.put(upload, 0, self.image[:half]).json()['offset'], half)
+
+        # A client that lost track of the offset is told where to resume
+        response = self.put(upload, 0, self.image[:half])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['offset'], half)
+        state = self.client.get(reverse('api_upload', kwargs={'pk': upload['id']})).json()
+        self.assertEqual(state['offset'], half)
+
+        response = self.put(upload, half, self.image[half:])
+        self.assertEqual(response.status_code, 200)
+        photo = Photo.objects.get(pk=response.json()['photo'])
+        self.assertEqual(photo.image_file.read(), self.image)
+        self.assertFalse(os.path.exists(part_path(PhotoUpload.objects.get(pk=upload['id']))))
+        self.assertFalse(Post.objects.filter(pk=upload['post']).exists())
+
+        response = self.client.post(reverse('create_post'), {'caption': 'Chunked #upload', 'draft': upload['post']})
+        self.assertRedirects(response, reverse('show_user_profile'), fetch_redirect_response=False)
+        post = Post.objects.get(pk=upload['post'])
+        self.assertEqual(post.caption, 'Chunked #upload')
+        self.assertEqual(list(post.photos.all()), [photo])
+
+    def test_corrupt_chunks_and_files_are_rejected(self):
+        """
+        A chunk that fails its checksum is dropped, and a file that fails its
+        digest restarts from the beginning.
+        """
+        upload = self.start()
+        response = self.put(upload, 0, self.image, checksum='0' * 64)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['offset'], 0)
+
+        wrong = self.start(sha256='0' * 64)
+        response = self.put(wrong, 0, self.image)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['offset'], 0)
+        self.assertFalse(Photo.objects.exists())
+
+    def test_other_users_cannot_use_an_upload(self):
+        """
+        Uploads and drafts belong to the profile that started them.
+        """
+        upload = self.start()
+        other = User.objects.create_user('other', password='password')
+        Profile.objects.create(user=other, username='other', display_name='Other')
+        self.client.force_login(other)
+        self.assertEqual(self.put(upload, 0, self.image).status_code, 404)
+        response = self.client.post(reverse('api_uploads'), json.dumps({
+            'filename': 'photo.png', 'size': 1, 'sha256': '0' * 64, 'post': upload['post'],
+        }), content_type='application/json')
+        self.assertEqual(response.status_code, 404)
+
+    def test_abandoned_uploads_expire(self):
+        """
+        Old drafts are tombstoned and purged with their uploads, and unfinished
+        uploads of published posts lose their partial files.
+        """
+        drafted = self.start()
+        self.put(drafted, 0, self.image[:10])
+        published = self.start()
+        self.put(published, 0, self.image[:10])
+        Post.all_objects.get(pk=published['post']).publish()
+        paths = [part_path(PhotoUpload.objects.get(pk=upload['id'])) for upload in (drafted, published)]
+        self.assertTrue(all(os.path.exists(path) for path in paths))
+
+        # Run the purge here rather than on the background thread
+        with mock.patch.object(purge_worker, 'start'), self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(expire_uploads(timedelta()), (1, 1))
+            run_pending_jobs(pause=0)
+        self.assertFalse(Post.all_objects.filter(pk=drafted['post']).exists())
+        self.assertFalse(PhotoUpload.objects.exists())
+        self.assertFalse(any(os.path.exists(path) for path in paths))
+
+
+class RateLimitTests(TestCase):
+    """
+    Check that the like views and the batch endpoint share one rate limit.
+    """
+    def setUp(self):
+        """
+        Log in as a user with a profile and create posts by another profile.
+        """
+        caches['ratelimit'].clear()
+        user = User.objects.create_user('liker', password='password')
+        self.profile = Profile.objects.create(user=user, username='liker', display_name='Liker')
+        self.client.force_login(user)
+        author = Profile.objects.create(username='author', display_name='Author')
+        self.posts = [Post.objects.create(profile=author, caption=f'Post {number}') for number in range(40)]
+
+    def batch(self, count):
+        """
+        Send a batch liking the first count posts.
+        """
+        operations = [{'op': 'like', 'post': post.pk} for post in self.posts[:count]]
+        return self.client.post(reverse('api_bulk_like'), json.dumps({'operations': operations}),
+                                content_type='application/json')
+
+    def test_batch_operations_count_against_the_limit(self):
+        """
+        Each operation in a batch spends one token of the like limit.
+        """
+        self.assertEqual(self.batch(31).status_code, 429)
+        self.assertEqual(self.batch(25).status_code, 200)
+        for post in self.posts[25:30]:
+            response = self.client.post(reverse('create_like', kwargs={'pk': post.pk}))
+            self.assertEqual(response.status_code, 302)
+        response = self.client.post(reverse('create_like', kwargs={'pk': self.posts[30].pk}))
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+        self.assertEqual(Like.objects.count() + PendingLike.objects.count(), 30)
+
+
+class ApiConditionalTests(TestCase):
+    """
+    Check the ETag and Last-Modified validators of the read-only JSON API.
+    """
+    def setUp(self):
+        """
+        Create a profile with a few posts.
+        """
+        self.profile = Profile.objects.create(username='poster', display_name='Poster')
+        self.posts = [Post.objects.create(profile=self.profile, caption=f'Post {number}') for number in range(3)]
+
+    def assertChanged(self, url, etag):
+        """
+        Assert that a conditional request with an old ETag gets a full response.
+        """
+        response = self.client.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        return response['ETag']
+
+    def test_matching_etag_skips_the_payload(self):
+        """
+        A current ETag is answered 304 by one aggregate query, without reading the rows.
+        """
+        url = reverse('api_posts')
+        etag = self.client.get(url)['ETag']
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(len(queries.captured_queries), 1)
+        self.assertNotIn('caption', queries.captured_queries[0]['sql'])
+
+    def test_edits_and_deletions_change_the_etag(self):
+        """
+        Editing a caption and deleting a post both change the list's ETag.
+        """
+        url = reverse('api_posts')
+        etag = self.client.get(url)['ETag']
+        Post.objects.filter(pk=self.posts[0].pk).update(
+            caption='Edited', modified=timezone.now() + timedelta(seconds=5),
+        )
+        etag = self.assertChanged(url, etag)
+        tombstone_post(self.posts[1])
+        response = self.client.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['results']), 2)
+        self.assertNotIn('Last-Modified', response)
+
+    def test_last_modified_follows_edits(self):
+        """
+        A single profile's Last-Modified advances when its bio is edited.
+        """
+        url = reverse('api_profile', kwargs={'pk': self.profile.pk})
+        last_modified = self.client.get(url)['Last-Modified']
+        self.assertEqual(self.client.get(url, headers={'If-Modified-Since': last_modified}).status_code, 304)
+        Profile.objects.filter(pk=self.profile.pk).update(
+            bio_text='New bio', modified=timezone.now() + timedelta(seconds=5),
+        )
+        response = self.client.get(url, headers={'If-Modified-Since': last_modified})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['bio_text'], 'New bio')
+
+
+class FollowGraphTests(TestCase):
+    """
+    Check that the follow graph index rebuilds without losing edges or blocking requests.
+    """
+    def setUp(self):
+        """
+        Create three profiles where the first follows the second.
+        """
+        self.first, self.second, self.third = [
+            Profile.objects.create(username=f'user{number}', display_name=f'User {number}') for number in range(3)
+        ]
+        Follow.objects.create(profile=self.second, follower_profile=self.first)
+        self.graph = FollowGraph()
+
+    def test_edges_changed_during_a_build_are_kept(self):
+        """
+        Follows and unfollows committed while a build is loading reach the new index.
+        """
+        load = self.graph._load
+
+        def load_while_following():
+            following = load()
+            self.graph.add_edge(self.first.pk, self.third.pk)
+            self.graph.remove_edge(self.first.pk, self.second.pk)
+            return following
+
+        with mock.patch.object(self.graph, '_load', load_while_following):
+            self.graph.build()
+        self.assertEqual(list(self.graph._following[self.first.pk]), [self.third.pk])
+
+    def test_stale_index_rebuilds_in_the_background(self):
+        """
+        A stale index keeps answering while one background thread rebuilds it.
+        """
+        self.graph.build()
+        self.graph._built_at -= REBUILD_INTERVAL + 1
+        release = threading.Event()
+        with mock.patch.object(self.graph, 'build', side_effect=lambda: release.wait(5)) as build:
+            self.assertEqual(self.graph.suggest_ids(self.first.pk), [])
+            self.graph.suggest_ids(self.first.pk)
+            thread = self.graph._rebuild_thread
+            release.set()
+            thread.join()
+        build.assert_called_once_with()
+
+    def test_follow_drops_followers_cached_suggestions(self):
+        """
+        A follow by a followed profile refreshes its followers' cached suggestions.
+        """
+        self.graph.build()
+        self.assertEqual(self.graph.suggest_ids(self.first.pk), [])
+        self.graph.add_edge(self.second.pk, self.third.pk)
+        self.assertEqual(self.graph.suggest_ids(self.first.pk), [self.third.pk])
+
+
+class ProfileConditionalTests(TestCase):
+    """
+    Check that a logged-in visitor's conditional profile request does not search the follow graph.
+    """
+    def test_not_modified_without_suggestions(self):
+        """
+        A matching ETag is answered 304 without computing suggestions, and
+        follows by the viewer or by a profile it follows change the ETag.
+        """
+        user = User.objects.create_user('viewer', password='password')
+        viewer = Profile.objects.create(user=user, username='viewer', display_name='Viewer')
+        shown, friend, other = [Profile.objects.create(username=name, display_name=name.title())
+                                for name in ('shown', 'friend', 'other')]
+        Follow.objects.create(profile=friend, follower_profile=viewer)
+        self.client.force_login(user)
+        url = reverse('profile', kwargs={'pk': shown.pk})
+        etag = self.client.get(url)['ETag']
+
+        with mock.patch.object(follow_graph, 'suggest_ids') as suggest_ids:
+            response = self.client.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        suggest_ids.assert_not_called()
+
+        # Time stamps must differ for the modified times to change
+        with mock.patch('django.utils.timezone.now', return_value=timezone.now() + timedelta(seconds=1)):
+            Follow.objects.create(profile=other, follower_profile=friend)
+        response = self.client.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        # The validator only reads the database, so other workers compute the same ETag
+        self.assertEqual(self.client.get(url)['ETag'], response['ETag'])
+
+
+class ContentAddressedStorageTests(TestCase):
+    """
+    Check that photos share stored files and that a shared file lives as long as a photo uses it.
+    """
+    def setUp(self):
+        """
+        Use an empty media directory and create a post to attach photos to.
+        """
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        settings_override = override_settings(MEDIA_ROOT=directory)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        profile = Profile.objects.create(username='owner', display_name='Owner')
+        self.post = Post.objects.create(profile=profile)
+
+    def add_photo(self):
+        """
+        Add a photo whose file has the same bytes every time.
+        """
+        return Photo.objects.create(post=self.post, image_file=ContentFile(b'same bytes', name='photo.jpg'))
+
+    def test_identical_files_are_stored_once(self):
+        """
+        Two photos of the same bytes share one file, which goes with the last photo.
+        """
+        first, second = self.add_photo(), self.add_photo()
+        self.assertEqual(first.image_file.name, second.image_file.name)
+        self.assertEqual(MediaBlob.objects.get(pk=first.image_file.name).refcount, 2)
+        path = first.image_file.path
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertTrue(os.path.exists(path))
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(os.path.exists(path))
+
+    def test_new_reference_keeps_a_released_file(self):
+        """
+        A photo stored while the last reference is being released keeps the
+        file, and a file whose deletion already ran is written again.
+        """
+        photo = self.add_photo()
+        path = photo.image_file.path
+        with self.captureOnCommitCallbacks() as callbacks:
+            photo.delete()
+            replacement = self.add_photo()
+        for callback in callbacks:
+            callback()
+        self.assertTrue(os.path.exists(path))
+        self.assertEqual(replacement.image_file.read(), b'same bytes')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            replacement.delete()
+        self.assertFalse(os.path.exists(path))
+        self.assertTrue(os.path.exists(self.add_photo().image_file.path))
+
+
+
+class PurgeJobClaimTests(TestCase):
+    """
+    Check that a purge job is run by one worker at a time and that stalled jobs are taken over.
+    """
+    def setUp(self):
+        """
+        Tombstone a post with two comments, without starting the background worker.
+        """
+        profile = Profile.objects.create(username='owner', display_name='Owner')
+        self.post = Post.objects.create(profile=profile)
+        for text in ('first', 'second'):
+            Comment.objects.create(post=self.post, profile=profile, text=text)
+        with mock.patch.object(purge_worker, 'start'):
+            self.job = tombstone_post(self.post)
+
+    def test_running_job_is_claimed_once(self):
+        """
+        Two workers that read the same pending job cannot both claim it, nor
+        claim it again while its heartbeat is fresh.
+        """
+        first, second = PurgeJob.objects.get(pk=self.job.pk), PurgeJob.objects.get(pk=self.job.pk)
+        self.assertTrue(claim_job(first, 'first'))
+        self.assertFalse(claim_job(second, 'second'))
+        self.assertFalse(claim_job(PurgeJob.objects.get(pk=self.job.pk), 'second'))
+        self.assertEqual(PurgeJob.objects.get(pk=self.job.pk).worker, 'first')
+
+    def test_stalled_job_is_taken_over(self):
+        """
+        A running job without a recent heartbeat is finished by the next worker.
+        """
+        PurgeJob.objects.filter(pk=self.job.pk).update(
+            status='running', worker='stopped', heartbeat=timezone.now() - STALE_AFTER - timedelta(seconds=1),
+        )
+        self.assertEqual(run_pending_jobs(pause=0), 0)
+        self.assertEqual(run_pending_jobs(include_interrupted=True, pause=0), 1)
+        self.assertEqual(PurgeJob.objects.get(pk=self.job.pk).status, 'done')
+        self.assertFalse(Post.all_objects.filter(pk=self.post.pk).exists())
+
+    def test_taken_over_job_stops_the_old_worker(self):
+        """
+        A worker whose job was claimed by another stops after its current batch.
+        """
+        def take_over(seconds):
+            PurgeJob.objects.filter(pk=self.job.pk).update(worker='other', heartbeat=timezone.now())
+
+        with mock.patch('mini_insta.purge.time.sleep', side_effect=take_over), \
+                self.assertLogs('mini_insta.purge', 'WARNING'):
+            run_job(self.job, batch_size=1, pause=1)
+        job = PurgeJob.objects.get(pk=self.job.pk)
+        self.assertEqual((job.status, job.worker, job.deleted_rows), ('running', 'other', 1))
+        self.assertEqual(Comment.objects.filter(post_id=self.post.pk).count(), 1)
+
+
+class DeletedUsernameTests(TestCase):
+    """
+    Check that the username of a deleted profile stays taken until its rows are purged.
+    """
+    def test_deleted_username_is_a_form_error(self):
+        """
+        Registering the username of a profile waiting to be purged fails
+        validation instead of the database insert, and works after the purge.
+        """
+        profile = Profile.objects.create(username='taken', display_name='Taken')
+        with mock.patch.object(purge_worker, 'start'):
+            tombstone_profile(profile)
+        data = {'username': 'taken', 'display_name': 'New', 'profile_image_url': 'https://example.com/a.png'}
+        form = CreateProfileForm(data)
+        self.assertFalse(form.is_valid())
+        self.assertIn('username', form.errors)
+
+        run_pending_jobs(pause=0)
+        self.assertTrue(CreateProfileForm(data).is_valid())
+
+
+class ExploreScoreTests(TestCase):
+    """
+    Check that the incrementally maintained Explore scores add up and decay.
+    """
+    def setUp(self):
+        """
+        Create an author and a viewer.
+        """
+        self.author = Profile.objects.create(username='author', display_name='Author')
+        self.viewer = Profile.objects.create(username='viewer', display_name='Viewer')
+
+    def scores(self, post):
+        """
+        Return the current scores of a post and of its author.
+        """
+        return (PostScore.objects.get(pk=post.pk).score,
+                ProfileScore.objects.filter(pk=post.profile_id).values_list('score', flat=True).first())
+
+    def test_unlike_restores_score(self):
+        """
+        Liking and then unliking a post leaves its scores where they were.
+        """
+        post = Post.objects.create(profile=self.author)
+        Like.objects.create(post=post, profile=self.viewer)
+        before = self.scores(post)
+        like = Like.objects.create(post=post, profile=self.author)
+        self.assertGreater(self.scores(post)[0], before[0])
+        like.delete()
+        after = self.scores(post)
+        self.assertAlmostEqual(after[0], before[0])
+        self.assertAlmostEqual(after[1], before[1])
+
+    def test_older_post_ranks_lower(self):
+        """
+        Of two posts with the same engagement, the older one ranks lower.
+        """
+        with mock.patch('django.utils.timezone.now', return_value=timezone.now() - timedelta(days=1)):
+            older = Post.objects.create(profile=self.author)
+        newer = Post.objects.create(profile=self.author)
+        for post in (older, newer):
+            Like.objects.create(post=post, profile=self.viewer)
+            Comment.objects.create(post=post, profile=self.viewer, text='Nice')
+        self.assertEqual([post.pk for post in top_posts()], [newer.pk, older.pk])
+
+
+class BulkLikeTests(TestCase):
+    """
+    Check the per-operation results of the batch like endpoint and the signals it sends.
+    """
+    def setUp(self):
+        """
+        Log in a liker and create posts to like, listening for new likes.
+        """
+        user = User.objects.create_user('liker', password='password')
+        self.client.force_login(user)
+        self.profile = Profile.objects.create(user=user, username='liker', display_name='Liker')
+        author = Profile.objects.create(username='author', display_name='Author')
+        self.own, self.liked, self.fresh, self.other = (
+            Post.objects.create(profile=profile) for profile in (self.profile, author, author, author)
+        )
+        Like.objects.create(post=self.liked, profile=self.profile)
+        self.signalled = []
+
+        def like_created(sender, instance, created, **kwargs):
+            if created:
+                self.signalled.append(instance.post_id)
+
+        post_save.connect(like_created, sender=Like, weak=False, dispatch_uid='bulk-like-test')
+        self.addCleanup(post_save.disconnect, sender=Like, dispatch_uid='bulk-like-test')
+
+    def send(self, *operations):
+        """
+        Post a batch of operations and return the status of each.
+        """
+        response = self.client.post(reverse('api_bulk_like'), json.dumps({'operations': list(operations)}),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        return [result['status'] for result in response.json()['results']]
+
+    def test_operation_statuses(self):
+        """
+        Each operation reports what happened to it, and only new likes are signalled.
+        """
+        statuses = self.send(
+            {'op': 'unlike', 'post': self.fresh.pk},
+            {'op': 'like', 'post': self.fresh.pk},
+            {'op': 'like', 'post': self.liked.pk},
+            {'op': 'like', 'post': self.own.pk},
+            {'op': 'like', 'post': 0},
+            {'op': 'like', 'post': 'x'},
+        )
+        self.assertEqual(statuses, ['superseded', 'created', 'unchanged', 'forbidden', 'not_found', 'invalid'])
+        self.assertEqual(self.signalled, [self.fresh.pk])
+        self.assertEqual(self.send({'op': 'unlike', 'post': self.liked.pk}), ['deleted'])
+        self.assertFalse(Like.objects.filter(post=self.liked).exists())
+
+    def test_concurrent_like_is_not_signalled_twice(self):
+        """
+        A like another request inserted before the batch took its lock is
+        reported as unchanged and signalled only by that request.
+        """
+        real = batch.existing_targets
+
+        def existing_after_race(*args):
+            Like.objects.create(post=self.other, profile=self.profile)
+            return real(*args)
+
+        with mock.patch.object(batch, 'existing_targets', side_effect=existing_after_race):
+            statuses = self.send({'op': 'like', 'post': self.fresh.pk}, {'op': 'like', 'post': self.other.pk})
+        self.assertEqual(statuses, ['created', 'unchanged'])
+        self.assertEqual(sorted(self.signalled), sorted([self.fresh.pk, self.other.pk]))
+
+    def test_signal_matches_save(self):
+        """
+        The signal for a bulk-inserted like carries the same arguments as Model.save sends.
+        """
+        received = []
+        post_save.connect(lambda **kwargs: received.append(kwargs), sender=Like, weak=False,
+                          dispatch_uid='bulk-like-kwargs')
+        self.addCleanup(post_save.disconnect, sender=Like, dispatch_uid='bulk-like-kwargs')
+
+        self.send({'op': 'like', 'post': self.fresh.pk})
+        self.assertEqual(len(received), 1)
+        self.assertIs(received[0]['raw'], False)
+        self.assertEqual(received[0]['using'], 'default')
+        self.assertIsNone(received[0]['update_fields'])
+
+
+class CommentPaginationTests(TestCase):
+    """
+    Check that post detail and the comments fragment page through every comment once.
+    """
+    def setUp(self):
+        """
+        Create a post with more than two pages of comments from several profiles.
+        """
+        self.profiles = [Profile.objects.create(username=f'user{number}', display_name=f'User {number}')
+                         for number in range(3)]
+        self.post = Post.objects.create(profile=self.profiles[0])
+        other = Post.objects.create(profile=self.profiles[0])
+        Comment.objects.create(post=other, profile=self.profiles[1], text='Elsewhere')
+        for number in range(COMMENTS_PAGE_SIZE * 2 + 5):
+            Comment.objects.create(post=self.post, profile=self.profiles[number % 3], text=f'Comment {number}')
+
+    def test_pages_have_no_repeats_or_gaps(self):
+        """
+        Following the cursors from the detail page returns each comment once, newest first.
+        """
+        response = self.client.get(reverse('post_detail', kwargs={'pk': self.post.pk}))
+        seen = [comment.pk for comment in response.context['comments']]
+        self.assertEqual(len(seen), COMMENTS_PAGE_SIZE)
+        cursor = response.context['next_cursor']
+        # A comment added while the reader pages through belongs above the first page
+        Comment.objects.create(post=self.post, profile=self.profiles[1], text='Late')
+
+        query_counts = []
+        while cursor:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(reverse('post_comments', kwargs={'pk': self.post.pk}), {'after': cursor})
+            query_counts.append(len(queries))
+            seen += [comment.pk for comment in response.context['comments']]
+            cursor = response.context['next_cursor']
+
+        expected = list(Comment.objects.filter(post=self.post, text__startswith='Comment')
+                        .order_by('-pk').values_list('pk', flat=True))
+        self.assertEqual(seen, expected)
+        # Profiles are joined, so a full page costs no more queries than a short one
+        self.assertEqual(len(set(query_counts)), 1)
+        # The page shows the stored count rather than counting the comments
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comment_count, len(expected) + 1)
+
+    def test_invalid_cursor_starts_from_newest(self):
+        """
+        A cursor that is not a number is ignored.
+        """
+        response = self.client.get(reverse('post_comments', kwargs={'pk': self.post.pk}), {'after': 'abc'})
+        newest = Comment.objects.filter(post=self.post).latest('pk')
+        self.assertEqual(response.context['comments'][0].pk, newest.pk)
+
+
+class TagIndexTests(TestCase):
+    """
+    Check hashtag and mention extraction and that the tag index follows edits.
+    """
+    def setUp(self):
+        """
+        Create a profile to post and comment as.
+        """
+        self.profile = Profile.objects.create(username='anthony', display_name='Anthony')
+
+    def tags_of(self, **filters):
+        """
+        Return the set of indexed tags matching the filters.
+        """
+        return set(TagEntry.objects.filter(**filters).values_list('tag', flat=True))
+
+    def test_extract_tags(self):
+        """
+        Tags are lowercased and deduplicated, and email addresses and doubled prefixes are skipped.
+        """
+        text = 'Sunset #Beach at #beach with @Anthony, mail a@b.com, x#no ##double'
+        self.assertEqual(extract_tags(text), {'#beach', '@anthony'})
+        self.assertEqual(extract_tags(''), set())
+
+    def test_html_entities_are_not_tags(self):
+        """
+        Numeric entities in escaped text are neither indexed nor linked.
+        """
+        self.assertEqual(extract_tags('Tom&#39;s #party'), {'#party'})
+        html = link_tags("Tom's <b>#party</b>")
+        self.assertIn('&#x27;', html)
+        self.assertIn('&lt;b&gt;', html)
+        self.assertEqual(html.count('<a '), 1)
+        self.assertIn(reverse('hashtag', args=['party']), html)
+
+    def test_caption_edit_relinks(self):
+        """
+        Editing a caption adds and removes its entries, and clearing it removes them all.
+        """
+        post = Post.objects.create(profile=self.profile, caption='#one #two')
+        self.assertEqual(self.tags_of(post=post), {'#one', '#two'})
+        post.caption = '#two #three @anthony'
+        post.save()
+        self.assertEqual(self.tags_of(post=post), {'#two', '#three', '@anthony'})
+        post.caption = 'no tags'
+        post.save()
+        self.assertEqual(self.tags_of(post=post), set())
+
+    def test_comment_edit_relinks(self):
+        """
+        Editing a comment re-indexes it without touching the caption's entries.
+        """
+        post = Post.objects.create(profile=self.profile, caption='#one')
+        comment = Comment.objects.create(post=post, profile=self.profile, text='@anthony #one')
+        self.assertEqual(self.tags_of(comment=comment), {'@anthony', '#one'})
+        comment.text = '#two'
+        comment.save()
+        self.assertEqual(self.tags_of(comment=comment), {'#two'})
+        self.assertEqual(self.tags_of(post=post, comment__isnull=True), {'#one'})
+        comment.delete()
+        self.assertEqual(self.tags_of(post=post), {'#one'})
+
+    def test_tag_page_lists_entries(self):
+        """
+        A tag page lists the posts and comments using the tag, and drops removed ones.
+        """
+        post = Post.objects.create(profile=self.profile, caption='#One')
+        Comment.objects.create(post=post, profile=self.profile, text='also #one')
+        response = self.client.get(reverse('hashtag', args=['ONE']))
+        self.assertEqual(len(response.context['entries']), 2)
+        post.caption = 'none'
+        post.save()
+        response = self.client.get(reverse('hashtag', args=['one']))
+        self.assertEqual([entry.comment is not None for entry in response.context['entries']], [True])
+
+
+class LikeCoalescingTests(TestCase):
+    """
+    Check that like/unlike toggles are stored as pending states and written once they settle.
+    """
+    def setUp(self):
+        """
+        Log in a liker and create a post by another profile, counting Like writes.
+        """
+        user = User.objects.create_user('liker', password='password')
+        self.client.force_login(user)
+        self.profile = Profile.objects.create(user=user, username='liker', display_name='Liker')
+        author = Profile.objects.create(username='author', display_name='Author')
+        self.post = Post.objects.create(profile=author)
+        self.writes = []
+
+        def like_written(sender, instance, **kwargs):
+            self.writes.append(sender)
+
+        for signal in (post_save, post_delete):
+            signal.connect(like_written, sender=Like, weak=False, dispatch_uid='coalesce-test')
+            self.addCleanup(signal.disconnect, sender=Like, dispatch_uid='coalesce-test')
+
+    def toggle(self, *names):
+        """
+        Send like or unlike requests in order.
+        """
+        for name in names:
+            response = self.client.post(reverse(name, kwargs={'pk': self.post.pk}))
+            self.assertEqual(response.status_code, 302)
+
+    def page(self):
+        """
+        Return the like count and the viewer's like state shown on the post page.
+        """
+        response = self.client.get(reverse('post_detail', kwargs={'pk': self.post.pk}))
+        return response.context['like_count'], response.context['viewer_likes']
+
+    def test_toggles_write_only_the_final_state(self):
+        """
+        A burst of toggles is shown at once but writes one Like, and a burst
+        ending where it started writes nothing.
+        """
+        self.toggle('create_like', 'delete_like', 'create_like')
+        self.assertFalse(Like.objects.exists())
+        self.assertEqual(self.page(), (1, True))
+        self.assertEqual(flush_likes(settled_for=0), 1)
+        self.assertEqual(self.writes, [Like])
+        self.assertFalse(PendingLike.objects.exists())
+
+        modified = Post.objects.get(pk=self.post.pk).modified
+        self.toggle('delete_like', 'create_like')
+        self.assertEqual(self.page(), (1, True))
+        flush_likes(settled_for=0)
+        self.assertEqual(self.writes, [Like])
+        self.assertEqual(Post.objects.get(pk=self.post.pk).modified, modified)
+
+    def test_unsettled_likes_wait(self):
+        """
+        Likes changed within the window are left for a later flush.
+        """
+        self.toggle('create_like')
+        self.assertEqual(flush_likes(settled_for=60), 0)
+        self.assertTrue(PendingLike.objects.exists())
+
+    def test_pending_like_changes_etag(self):
+        """
+        A pending like makes the post page's ETag change before it is written.
+        """
+        etag = self.client.get(reverse('post_detail', kwargs={'pk': self.post.pk}))['ETag']
+        self.toggle('create_like')
+        response = self.client.get(reverse('post_detail', kwargs={'pk': self.post.pk}), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_batch_supersedes_pending_likes(self):
+        """
+        A batch unlike drops the pending like it replaces.
+        """
+        self.toggle('create_like')
+        response = self.client.post(reverse('api_bulk_like'), json.dumps(
+            {'operations': [{'op': 'unlike', 'post': self.post.pk}]}), content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(PendingLike.objects.exists())
+        self.assertEqual(self.page(), (0, False))
+
+    @override_settings(MINI_INSTA_LIKE_COALESCE_SECONDS=0)
+    def test_zero_window_writes_at_once(self):
+        """
+        Without a window, likes are written during the request.
+        """
+        self.toggle('create_like')
+        self.assertTrue(Like.objects.filter(post=self.post, profile=self.profile).exists())
+        self.assertFalse(PendingLike.objects.exists())
+
+
+class ProfilingTests(TestCase):
+    """
+    Check that only staff can trigger request profiles and read the stored captures.
+    """
+    def setUp(self):
+        """
+        Store captures in an empty directory and write one capture to it.
+        """
+        self.capture_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.capture_dir)
+        settings_override = override_settings(PROFILING_DIR=self.capture_dir)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        capture = profiling.Capture(threading.get_ident(), 'manual')
+        capture.stacks['get (mini_insta/views.py:1);render (mini_insta/views.py:2)'] = 3
+        request = RequestFactory().get('/mini_insta/')
+        self.name = profiling.save_capture(capture, request, 0.05)
+        self.staff = User.objects.create_user('staff', password='password', is_staff=True)
+        self.member = User.objects.create_user('member', password='password')
+
+    def test_captures_are_staff_only(self):
+        """
+        The index and downloads send everyone but staff to the admin login.
+        """
+        urls = [reverse('profile_captures'), reverse('profile_capture', kwargs={'name': self.name})]
+        for user in (None, self.member):
+            if user:
+                self.client.force_login(user)
+            for url in urls:
+                with self.subTest(user=user, url=url):
+                    response = self.client.get(url)
+                    self.assertEqual(response.status_code, 302)
+                    self.assertIn(reverse('admin:login'), response['Location'])
+
+        self.client.force_login(self.staff)
+        self.assertContains(self.client.get(urls[0]), self.name)
+        response = self.client.get(urls[1])
+        self.assertEqual(b''.join(response.streaming_content),
+                         b'get (mini_insta/views.py:1);render (mini_insta/views.py:2) 3\n')
+        missing = reverse('profile_capture', kwargs={'name': 'missing'})
+        self.assertEqual(self.client.get(missing).status_code, 404)
+
+    def test_only_staff_can_request_a_profile(self):
+        """
+        The profile flag starts sampling for staff and is ignored for everyone else.
+        """
+        with mock.patch.object(profiling.sampler, 'start_capture') as start:
+            self.client.force_login(self.member)
+            self.client.get(reverse('show_all_profiles'), {'_profile': '1'}, HTTP_X_PROFILE='1')
+            self.assertFalse(start.called)
+            self.client.force_login(self.staff)
+            self.client.get(reverse('show_all_profiles'), {'_profile': '1'})
+            self.assertTrue(start.called)
+
+
+class ReplayTests(LiveServerTestCase):
+    """
+    Check that the access log replay tool parses, rewrites and replays Mini Insta traffic.
+    """
+    LOG = [
+        '1.2.3.4 - - [19/Oct/2026:10:00:00 +0000] "GET /xiea/mini_insta/post/900/?page=2 HTTP/1.1" 200 512 "-" "ua"',
+        '1.2.3.4 - - [19/Oct/2026:10:00:01 +0000] "GET /xiea/static/mini_insta/style.css HTTP/1.1" 200 80 "-" "ua"',
+        '5.6.7.8 - - [19/Oct/2026:10:00:02 +0000] "GET /xiea/mini_insta/profile/feed/ HTTP/1.1" 200 900 "-" "ua"',
+        '5.6.7.8 - - [19/Oct/2026:10:00:03 +0000] "GET /xiea/mini_insta/post/900/events/ HTTP/1.1" 200 0 "-" "ua"',
+        '5.6.7.8 - - [19/Oct/2026:10:00:04 +0000] "GET /xiea/admin/ HTTP/1.1" 302 0 "-" "ua"',
+        '5.6.7.8 - - [19/Oct/2026:10:00:05 +0000] "GET /xiea/nothing/here/ HTTP/1.1" 404 0 "-" "ua"',
+        '1.2.3.4 - - [19/Oct/2026:10:00:06 +0000] "GET /xiea/mini_insta/post/901/ HTTP/1.1" 200 512 "-" "ua"',
+        '1.2.3.4 - - [19/Oct/2026:10:00:07 +0000] "GET /xiea/mini_insta/post/900/ HTTP/1.1" 200 512 "-" "ua"',
+        'not a log line',
+    ]
+
+    def setUp(self):
+        """
+        Create posts for the log's ids to be rewritten to, with the background workers held off.
+        """
+        for worker in (purge_worker, like_flusher):
+            patcher = mock.patch.object(worker, 'start_if_due')
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        author = Profile.objects.create(username='author', display_name='Author')
+        self.posts = [Post.objects.create(profile=author) for _ in range(2)]
+
+    def test_parse_and_rewrite(self):
+        """
+        Only Django requests are kept, logins are flagged, and each logged id maps to one local post.
+        """
+        entries, skipped = replay.parse_log(self.LOG, '/xiea', include_static=False)
+        self.assertEqual(dict(skipped), {'static': 1, 'post_events': 1, 'admin': 1, 'unmatched': 1, 'unparsed': 1})
+        self.assertEqual([entry.name for entry in entries], ['post_detail', 'news_feed', 'post_detail', 'post_detail'])
+        self.assertEqual([entry.offset for entry in entries], [0, 2, 6, 7])
+        self.assertEqual([entry.needs_login for entry in entries], [False, True, False, False])
+        self.assertEqual(entries[0].pattern, '/mini_insta/post/<int:pk>/')
+
+        self.assertEqual(replay.rewrite_ids(entries, replay.load_id_pools()), 0)
+        paths = [entry.path for entry in entries]
+        local = {reverse('post_detail', kwargs={'pk': post.pk}) for post in self.posts}
+        self.assertEqual(paths[0].partition('?'), (paths[3], '?', 'page=2'))
+        self.assertNotEqual(paths[2], paths[3])
+        self.assertEqual({paths[2], paths[3]}, local)
+
+        Post.objects.all().delete()
+        self.assertEqual(replay.rewrite_ids(entries, replay.load_id_pools()), 3)
+
+    def test_replay_reports_each_pattern(self):
+        """
+        Replaying logs in for pages that need it and groups the results by URL pattern.
+        """
+        entries, skipped = replay.parse_log(self.LOG, '/xiea', include_static=False)
+        replay.rewrite_ids(entries, replay.load_id_pools())
+        usernames = replay.ensure_replay_users(2)
+        results, elapsed = replay.replay(entries, self.live_server_url, workers=2, speed=0, usernames=usernames)
+        summary = results.summary(elapsed)
+
+        self.assertEqual(summary['total']['requests'], 4)
+        self.assertEqual(summary['total']['error_rate'], 0)
+        self.assertEqual(summary['patterns']['/mini_insta/post/<int:pk>/']['statuses'], {'200': 3})
+        # A redirect to the login page would be 302
+        self.assertEqual(summary['patterns']['/mini_insta/profile/feed/']['statuses'], {'200': 1})
+        self.assertEqual(sum(summary['total']['histogram']), 4)
+
+        report = io.StringIO()
+        replay.print_report(summary, skipped, stream=report)
+        self.assertIn('/mini_insta/profile/feed/', report.getvalue())
+
+
+class CachedSessionTests(TestCase):
+    """
+    Check that authenticated pages read the session and user from the cache and do not write the session.
+    """
+    def setUp(self):
+        """
+        Log in a user with a profile and load one page so the caches are warm.
+        """
+        caches['sessions'].clear()
+        self.user = User.objects.create_user('member', password='password')
+        Profile.objects.create(user=self.user, username='member', display_name='Member')
+        self.client.force_login(self.user)
+        self.client.get(reverse('show_user_profile'))
+
+    def session_queries(self):
+        """
+        Load an authenticated page and return its queries of the session and user tables.
+        """
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('show_user_profile'))
+        self.assertEqual(response.status_code, 200)
+        return [query['sql'] for query in queries.captured_queries
+                if 'django_session' in query['sql'] or '"auth_user"' in query['sql']]
+
+    def test_page_view_skips_session_and_user_rows(self):
+        """
+        A warm authenticated request neither reads nor writes the session or user rows.
+        """
+        self.assertEqual(self.session_queries(), [])
+
+    def test_saving_user_drops_cached_copy(self):
+        """
+        Deactivating a user takes effect on the next request despite the cache.
+        """
+        self.user.is_active = False
+        self.user.save()
+        response = self.client.get(reverse('show_user_profile'))
+        self.assertEqual(response.status_code, 302)
+        self.assertIn(reverse('login'), response['Location'])
@@ -0,0 +1,299 @@
+"""
+File: uploads.py
+Author: Anthony Xie
+Email: xiea@bu.edu
+Description: Chunked, resumable photo uploads for Mini Insta posts.
+
+A single multipart POST of several large photos ties up a worker for the
+whole transfer and has to start over if the connection drops. Instead the
+create post page uploads each photo in chunks of at most MAX_CHUNK_BYTES:
+
+1. start_upload() records a PhotoUpload with the file's size and SHA-256,
+   creating a draft Post to attach it to if the client has none yet.
+2. Each chunk is streamed straight from the request to the upload's partial
+   file on disk at its offset, in small reads, and hashed on the way. A
+   chunk whose hash does not match the checksum the client sent is cut off
+   again, so the client can resend it. The received byte count is the
+   offset an interrupted upload resumes from.
+3. When the last chunk arrives, the whole file is hashed again from disk
+   and checked against the declared digest and decoded as an image. It
+   then becomes a Photo of the draft, moved into content-addressed storage
+   without being copied.
+
+Publishing the draft from the create post form makes it visible.
+Memory use stays flat however large the file is, since no more than one
+read buffer of it is held at a time. Uploads and drafts nobody finished
+are removed by the expire_uploads management command.
+"""
+
+import hashlib
+import os
+import re
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.utils import timezone
+from PIL import Image
+
+from .models import Post, Photo, PhotoUpload
+from .purge import tombstone_post
+
+# Largest chunk accepted in one request
+MAX_CHUNK_BYTES = 8 * 1024 * 1024
+
+# Chunk size suggested to clients
+CHUNK_SIZE = 2 * 1024 * 1024
+
+# Largest photo accepted
+MAX_UPLOAD_BYTES = 50 * 1024 * 1024
+
+# Most photos one draft post can hold
+MAX_PHOTOS_PER_POST = 20
+
+# Bytes read from the request or the disk at a time
+READ_SIZE = 64 * 1024
+
+# Age after which unfinished uploads and drafts are removed
+UPLOAD_EXPIRY = timedelta(hours=24)
+
+SHA256_RE = re.compile(r'[0-9a-f]{64}')
+
+
+class UploadError(Exception):
+    """
+    Raised when an upload request cannot be accepted.
+    """
+    def __init__(self, message, status=400, offset=None):
+        """
+        Store the error message, HTTP status and the offset to resume from.
+
+        Parameters:
+            message: The error message returned to the client.
+            status: The HTTP status code.
+            offset: The number of bytes received, for offset mismatches.
+        """
+        super().__init__(message)
+        self.status = status
+        self.offset = offset
+
+
+def _upload_dir():
+    """
+    Return the directory partial files are written to.
+    """
+    return str(getattr(settings, 'CHUNKED_UPLOAD_DIR', os.path.join(settings.BASE_DIR, 'uploads')))
+
+
+def part_path(upload):
+    """
+    Return the path of an upload's partial file.
+
+    Parameters:
+        upload: The PhotoUpload.
+
+    Returns:
+        str: The file path.
+    """
+    return os.path.join(_upload_dir(), f'{upload.pk}.part')
+
+
+def remove_part_file(path):
+    """
+    Delete an upload's partial file if it exists.
+
+    Parameters:
+        path: The file path, from part_path().
+    """
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def start_upload(profile, filename, size, sha256, post_id=None):
+    """
+    Record a new upload, attached to a draft post of the profile.
+
+    Parameters:
+        profile: The uploading Profile.
+        filename: The original file name.
+        size: The file size in bytes.
+        sha256: The hex SHA-256 of the whole file.
+        post_id: The draft to add the photo to, or None to start a new draft.
+
+    Returns:
+        PhotoUpload: The new upload.
+
+    Raises:
+        UploadError: If the request is invalid.
+    """
+    if not isinstance(filename, str) or not filename.strip():
+        raise UploadError('A filename is required.')
+    if not isinstance(size, int) or isinstance(size, bool) or not 0 < size <= MAX_UPLOAD_BYTES:
+        raise UploadError(f'The size must be between 1 and {MAX_UPLOAD_BYTES} bytes.')
+    if not isinstance(sha256, str) or not SHA256_RE.fullmatch(sha256):
+        raise UploadError('The sha256 must be 64 lowercase hex digits.')
+
+    with transaction.atomic():
+        if post_id is None:
+            post = Post.objects.create(profile=profile, draft=True)
+        else:
+            post = Post.all_objects.filter(pk=post_id, profile=profile, draft=True, deleted=False).first()
+            if post is None:
+                raise UploadError('No such draft post.', status=404)
+            if post.uploads.count() >= MAX_PHOTOS_PER_POST:
+                raise UploadError(f'A post may have at most {MAX_PHOTOS_PER_POST} photos.')
+        return PhotoUpload.objects.create(
+            post=post, filename=os.path.basename(filename.strip())[:255], size=size, sha256=sha256,
+        )
+
+
+def get_upload(upload_id, profile):
+    """
+    Return an upload of the profile.
+
+    Parameters:
+        upload_id: The UUID of the upload.
+        profile: The uploading Profile.
+
+    Returns:
+        PhotoUpload: The upload.
+
+    Raises:
+        UploadError: If the profile has no such upload.
+    """
+    upload = PhotoUpload.objects.select_related('post').filter(
+        pk=upload_id, post__profile=profile, post__deleted=False,
+    ).first()
+    if upload is None:
+        raise UploadError('No such upload.', status=404)
+    return upload
+
+
+def write_chunk(upload, offset, length, stream, checksum):
+    """
+    Append one chunk to an upload's partial file, completing the upload with
+    the last chunk.
+
+    Parameters:
+        upload: The PhotoUpload.
+        offset: The byte offset of the chunk, which must equal the bytes received.
+        length: The chunk size in bytes.
+        stream: A file-like object the chunk is read from.
+        checksum: The hex SHA-256 of the chunk.
+
+    Returns:
+        PhotoUpload: The upload, with its received count and photo updated.
+
+    Raises:
+        UploadError: If the chunk is out of place, too large or corrupt.
+    """
+    if upload.photo_id is not None:
+        raise UploadError('The upload is already complete.', status=409, offset=upload.received)
+    if offset != upload.received:
+        raise UploadError('The offset does not match the bytes received.', status=409, offset=upload.received)
+    if not 0 < length <= MAX_CHUNK_BYTES or offset + length > upload.size:
+        raise UploadError(f'Chunks must be 1 to {MAX_CHUNK_BYTES} bytes and end within the file.')
+    if not isinstance(checksum, str) or not SHA256_RE.fullmatch(checksum):
+        raise UploadError('Each chunk needs a sha256 checksum.')
+
+    os.makedirs(_upload_dir(), exist_ok=True)
+    path = part_path(upload)
+    hasher = hashlib.sha256()
+    written = 0
+    with open(os.open(path, os.O_RDWR | os.O_CREAT, 0o600), 'r+b') as part_file:
+        part_file.seek(offset)
+        while written < length:
+            data = stream.read(min(READ_SIZE, length - written))
+            if not data:
+                break
+            hasher.update(data)
+            part_file.write(data)
+            written += len(data)
+        if written != length or hasher.hexdigest() != checksum:
+            # Drop the bad chunk so the client can send it again
+            part_file.truncate(offset)
+            raise UploadError('The chunk is incomplete or does not match its checksum.', offset=offset)
+        part_file.truncate(offset + length)
+
+    # Only the request that advanced the offset counts the chunk
+    if not PhotoUpload.objects.filter(pk=upload.pk, received=offset).update(received=offset + length):
+        upload.refresh_from_db()
+        raise UploadError('Another request wrote this chunk.', status=409, offset=upload.received)
+    upload.received = offset + length
+    if upload.received == upload.size:
+        complete_upload(upload)
+    return upload
+
+
+def _file_digest(path):
+    """
+    Return the hex SHA-256 of a file, reading it in small pieces.
+    """
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for data in iter(lambda: file.read(READ_SIZE), b''):
+            hasher.update(data)
+    return hasher.hexdigest()
+
+
+def complete_upload(upload):
+    """
+    Check a fully received file and attach it to the draft as a Photo.
+    A file that fails the checks is discarded, and the upload restarts from
+    the beginning.
+
+    Parameters:
+        upload: The PhotoUpload whose bytes have all been received.
+
+    Raises:
+        UploadError: If the file does not match its digest or is not an image.
+    """
+    path = part_path(upload)
+    digest = _file_digest(path)
+    try:
+        if digest != upload.sha256:
+            raise UploadError('The file does not match its sha256; upload it again.', offset=0)
+        try:
+            with Image.open(path) as image:
+                image.verify()
+        except Exception as error:
+            raise UploadError(f'The file is not an image Pillow can read: {error}', offset=0) from error
+    except UploadError:
+        remove_part_file(path)
+        PhotoUpload.objects.filter(pk=upload.pk).update(received=0)
+        upload.received = 0
+        raise
+
+    with open(path, 'rb') as part_file:
+        content = File(part_file, name=upload.filename)
+        # Lets content-addressed storage move the file instead of hashing and copying it
+        content.sha256 = digest
+        content.temporary_file_path = lambda: path
+        with transaction.atomic():
+            upload.photo = Photo.objects.create(post=upload.post, image_file=content)
+            upload.save(update_fields=['photo'])
+
+
+def expire_uploads(max_age=UPLOAD_EXPIRY):
+    """
+    Remove unfinished uploads and draft posts older than max_age.
+    Drafts are tombstoned and purged like deleted posts, which releases
+    their photos; partial files are deleted with their uploads.
+
+    Parameters:
+        max_age: A timedelta.
+
+    Returns:
+        tuple: The number of uploads and drafts removed.
+    """
+    cutoff = timezone.now() - max_age
+    drafts = list(Post.all_objects.filter(draft=True, deleted=False, timestamp__lt=cutoff))
+    for post in drafts:
+        tombstone_post(post)
+    uploads, _ = PhotoUpload.objects.filter(
+        photo__isnull=True, created__lt=cutoff, post__deleted=False,
+    ).delete()
+    return uploads, len(drafts)
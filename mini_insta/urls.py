@@ -8,7 +8,7 @@ Maps URL patterns to view functions for profile-related pages.
 
 from django.urls import path
 from django.contrib.auth import views as auth_views
-from . import views
+from . import views, api
 
 urlpatterns = [
     # Public views (no login required)
@@ -17,6 +17,12 @@ urlpatterns = [
     path('profile/<int:pk>/followers/', views.ShowFollowersDetailView.as_view(), name='show_followers'),
     path('profile/<int:pk>/following/', views.ShowFollowingDetailView.as_view(), name='show_following'),
     path('post/<int:pk>/', views.PostDetailView.as_view(), name='post_detail'),
+    path('post/<int:pk>/comments/', views.PostCommentsView.as_view(), name='post_comments'),
+    path('post/<int:pk>/events/', views.PostEventsView.as_view(), name='post_events'),
+    path('explore/', views.ExploreView.as_view(), name='explore'),
+    path('hashtag/<str:tag>/', views.TagView.as_view(prefix='#'), name='hashtag'),
+    path('mention/<str:tag>/', views.TagView.as_view(prefix='@'), name='mention'),
+    path('image/<str:token>/', views.ImageProxyView.as_view(), name='image_proxy'),
 
     # Authentication views
     path('login/', auth_views.LoginView.as_view(template_name='mini_insta/login.html'), name='login'),
@@ -29,6 +35,7 @@ urlpatterns = [
     path('profile/update/', views.UpdateProfileView.as_view(), name='update_profile'),
     path('profile/create_post/', views.CreatePostView.as_view(), name='create_post'),
     path('profile/feed/', views.NewsFeedView.as_view(), name='news_feed'),
+    path('profile/feed/events/', views.FeedEventsView.as_view(), name='feed_events'),
     path('profile/search/', views.SearchView.as_view(), name='search'),
 
     # Post management (login required)
@@ -41,4 +48,17 @@ urlpatterns = [
     path('post/<int:pk>/comment/', views.CreateCommentView.as_view(), name='create_comment'),
     path('post/<int:pk>/like/', views.CreateLikeView.as_view(), name='create_like'),
     path('post/<int:pk>/delete_like/', views.DeleteLikeView.as_view(), name='delete_like'),
-]
+
+    # JSON API
+    path('api/profiles/', api.ProfileListApiView.as_view(), name='api_profiles'),
+    path('api/profiles/<int:pk>/', api.ProfileDetailApiView.as_view(), name='api_profile'),
+    path('api/posts/', api.PostListApiView.as_view(), name='api_posts'),
+    path('api/posts/<int:pk>/', api.PostDetailApiView.as_view(), name='api_post'),
+    path('api/posts/<int:pk>/comments/', api.CommentListApiView.as_view(), name='api_comments'),
+    path('api/feed/', api.FeedApiView.as_view(), name='api_feed'),
+    path('api/search/', api.SearchApiView.as_view(), name='api_search'),
+    path('api/follows/', api.BulkFollowView.as_view(), name='api_bulk_follow'),
+    path('api/likes/', api.BulkLikeView.as_view(), name='api_bulk_like'),
+    path('api/uploads/', api.UploadStartView.as_view(), name='api_uploads'),
+    path('api/uploads/<uuid:pk>/', api.UploadChunkView.as_view(), name='api_upload'),
+]
\ No newline at end of file
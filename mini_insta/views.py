@@ -7,15 +7,39 @@ Contains views for displaying profile lists and individual profiles.
 """
 
 from django.shortcuts import render, redirect, get_object_or_404
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse, Http404
+from django.core.handlers.asgi import ASGIRequest
 from django.views.generic import ListView, DetailView, CreateView, UpdateView, DeleteView, View, TemplateView
 from django.urls import reverse
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth import login
 from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+from django.db import transaction
 from django.db.models import Q
-from .models import Profile, Post, Photo, Follow, Comment, Like
+from django.template.loader import render_to_string
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
+from .models import Profile, Post, Photo, Follow, Comment, Like, TagEntry
 from .forms import CreateProfileForm, UpdateProfileForm, UpdatePostForm
+from . import ranking
+from .conditional import profile_etag, profile_last_modified, post_etag, post_last_modified
+from .graph import get_suggested_profiles
+from .coalesce import pending_like_state, set_like
+from .pagination import PAGE_SIZE, keyset_page, parse_cursor, time_keyset_page, parse_time_cursor
+from .ratelimit import RateLimitMixin
+from . import directory
+from .purge import tombstone_post
+from .tags import normalize_tag, extract_tags
+from .events import event_bus, event_stream, publish_post, publish_comment
+from .imageproxy import BROWSER_CACHE_SECONDS, ImageFetchError, get_image, read_token
+
+# Number of comments rendered per page on the post detail page
+COMMENTS_PAGE_SIZE = 20
+
+# Number of posts and comments shown per page of a hashtag or mention
+TAG_PAGE_SIZE = 24
 
 
 class CustomLoginRequiredMixin(LoginRequiredMixin):
@@ -48,16 +72,97 @@ class CustomLoginRequiredMixin(LoginRequiredMixin):
 
 class ProfileListView(ListView):
     """
-    View to display all profiles.
+    View to display the paginated profile directory.
+    Rendered pages are cached until a profile changes (see mini_insta.directory).
     """
     model = Profile
     template_name = 'mini_insta/show_all_profiles.html'
     context_object_name = 'profiles'
+    paginate_by = directory.PAGE_SIZE
+
+    def get_sort(self):
+        """
+        Return the requested sort order, falling back to the default.
+
+        Returns:
+            str: A key of directory.SORTS.
+        """
+        sort = self.request.GET.get('sort')
+        return sort if sort in directory.SORTS else directory.DEFAULT_SORT
+
+    def get_queryset(self):
+        """
+        Return the profiles in directory order with only the displayed columns.
+
+        Returns:
+            QuerySet: The ordered, projected profiles.
+        """
+        label, ordering = directory.SORTS[self.get_sort()]
+        return (Profile.objects
+                .only('pk', 'username', 'display_name', 'profile_image_url', 'bio_preview', 'join_date')
+                .order_by(*ordering))
+
+    def get(self, request, *args, **kwargs):
+        """
+        Serve the directory page from the cache, rendering it on a miss.
+
+        Parameters:
+            request: The HTTP request.
+            *args: Additional positional arguments.
+            **kwargs: Additional keyword arguments.
+
+        Returns:
+            HttpResponse: The directory page.
+        """
+        sort = self.get_sort()
+        page = request.GET.get('page', '1')
+        # Only cache canonical page numbers, so junk values cannot fill the cache
+        key = directory.page_cache_key(sort, page) if page.isdigit() and not page.startswith('0') else None
+
+        directory_html = cache.get(key) if key else None
+        if directory_html is None:
+            self.object_list = self.get_queryset()
+            context = self.get_context_data()
+            context['current_sort'] = sort
+            # Rendered without the request so nothing user-specific is cached
+            directory_html = render_to_string('mini_insta/profile_directory.html', context)
+            if key:
+                cache.set(key, directory_html, directory.CACHE_SECONDS)
+
+        return render(request, self.template_name, {
+            'directory_html': directory_html,
+            'sorts': [(name, label) for name, (label, ordering) in directory.SORTS.items()],
+            'current_sort': sort,
+        })
+
+
+class ExploreView(TemplateView):
+    """
+    View to display the highest ranked posts and profiles.
+    """
+    template_name = 'mini_insta/explore.html'
+
+    def get_context_data(self, **kwargs):
+        """
+        Add the top posts and profiles from the Explore score tables.
+
+        Parameters:
+            **kwargs: Additional keyword arguments.
+
+        Returns:
+            dict: Context dictionary with ranked posts and profiles.
+        """
+        context = super().get_context_data(**kwargs)
+        context['top_posts'] = ranking.top_posts()
+        context['top_profiles'] = ranking.top_profiles()
+        return context
 
 
+@method_decorator(condition(etag_func=profile_etag, last_modified_func=profile_last_modified), name='get')
 class ProfileDetailView(DetailView):
     """
     View to display a single profile.
+    Answers 304 Not Modified when the client's cached copy is still current.
     """
     model = Profile
     template_name = 'mini_insta/show_profile.html'
@@ -84,6 +189,7 @@ class ProfileDetailView(DetailView):
         else:
             context['user_profile'] = None
 
+        context['suggested_profiles'] = get_suggested_profiles(context['user_profile'])
         return context
 
 
@@ -116,26 +222,38 @@ class ShowUserProfileView(CustomLoginRequiredMixin, DetailView):
         """
         context = super().get_context_data(**kwargs)
         context['user_profile'] = self.object
+        context['suggested_profiles'] = get_suggested_profiles(self.object)
         return context
 
 
+@method_decorator(condition(etag_func=post_etag, last_modified_func=post_last_modified), name='get')
 class PostDetailView(DetailView):
     """
     View to display a single post with all its details.
+    Answers 304 Not Modified when the client's cached copy is still current.
     """
     model = Post
     template_name = 'mini_insta/post_detail.html'
     context_object_name = 'post'
 
+    def get_queryset(self):
+        """
+        Load the post's profile in the same query as the post.
+
+        Returns:
+            QuerySet: Posts with their profile selected.
+        """
+        return Post.objects.select_related('profile')
+
     def get_context_data(self, **kwargs):
         """
-        Add user profile to context if authenticated.
+        Add user profile, like state and the latest page of comments to context.
 
         Parameters:
             **kwargs: Additional keyword arguments.
 
         Returns:
-            dict: Context dictionary with user profile data.
+            dict: Context dictionary with user profile and comment data.
         """
         context = super().get_context_data(**kwargs)
 
@@ -147,6 +265,112 @@ class PostDetailView(DetailView):
         else:
             context['user_profile'] = None
 
+        # Include likes and unlikes that are still waiting to be written
+        context['like_count'], context['viewer_likes'] = pending_like_state(self.object, context['user_profile'])
+
+        # Only the newest comments are rendered; older ones load on demand
+        comments, next_cursor = keyset_page(
+            Comment.objects.filter(post=self.object).select_related('profile'),
+            'pk', None, COMMENTS_PAGE_SIZE
+        )
+        context['comments'] = comments
+        context['next_cursor'] = next_cursor
+        return context
+
+
+class PostCommentsView(View):
+    """
+    View to render one older page of a post's comments as an HTML fragment.
+    Used by the "Load more comments" link on the post detail page.
+    """
+    def get(self, request, pk):
+        """
+        Handle GET request for a page of comments.
+
+        Parameters:
+            request: The HTTP request.
+            pk: The primary key of the post.
+
+        Returns:
+            HttpResponse: The rendered comment list fragment.
+        """
+        post = get_object_or_404(Post, pk=pk)
+        comments, next_cursor = keyset_page(
+            Comment.objects.filter(post=post).select_related('profile'),
+            'pk', parse_cursor(request.GET.get('after')), COMMENTS_PAGE_SIZE
+        )
+        return render(request, 'mini_insta/comment_list.html', {
+            'post': post,
+            'comments': comments,
+            'next_cursor': next_cursor,
+        })
+
+
+class ImageProxyView(View):
+    """
+    View to serve an external image through the image proxy, resized and cached.
+    If the image cannot be fetched, the client is sent to the original URL.
+    """
+    def get(self, request, token):
+        """
+        Handle GET request for a proxied image.
+
+        Parameters:
+            request: The HTTP request.
+            token: The signed URL and width from proxy_url.
+
+        Returns:
+            FileResponse: The resized image, or a redirect to the original.
+        """
+        source = read_token(token)
+        if source is None:
+            raise Http404('No such image')
+        url, width = source
+        try:
+            path = get_image(url, width)
+            image = open(path, 'rb')
+        except (ImageFetchError, FileNotFoundError):
+            # FileNotFoundError: another process evicted the file in between
+            return redirect(url)
+
+        response = FileResponse(image, content_type='image/png' if path.endswith('.png') else 'image/jpeg')
+        # The URL names the source and width, so its contents never change
+        response['Cache-Control'] = f'public, max-age={BROWSER_CACHE_SECONDS}, immutable'
+        return response
+
+
+class TagView(TemplateView):
+    """
+    View to display the posts and comments using a hashtag or mentioning a profile.
+    Pages are read from the tag index newest first, using a cursor.
+    """
+    template_name = 'mini_insta/tag.html'
+    # '#' for hashtag pages, '@' for mention pages
+    prefix = '#'
+
+    def get_context_data(self, **kwargs):
+        """
+        Add one page of the tag's entries.
+
+        Parameters:
+            **kwargs: Additional keyword arguments, including the tag from the URL.
+
+        Returns:
+            dict: Context dictionary with the tag, its entries and the next cursor.
+        """
+        context = super().get_context_data(**kwargs)
+        tag = normalize_tag(self.prefix, self.kwargs['tag'])
+        entries, next_cursor = time_keyset_page(
+            TagEntry.objects.filter(tag=tag, post__deleted=False)
+                .select_related('post__profile', 'comment__profile')
+                .prefetch_related('post__photos'),
+            parse_time_cursor(self.request.GET.get('after')), TAG_PAGE_SIZE
+        )
+        context['tag'] = tag
+        context['entries'] = entries
+        context['next_cursor'] = next_cursor
+        if self.prefix == '@':
+            context['mentioned_profile'] = Profile.objects.filter(username__iexact=tag[1:]).first()
         return context
 
 
@@ -167,9 +391,23 @@ class CreatePostView(CustomLoginRequiredMixin, CreateView):
         """
         return reverse('show_user_profile')
 
+    def get_draft(self):
+        """
+        Return the draft post named by the form, whose photos were uploaded in chunks.
+
+        Returns:
+            Post: The user's draft, or None if the photos were sent with the form.
+        """
+        draft_id = self.request.POST.get('draft', '')
+        if not draft_id.isdigit():
+            return None
+        return get_object_or_404(Post.all_objects, pk=draft_id, draft=True, deleted=False,
+                                 profile__user=self.request.user)
+
     def form_valid(self, form):
         """
         Process the form and save the post and photos.
+        A post whose photos were uploaded in chunks is published from its draft.
 
         Parameters:
             form: The validated form instance.
@@ -177,6 +415,14 @@ class CreatePostView(CustomLoginRequiredMixin, CreateView):
         Returns:
             HttpResponse: The response after successful form processing.
         """
+        draft = self.get_draft()
+        if draft is not None:
+            draft.caption = form.cleaned_data['caption']
+            draft.publish()
+            self.object = draft
+            publish_post(draft)
+            return redirect(self.get_success_url())
+
         # Get the user's profile
         profile = Profile.objects.get(user=self.request.user)
 
@@ -196,6 +442,9 @@ class CreatePostView(CustomLoginRequiredMixin, CreateView):
                 image_file=image_file
             )
 
+        # Push the new post to followers with the feed open
+        publish_post(self.object)
+
         return response
 
 
@@ -274,6 +523,19 @@ class DeletePostView(CustomLoginRequiredMixin, DeleteView):
         profile = Profile.objects.get(user=self.request.user)
         return Post.objects.filter(profile=profile)
 
+    def form_valid(self, form):
+        """
+        Hide the post at once and leave deleting its rows to the background purge.
+
+        Parameters:
+            form: The validated confirmation form.
+
+        Returns:
+            HttpResponse: A redirect to the success URL.
+        """
+        tombstone_post(self.object)
+        return redirect(self.get_success_url())
+
     def get_success_url(self):
         """
         Redirect to the user's profile page after deleting.
@@ -284,29 +546,85 @@ class DeletePostView(CustomLoginRequiredMixin, DeleteView):
         return reverse('show_user_profile')
 
 
-class ShowFollowersDetailView(DetailView):
+class FollowListMixin:
+    """
+    Mixin for DetailViews that list one page of a profile's follow relationships.
+    Pages are fetched with keyset cursors, and the follow-back state for the
+    logged-in viewer is loaded for the whole page in one query.
+    """
+    paginate_by = PAGE_SIZE
+    list_context_name = 'profile_list'
+    # Name of the Profile method returning the profiles to list
+    profile_list_method = 'get_followers'
+
+    def get_profile_list(self):
+        """
+        Return the QuerySet of profiles to list, annotated with follow_id.
+
+        Returns:
+            QuerySet: The result of profile_list_method on self.object.
+        """
+        return getattr(self.object, self.profile_list_method)()
+
+    def get_context_data(self, **kwargs):
+        """
+        Add one page of profiles and the cursor of the next page to context.
+
+        Parameters:
+            **kwargs: Additional keyword arguments.
+
+        Returns:
+            dict: Context dictionary with the page of profiles.
+        """
+        context = super().get_context_data(**kwargs)
+
+        user_profile = None
+        if self.request.user.is_authenticated:
+            user_profile = Profile.objects.filter(user=self.request.user).first()
+
+        cursor = parse_cursor(self.request.GET.get('after'))
+        profiles, next_cursor = keyset_page(self.get_profile_list(), 'follow_id', cursor, self.paginate_by)
+
+        # Load the viewer's follow state for the whole page at once
+        followed_ids = Follow.followed_ids(user_profile, profiles)
+        for listed_profile in profiles:
+            listed_profile.viewer_follows = listed_profile.pk in followed_ids
+
+        context[self.list_context_name] = profiles
+        context['next_cursor'] = next_cursor
+        context['user_profile'] = user_profile
+        return context
+
+
+class ShowFollowersDetailView(FollowListMixin, DetailView):
     """
-    View to display all followers of a profile.
+    View to display the followers of a profile, one page at a time.
     """
     model = Profile
     template_name = 'mini_insta/show_followers.html'
     context_object_name = 'profile'
+    list_context_name = 'followers'
+    profile_list_method = 'get_followers'
 
 
-class ShowFollowingDetailView(DetailView):
+class ShowFollowingDetailView(FollowListMixin, DetailView):
     """
-    View to display all profiles that a profile is following.
+    View to display the profiles that a profile is following, one page at a time.
     """
     model = Profile
     template_name = 'mini_insta/show_following.html'
     context_object_name = 'profile'
+    list_context_name = 'following_profiles'
+    profile_list_method = 'get_following'
 
 
-class CreateFollowView(CustomLoginRequiredMixin, View):
+class CreateFollowView(CustomLoginRequiredMixin, RateLimitMixin, View):
     """
     View to create a follow relationship.
     """
-    def dispatch(self, request, *args, **kwargs):
+    rate_limit_scope = 'follow'
+
+    def post(self, request, *args, **kwargs):
         """
         Handle the follow request.
 
@@ -319,24 +637,29 @@ class CreateFollowView(CustomLoginRequiredMixin, View):
             HttpResponse: Redirect to the profile page.
         """
         profile_to_follow = get_object_or_404(Profile, pk=kwargs['pk'])
-        follower_profile = Profile.objects.get(user=request.user)
 
-        # Prevent users from following themselves
-        if profile_to_follow != follower_profile:
-            # Create follow relationship if it doesn't exist
-            Follow.objects.get_or_create(
-                profile=profile_to_follow,
-                follower_profile=follower_profile
-            )
+        with transaction.atomic():
+            # Lock the follower like the batch endpoint does, so the two never interleave
+            follower_profile = Profile.objects.select_for_update().get(user=request.user)
+
+            # Prevent users from following themselves
+            if profile_to_follow != follower_profile:
+                # Create follow relationship if it doesn't exist
+                Follow.objects.get_or_create(
+                    profile=profile_to_follow,
+                    follower_profile=follower_profile
+                )
 
         return redirect('profile', pk=kwargs['pk'])
 
 
-class DeleteFollowView(CustomLoginRequiredMixin, View):
+class DeleteFollowView(CustomLoginRequiredMixin, RateLimitMixin, View):
     """
     View to remove a follow relationship.
     """
-    def dispatch(self, request, *args, **kwargs):
+    rate_limit_scope = 'follow'
+
+    def post(self, request, *args, **kwargs):
         """
         Handle the unfollow request.
 
@@ -360,10 +683,14 @@ class DeleteFollowView(CustomLoginRequiredMixin, View):
         return redirect('profile', pk=kwargs['pk'])
 
 
-class CreateCommentView(CustomLoginRequiredMixin, View):
+class CreateCommentView(CustomLoginRequiredMixin, RateLimitMixin, View):
     """
     View to create a comment on a post.
     """
+    rate_limit_scope = 'comment'
+    rate_limit_capacity = 10
+    rate_limit_refill_rate = 0.2
+
     def post(self, request, pk):
         """
         Handle POST request to create a comment.
@@ -380,20 +707,24 @@ class CreateCommentView(CustomLoginRequiredMixin, View):
         comment_text = request.POST.get('comment_text')
 
         if comment_text:
-            Comment.objects.create(
+            comment = Comment.objects.create(
                 post=post,
                 profile=profile,
                 text=comment_text
             )
+            publish_comment(comment)
 
         return redirect('post_detail', pk=pk)
 
 
-class CreateLikeView(CustomLoginRequiredMixin, View):
+class CreateLikeView(CustomLoginRequiredMixin, RateLimitMixin, View):
     """
     View to create a like on a post.
+    The write is coalesced with other like/unlike requests for the same post.
     """
-    def dispatch(self, request, *args, **kwargs):
+    rate_limit_scope = 'like'
+
+    def post(self, request, *args, **kwargs):
         """
         Handle the like request.
 
@@ -409,21 +740,21 @@ class CreateLikeView(CustomLoginRequiredMixin, View):
         profile = Profile.objects.get(user=request.user)
 
         # Prevent users from liking their own posts
-        if post.profile != profile:
-            # Create like if it doesn't exist
-            Like.objects.get_or_create(
-                post=post,
-                profile=profile
-            )
+        if post.profile_id != profile.pk:
+            # Create like if it doesn't exist once the toggles settle
+            set_like(profile.pk, post.pk, True)
 
         return redirect('post_detail', pk=kwargs['pk'])
 
 
-class DeleteLikeView(CustomLoginRequiredMixin, View):
+class DeleteLikeView(CustomLoginRequiredMixin, RateLimitMixin, View):
     """
     View to remove a like from a post.
+    The write is coalesced with other like/unlike requests for the same post.
     """
-    def dispatch(self, request, *args, **kwargs):
+    rate_limit_scope = 'like'
+
+    def post(self, request, *args, **kwargs):
         """
         Handle the unlike request.
 
@@ -438,11 +769,8 @@ class DeleteLikeView(CustomLoginRequiredMixin, View):
         post = get_object_or_404(Post, pk=kwargs['pk'])
         profile = Profile.objects.get(user=request.user)
 
-        # Delete like if it exists
-        Like.objects.filter(
-            post=post,
-            profile=profile
-        ).delete()
+        # Delete like if it exists once the toggles settle
+        set_like(profile.pk, post.pk, False)
 
         return redirect('post_detail', pk=kwargs['pk'])
 
@@ -486,9 +814,104 @@ class NewsFeedView(CustomLoginRequiredMixin, DetailView):
 
         context['feed_posts'] = feed_posts
         context['user_profile'] = self.object
+        context['suggested_profiles'] = get_suggested_profiles(self.object)
         return context
 
 
+class EventStreamView(View):
+    """
+    Base view streaming Server-Sent Events for a set of event bus topics.
+    The connection is held open by an async view, so it only works when the
+    site is served through ASGI; under WSGI it answers 204 No Content, which
+    tells the browser to stop reconnecting.
+    """
+    # Topics streamed to every client; views whose topics depend on the request override get_topics
+    topics = None
+
+    async def get_topics(self, request, **kwargs):
+        """
+        Return the topics to stream.
+
+        Parameters:
+            request: The HTTP request.
+            **kwargs: The URL keyword arguments.
+
+        Returns:
+            list: Topic names, or None to refuse the stream.
+        """
+        return self.topics
+
+    async def get(self, request, **kwargs):
+        """
+        Handle GET request to open an event stream.
+
+        Parameters:
+            request: The HTTP request.
+            **kwargs: The URL keyword arguments.
+
+        Returns:
+            HttpResponse: The event stream, or 204 if no stream is available.
+        """
+        if not isinstance(request, ASGIRequest):
+            return HttpResponse(status=204)
+        topics = await self.get_topics(request, **kwargs)
+        if not topics:
+            return HttpResponse(status=204)
+
+        response = StreamingHttpResponse(
+            event_stream(event_bus.subscribe(topics)), content_type='text/event-stream'
+        )
+        response['Cache-Control'] = 'no-cache'
+        # Stop nginx from buffering the stream
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+
+class FeedEventsView(EventStreamView):
+    """
+    View streaming new posts, comments and like counts for the viewer's news feed.
+    """
+    async def get_topics(self, request, **kwargs):
+        """
+        Subscribe to the viewer's own profile and every profile it follows.
+
+        Parameters:
+            request: The HTTP request.
+            **kwargs: The URL keyword arguments.
+
+        Returns:
+            list: Profile topic names, or None if the viewer has no profile.
+        """
+        user = await request.auser()
+        if not user.is_authenticated:
+            return None
+        profile = await Profile.objects.filter(user=user).afirst()
+        if profile is None:
+            return None
+        followed = Follow.objects.filter(follower_profile=profile).values_list('profile_id', flat=True)
+        return [f'profile:{profile.pk}'] + [f'profile:{profile_id}' async for profile_id in followed]
+
+
+class PostEventsView(EventStreamView):
+    """
+    View streaming new comments and like counts for one post.
+    """
+    async def get_topics(self, request, pk):
+        """
+        Subscribe to the post's topic.
+
+        Parameters:
+            request: The HTTP request.
+            pk: The primary key of the post.
+
+        Returns:
+            list: The post's topic name.
+        """
+        if not await Post.objects.filter(pk=pk).aexists():
+            raise Http404('No post found')
+        return [f'post:{pk}']
+
+
 class SearchView(CustomLoginRequiredMixin, ListView):
     """
     View to search for profiles by username or display name.
@@ -497,6 +920,23 @@ class SearchView(CustomLoginRequiredMixin, ListView):
     template_name = 'mini_insta/search.html'
     context_object_name = 'profiles'
 
+    def get(self, request, *args, **kwargs):
+        """
+        Send a search for a single hashtag or mention to its tag page.
+
+        Parameters:
+            request: The HTTP request.
+
+        Returns:
+            HttpResponse: A redirect to the tag page, or the search results.
+        """
+        query = request.GET.get('q', '').strip()
+        tags = extract_tags(query)
+        if len(tags) == 1 and query.lower() in tags:
+            tag = tags.pop()
+            return redirect('hashtag' if tag[0] == '#' else 'mention', tag[1:])
+        return super().get(request, *args, **kwargs)
+
     def get_queryset(self):
         """
         Filter profiles based on search query.
@@ -582,7 +1022,7 @@ class CreateProfileView(CreateView):
             form.instance.user = user
 
             # Log the user in
-            login(self.request, user, backend='django.contrib.auth.backends.ModelBackend')
+            login(self.request, user, backend='mini_insta.backends.CachedModelBackend')
 
             # Delegate to superclass to save Profile
             return super().form_valid(form)
@@ -1,4 +1,9 @@
 from django.shortcuts import render
+from django.templatetags.static import static
+from django.template.loader import get_template
+from django.views.decorators.http import condition
+from functools import lru_cache
+import hashlib
 import random
 
 # Lists of quotes and images from Albert Einstein
@@ -23,6 +28,15 @@ def quote(request):
     }
     return render(request, 'quotes/quote.html', context)
 
+@lru_cache(maxsize=None)
+def show_all_etag():
+    """Weak ETag for show_all; the quotes, images, templates and stylesheet only change on deploy."""
+    sources = [get_template(name).template.source for name in ('quotes/show_all.html', 'quotes/base.html')]
+    # The stylesheet URL is content-hashed in production
+    sources.append(static('quotes/css/base.css'))
+    return 'W/"%s"' % hashlib.md5('\n'.join(quotes + images + sources).encode()).hexdigest()
+
+@condition(etag_func=lambda request: show_all_etag())
 def show_all(request):
     context = {
         'quotes': quotes,
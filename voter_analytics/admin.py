@@ -5,15 +5,95 @@ Description: Admin configuration for the voter_analytics application.
 """
 
 from django.contrib import admin
-from .models import Voter
+from django.core.cache import cache
 
+from cs412.changelist import LargeTableAdminMixin
+from .models import Voter, VoterImport, VoterSummary
 
-class VoterAdmin(admin.ModelAdmin):
+# Seconds the filter choices of one import are cached
+FACET_CACHE_SECONDS = 24 * 60 * 60
+
+
+class ImportFacetFilter(admin.SimpleListFilter):
+    """List filter offering the distinct values of a Voter field, cached per import."""
+    field_name = None
+
+    def lookups(self, request, model_admin):
+        """Return the field's distinct values, scanning the table once per import."""
+        latest = VoterImport.latest()
+        key = f'voter_analytics:facets:{self.field_name}:{latest.pk if latest else 0}'
+        values = cache.get(key)
+        if values is None:
+            values = list(Voter.objects.values_list(self.field_name, flat=True)
+                          .distinct().order_by(self.field_name))
+            cache.set(key, values, FACET_CACHE_SECONDS)
+        return [(value, value.strip()) for value in values]
+
+    def queryset(self, request, queryset):
+        """Filter the voters to the chosen value."""
+        if self.value() is None:
+            return queryset
+        return queryset.filter(**{self.field_name: self.value()})
+
+
+class PartyFilter(ImportFacetFilter):
+    """Filter voters by party affiliation."""
+    title = 'party affiliation'
+    parameter_name = 'party_affiliation'
+    field_name = 'party_affiliation'
+
+
+class PrecinctFilter(ImportFacetFilter):
+    """Filter voters by precinct."""
+    title = 'precinct number'
+    parameter_name = 'precinct_number'
+    field_name = 'precinct_number'
+
+
+class VoterScoreFilter(admin.SimpleListFilter):
+    """Filter voters by voter score, whose values are known without a query."""
+    title = 'voter score'
+    parameter_name = 'voter_score'
+
+    def lookups(self, request, model_admin):
+        """Return the possible voter scores."""
+        return [(str(score), str(score)) for score in range(6)]
+
+    def queryset(self, request, queryset):
+        """Filter the voters to the chosen score."""
+        if self.value() is None:
+            return queryset
+        return queryset.filter(voter_score=self.value())
+
+
+class VoterAdmin(LargeTableAdminMixin, admin.ModelAdmin):
     """Admin configuration for Voter model."""
     list_display = ['first_name', 'last_name', 'street_number', 'street_name',
                     'date_of_birth', 'party_affiliation', 'voter_score']
-    list_filter = ['party_affiliation', 'voter_score', 'precinct_number']
-    search_fields = ['first_name', 'last_name', 'street_name']
+    list_filter = [PartyFilter, VoterScoreFilter, PrecinctFilter]
+    # Prefix searches use the case-insensitive name indexes
+    search_fields = ['^last_name', '^first_name', '^street_name']
+
+    def get_search_results(self, request, queryset, search_term):
+        """Match the search in a subquery, which SQLite answers from the name indexes rather than an id-ordered scan."""
+        matches, may_have_duplicates = super().get_search_results(request, Voter.objects.all(), search_term)
+        if not search_term:
+            return queryset, may_have_duplicates
+        return queryset.filter(pk__in=matches.values('pk')), may_have_duplicates
+
+    def estimate_count(self, request):
+        """Return the voter count recorded by the latest import."""
+        latest = VoterImport.latest()
+        return latest.voter_count if latest else super().estimate_count(request)
 
 
 admin.site.register(Voter, VoterAdmin)
+
+
+class VoterSummaryAdmin(admin.ModelAdmin):
+    """Admin configuration for VoterSummary model."""
+    list_display = ['group_type', 'group_value', 'voter_count']
+    list_filter = ['group_type']
+
+
+admin.site.register(VoterSummary, VoterSummaryAdmin)
@@ -0,0 +1,158 @@
+"""
+Name: Anthony Xie
+Email: anthoxie@bu.edu
+Description: Parallel CSV parsing for voter imports.
+
+The voter file is split into byte ranges of about chunk_size bytes, each
+ending on a line boundary, and the ranges are parsed and validated in a
+process pool. Results come back in file order to a single writer, and only
+a few chunks are in flight at a time, so memory stays proportional to the
+chunk size rather than the file size. Records must not contain embedded
+newlines, which holds for the voter export.
+
+This module does not import Django, so pool workers can start without
+setting it up.
+"""
+
+import csv
+import io
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime
+
+# Default size of one parsing chunk in bytes
+CHUNK_SIZE = 4 * 1024 * 1024
+
+# Voter fields produced for each record, in order, and their CSV columns
+VOTER_COLUMNS = [
+    ('last_name', 'Last Name'),
+    ('first_name', 'First Name'),
+    ('street_number', 'Residential Address - Street Number'),
+    ('street_name', 'Residential Address - Street Name'),
+    ('apartment_number', 'Residential Address - Apartment Number'),
+    ('zip_code', 'Residential Address - Zip Code'),
+    ('date_of_birth', 'Date of Birth'),
+    ('date_of_registration', 'Date of Registration'),
+    ('party_affiliation', 'Party Affiliation'),
+    ('precinct_number', 'Precinct Number'),
+    ('v20state', 'v20state'),
+    ('v21town', 'v21town'),
+    ('v21primary', 'v21primary'),
+    ('v22general', 'v22general'),
+    ('v23town', 'v23town'),
+    ('voter_score', 'voter_score'),
+]
+VOTER_FIELDS = [field for field, column in VOTER_COLUMNS]
+
+DATE_FIELDS = {'date_of_birth', 'date_of_registration'}
+BOOLEAN_FIELDS = {'v20state', 'v21town', 'v21primary', 'v22general', 'v23town'}
+
+
+def parse_date(text):
+    """
+    Parse a YYYY-MM-DD date, using the C fixed-format parser when possible.
+    Falls back to strptime for dates with unpadded fields such as 2001-1-5.
+    """
+    try:
+        return date.fromisoformat(text)
+    except ValueError:
+        return datetime.strptime(text, '%Y-%m-%d').date()
+
+
+def parse_record(record, indexes):
+    """
+    Convert one CSV record into a tuple of Voter field values in VOTER_FIELDS order.
+    Raises ValueError or IndexError for an invalid record.
+    """
+    values = []
+    for field, index in zip(VOTER_FIELDS, indexes):
+        text = record[index]
+        if field in DATE_FIELDS:
+            values.append(parse_date(text))
+        elif field in BOOLEAN_FIELDS:
+            values.append(text == 'TRUE')
+        elif field == 'voter_score':
+            values.append(int(text))
+        elif field == 'apartment_number':
+            values.append(text or None)
+        else:
+            values.append(text)
+    return tuple(values)
+
+
+def parse_chunk(path, start, end, indexes):
+    """
+    Parse the records in bytes [start, end) of the file.
+    Returns (rows, errors) where errors holds one message per rejected record.
+    """
+    with open(path, 'rb') as file:
+        file.seek(start)
+        data = file.read(end - start)
+
+    rows = []
+    errors = []
+    for record in csv.reader(io.StringIO(data.decode('utf-8'), newline='')):
+        if not record:
+            continue
+        try:
+            rows.append(parse_record(record, indexes))
+        except (ValueError, IndexError) as e:
+            errors.append(f"Error loading row: {e}\nRow data: {record}")
+    return rows, errors
+
+
+def read_header(path):
+    """
+    Return the column indexes of VOTER_COLUMNS and the byte offset of the first record.
+    Raises ValueError if a column is missing.
+    """
+    with open(path, 'rb') as file:
+        header_line = file.readline()
+        offset = file.tell()
+    header = next(csv.reader([header_line.decode('utf-8-sig')]))
+    header = [column.strip() for column in header]
+    missing = [column for field, column in VOTER_COLUMNS if column not in header]
+    if missing:
+        raise ValueError(f"Missing columns in {path}: {', '.join(missing)}")
+    return [header.index(column) for field, column in VOTER_COLUMNS], offset
+
+
+def chunk_ranges(path, start, chunk_size=CHUNK_SIZE):
+    """Yield (start, end) byte ranges of about chunk_size bytes that end on line boundaries."""
+    size = os.path.getsize(path)
+    with open(path, 'rb') as file:
+        while start < size:
+            file.seek(min(start + chunk_size, size))
+            # Extend the range to the end of the line it stops in
+            file.readline()
+            end = min(file.tell(), size)
+            yield start, end
+            start = end
+
+
+def parse_voter_file(path, workers=None, chunk_size=CHUNK_SIZE):
+    """
+    Parse a voter CSV file in parallel.
+    Yields (rows, errors) for each chunk in file order. With workers=1 the
+    chunks are parsed in this process.
+    """
+    indexes, offset = read_header(path)
+    ranges = chunk_ranges(path, offset, chunk_size)
+    workers = workers or os.cpu_count() or 1
+
+    if workers == 1:
+        for start, end in ranges:
+            yield parse_chunk(path, start, end, indexes)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # Keep a couple of chunks per worker in flight so parsing never waits
+        # on the writer for long, without reading ahead through the file
+        pending = deque()
+        for start, end in ranges:
+            pending.append(pool.submit(parse_chunk, path, start, end, indexes))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
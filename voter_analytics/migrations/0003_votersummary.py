@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-19 01:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('voter_analytics', '0002_voterimport'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VoterSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('group_type', models.CharField(choices=[('precinct', 'Precinct'), ('zip', 'Zip Code')], max_length=10)),
+                ('group_value', models.CharField(max_length=10)),
+                ('voter_count', models.IntegerField(default=0)),
+                ('party_counts', models.JSONField(default=dict)),
+                ('age_under_30', models.IntegerField(default=0)),
+                ('age_30_44', models.IntegerField(default=0)),
+                ('age_45_64', models.IntegerField(default=0)),
+                ('age_65_plus', models.IntegerField(default=0)),
+                ('score_0', models.IntegerField(default=0)),
+                ('score_1', models.IntegerField(default=0)),
+                ('score_2', models.IntegerField(default=0)),
+                ('score_3', models.IntegerField(default=0)),
+                ('score_4', models.IntegerField(default=0)),
+                ('score_5', models.IntegerField(default=0)),
+                ('v20state', models.IntegerField(default=0)),
+                ('v21town', models.IntegerField(default=0)),
+                ('v21primary', models.IntegerField(default=0)),
+                ('v22general', models.IntegerField(default=0)),
+                ('v23town', models.IntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['group_type', 'group_value'],
+                'unique_together': {('group_type', 'group_value')},
+            },
+        ),
+    ]
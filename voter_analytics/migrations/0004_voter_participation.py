@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-19 01:30
+
+from django.db import migrations, models
+
+ELECTIONS = ['v20state', 'v21town', 'v21primary', 'v22general', 'v23town']
+
+
+def backfill_participation(apps, schema_editor):
+    """
+    Pack the existing election fields into the participation bitmask.
+    """
+    Voter = apps.get_model('voter_analytics', 'Voter')
+    for bit, election in enumerate(ELECTIONS):
+        Voter.objects.filter(**{election: True}).update(participation=models.F('participation') + (1 << bit))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('voter_analytics', '0003_votersummary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='voter',
+            name='participation',
+            field=models.PositiveSmallIntegerField(db_index=True, default=0),
+        ),
+        migrations.RunPython(backfill_participation, migrations.RunPython.noop),
+    ]
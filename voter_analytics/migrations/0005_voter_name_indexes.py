@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-19 03:10
+
+import django.db.models.functions.comparison
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('voter_analytics', '0004_voter_participation'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='voter',
+            index=models.Index(django.db.models.functions.comparison.Collate('last_name', 'NOCASE'), name='voter_last_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='voter',
+            index=models.Index(django.db.models.functions.comparison.Collate('first_name', 'NOCASE'), name='voter_first_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='voter',
+            index=models.Index(django.db.models.functions.comparison.Collate('street_name', 'NOCASE'), name='voter_street_name_idx'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-19 04:45
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('voter_analytics', '0005_voter_name_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='voterimport',
+            name='started',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AlterField(
+            model_name='voterimport',
+            name='completed',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
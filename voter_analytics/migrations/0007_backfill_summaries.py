@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:00
+
+from django.db import migrations
+
+
+def backfill_summaries(apps, schema_editor):
+    """
+    Roll up the voters already loaded, so the summaries page works without a new import.
+    """
+    from voter_analytics.models import rebuild_summaries
+    Voter = apps.get_model('voter_analytics', 'Voter')
+    VoterSummary = apps.get_model('voter_analytics', 'VoterSummary')
+    if Voter.objects.exists() and not VoterSummary.objects.exists():
+        rebuild_summaries(voter_model=Voter, summary_model=VoterSummary)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('voter_analytics', '0006_voterimport_started'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_summaries, migrations.RunPython.noop),
+    ]
@@ -2,13 +2,37 @@
 Name: Anthony Xie
 Email: anthoxie@bu.edu
 Description: Models for the voter_analytics application. Contains the Voter model
-representing voter registration data from Newton, MA, and a load_data function
-to import voter data from CSV.
+representing voter registration data from Newton, MA, a load_data function
+to import voter data from CSV, and precinct/zip summary tables rebuilt after
+each import.
 """
 
-from django.db import models
-import csv
-from datetime import datetime
+from django.db import connection, models, transaction
+from django.db.models import Count, Q
+from django.db.models.functions import Collate
+from django.utils import timezone
+import time
+from collections import defaultdict
+from datetime import date
+
+from .importer import CHUNK_SIZE, VOTER_FIELDS, parse_voter_file
+
+# Elections tracked in the voting history, oldest first
+ELECTIONS = ['v20state', 'v21town', 'v21primary', 'v22general', 'v23town']
+
+# Age bands used by the summaries: (field, label, minimum age, maximum age or None)
+AGE_BANDS = [
+    ('age_under_30', 'Under 30', 0, 30),
+    ('age_30_44', '30-44', 30, 45),
+    ('age_45_64', '45-64', 45, 65),
+    ('age_65_plus', '65+', 65, None),
+]
+
+# Summary group types and the Voter field each one groups by
+SUMMARY_GROUPS = {
+    'precinct': 'precinct_number',
+    'zip': 'zip_code',
+}
 
 
 class Voter(models.Model):
@@ -42,63 +66,277 @@ class Voter(models.Model):
     # Voter Score (count of elections attended)
     voter_score = models.IntegerField(default=0)
 
+    # Voting history packed into one integer, bit i set for ELECTIONS[i]
+    participation = models.PositiveSmallIntegerField(default=0, db_index=True)
+
+    class Meta:
+        # Case-insensitive indexes that SQLite uses for the admin's prefix searches
+        indexes = [
+            models.Index(Collate('last_name', 'NOCASE'), name='voter_last_name_idx'),
+            models.Index(Collate('first_name', 'NOCASE'), name='voter_first_name_idx'),
+            models.Index(Collate('street_name', 'NOCASE'), name='voter_street_name_idx'),
+        ]
+
     def __str__(self):
         """String representation of the Voter."""
         return f"{self.first_name} {self.last_name} - {self.street_number} {self.street_name}"
 
+    def save(self, *args, **kwargs):
+        """Keep the participation bitmask in sync with the election fields before saving."""
+        self.participation = participation_mask(e for e in ELECTIONS if getattr(self, e))
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and set(update_fields) & set(ELECTIONS):
+            kwargs['update_fields'] = set(update_fields) | {'participation'}
+        super().save(*args, **kwargs)
+
+
+def participation_mask(elections):
+    """Return the participation bitmask with the bits of the given elections set."""
+    mask = 0
+    for election in elections:
+        mask |= 1 << ELECTIONS.index(election)
+    return mask
+
+
+# Tests of a participation value against a mask for each filter mode
+PARTICIPATION_MODES = {
+    'all': lambda value, mask: value & mask == mask,
+    'any': lambda value, mask: value & mask != 0,
+    'none': lambda value, mask: value & mask == 0,
+}
+
+
+def filter_participation(queryset, elections, mode='all'):
+    """
+    Filter voters who voted in all, any or none of the given elections.
+    With five elections there are only 32 possible bitmasks, so the test is
+    turned into one indexed participation IN (...) predicate.
+    """
+    if not elections:
+        return queryset
+    mask = participation_mask(elections)
+    matches = PARTICIPATION_MODES.get(mode, PARTICIPATION_MODES['all'])
+    values = [value for value in range(1 << len(ELECTIONS)) if matches(value, mask)]
+    return queryset.filter(participation__in=values)
+
+
+class VoterImport(models.Model):
+    """
+    Model recording each voter data import.
+    A row is created before the old voters are deleted and completed once
+    the new ones are loaded. The latest row identifies the current
+    generation of Voter data, which read views use for conditional GET.
+    """
+    started = models.DateTimeField(auto_now_add=True)
+    # Unset while the import is running
+    completed = models.DateTimeField(null=True, blank=True)
+    voter_count = models.IntegerField(default=0)
+
+    def __str__(self):
+        """String representation of the VoterImport."""
+        return f"Import {self.pk} of {self.voter_count} voters at {self.completed or 'running'}"
+
+    @staticmethod
+    def latest():
+        """
+        Return the most recent completed import, or None if no import has completed.
+        """
+        return VoterImport.objects.filter(completed__isnull=False).order_by('-pk').first()
+
+    @staticmethod
+    def generation():
+        """
+        Return the import whose data the Voter table holds, or None while an
+        import is running or if none has completed.
+        """
+        latest = VoterImport.objects.order_by('-pk').first()
+        return latest if latest is not None and latest.completed is not None else None
+
+
+class VoterSummary(models.Model):
+    """
+    Model storing a precomputed roll-up of the voters in one precinct or zip code.
+    Rebuilt by rebuild_summaries() at the end of each import, so reports read
+    a few dozen rows instead of scanning every Voter.
+    """
+    GROUP_CHOICES = [('precinct', 'Precinct'), ('zip', 'Zip Code')]
+
+    group_type = models.CharField(max_length=10, choices=GROUP_CHOICES)
+    group_value = models.CharField(max_length=10)
+    voter_count = models.IntegerField(default=0)
+
+    # Party code -> number of voters
+    party_counts = models.JSONField(default=dict)
+
+    # Age bands, as of the import
+    age_under_30 = models.IntegerField(default=0)
+    age_30_44 = models.IntegerField(default=0)
+    age_45_64 = models.IntegerField(default=0)
+    age_65_plus = models.IntegerField(default=0)
+
+    # Voter score distribution
+    score_0 = models.IntegerField(default=0)
+    score_1 = models.IntegerField(default=0)
+    score_2 = models.IntegerField(default=0)
+    score_3 = models.IntegerField(default=0)
+    score_4 = models.IntegerField(default=0)
+    score_5 = models.IntegerField(default=0)
+
+    # Number of voters who took part in each election
+    v20state = models.IntegerField(default=0)
+    v21town = models.IntegerField(default=0)
+    v21primary = models.IntegerField(default=0)
+    v22general = models.IntegerField(default=0)
+    v23town = models.IntegerField(default=0)
 
-def load_data():
+    class Meta:
+        unique_together = ('group_type', 'group_value')
+        ordering = ['group_type', 'group_value']
+
+    def __str__(self):
+        """String representation of the VoterSummary."""
+        return f"{self.get_group_type_display()} {self.group_value}: {self.voter_count} voters"
+
+    def _with_percent(self, items):
+        """Return (label, count, percent of voters) tuples for the given (label, count) pairs."""
+        total = self.voter_count or 1
+        return [(label, count, round(100 * count / total, 1)) for label, count in items]
+
+    def party_mix(self):
+        """Return the party counts, largest first, with percentages."""
+        return self._with_percent(sorted(self.party_counts.items(), key=lambda item: -item[1]))
+
+    def age_bands(self):
+        """Return the age band counts with percentages."""
+        return self._with_percent([(label, getattr(self, field)) for field, label, low, high in AGE_BANDS])
+
+    def score_distribution(self):
+        """Return the voter score counts with percentages."""
+        return self._with_percent([(score, getattr(self, f'score_{score}')) for score in range(6)])
+
+    def participation(self):
+        """Return the participation count of each election with percentages."""
+        return self._with_percent([(election, getattr(self, election)) for election in ELECTIONS])
+
+
+def _years_before(day, years):
+    """Return the date the given number of years before day, moving Feb 29 to Feb 28."""
+    try:
+        return day.replace(year=day.year - years)
+    except ValueError:
+        return day.replace(year=day.year - years, day=28)
+
+
+def rebuild_summaries(as_of=None, voter_model=None, summary_model=None):
+    """
+    Recompute every VoterSummary row from the Voter table.
+    Ages are computed as of the given date, today by default. Migrations
+    pass their historical Voter and VoterSummary models.
+    Returns the number of summary rows written.
+    """
+    as_of = as_of or date.today()
+    voter_model = voter_model or Voter
+    summary_model = summary_model or VoterSummary
+
+    counts = {'voter_count': Count('pk')}
+    for field, label, low, high in AGE_BANDS:
+        condition = Q(date_of_birth__lte=_years_before(as_of, low))
+        if high is not None:
+            condition &= Q(date_of_birth__gt=_years_before(as_of, high))
+        counts[field] = Count('pk', filter=condition)
+    for score in range(6):
+        counts[f'score_{score}'] = Count('pk', filter=Q(voter_score=score))
+    for election in ELECTIONS:
+        counts[election] = Count('pk', filter=Q(**{election: True}))
+
+    summaries = []
+    for group_type, field in SUMMARY_GROUPS.items():
+        party_counts = defaultdict(dict)
+        for row in voter_model.objects.values(field, 'party_affiliation').annotate(total=Count('pk')).order_by():
+            party_counts[row[field]][row['party_affiliation'].strip()] = row['total']
+
+        for row in voter_model.objects.values(field).annotate(**counts).order_by():
+            value = row.pop(field)
+            summaries.append(summary_model(
+                group_type=group_type,
+                group_value=value,
+                party_counts=party_counts[value],
+                **row
+            ))
+
+    with transaction.atomic():
+        summary_model.objects.all().delete()
+        summary_model.objects.bulk_create(summaries)
+    return len(summaries)
+
+
+def _insert_voters(rows):
+    """
+    Insert parsed voter rows with one executemany call.
+    Building a Voter per row and compiling bulk_create SQL costs far more
+    than parsing, so the single import writer passes the values straight to
+    the database, adding the participation bitmask bulk_create would skip.
+    """
+    opts = Voter._meta
+    fields = [opts.get_field(name) for name in VOTER_FIELDS + ['participation']]
+    columns = ', '.join(connection.ops.quote_name(field.column) for field in fields)
+    placeholders = ', '.join(['%s'] * len(fields))
+    sql = f"INSERT INTO {connection.ops.quote_name(opts.db_table)} ({columns}) VALUES ({placeholders})"
+
+    date_indexes = [i for i, field in enumerate(fields) if isinstance(field, models.DateField)]
+    election_indexes = [VOTER_FIELDS.index(election) for election in ELECTIONS]
+    params = []
+    for row in rows:
+        values = list(row)
+        for i in date_indexes:
+            values[i] = connection.ops.adapt_datefield_value(values[i])
+        values.append(sum(1 << bit for bit, i in enumerate(election_indexes) if row[i]))
+        params.append(values)
+
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, params)
+
+
+def load_data(csv_file_path='newton_voters.csv', workers=None, chunk_size=CHUNK_SIZE):
     """
     Load voter data from the CSV file into the database.
-    Clears existing voter records and imports fresh data from newton_voters.csv.
+    Clears existing voter records and imports fresh data from the file. The
+    file is parsed in parallel by voter_analytics.importer, and this process
+    is the single writer, committing each parsed chunk in its own transaction
+    so the database lock is never held for more than one chunk. Readers see
+    the voters loaded so far until the import is done, so the import is
+    recorded as running first, and read views send no validators until it
+    completes.
     """
+    print(f"Loading data from {csv_file_path}...")
+    started = time.perf_counter()
+
+    # Start a new data generation before the old one is touched
+    voter_import = VoterImport.objects.create()
+
     # Delete all existing records
-    Voter.objects.all().delete()
+    with transaction.atomic():
+        Voter.objects.all().delete()
 
-    # Path to the CSV file
-    csv_file_path = 'newton_voters.csv'
+    count = 0
+    for rows, errors in parse_voter_file(csv_file_path, workers=workers, chunk_size=chunk_size):
+        for error in errors:
+            print(error)
 
-    print(f"Loading data from {csv_file_path}...")
+        if rows:
+            with transaction.atomic():
+                _insert_voters(rows)
+        count += len(rows)
+        print(f"Loaded {count} voters...")
+
+    # Roll the new data up into the precinct and zip summaries
+    summary_count = rebuild_summaries()
+    print(f"Rebuilt {summary_count} precinct and zip summaries.")
+
+    # Complete the new data generation for conditional GET
+    voter_import.voter_count = count
+    voter_import.completed = timezone.now()
+    voter_import.save(update_fields=['voter_count', 'completed'])
 
-    # Open and read the CSV file
-    with open(csv_file_path, 'r', encoding='utf-8') as file:
-        reader = csv.DictReader(file)
-
-        count = 0
-        for row in reader:
-            try:
-                # Parse dates
-                dob = datetime.strptime(row['Date of Birth'], '%Y-%m-%d').date()
-                dor = datetime.strptime(row['Date of Registration'], '%Y-%m-%d').date()
-
-                # Create Voter object
-                voter = Voter(
-                    last_name=row['Last Name'],
-                    first_name=row['First Name'],
-                    street_number=row['Residential Address - Street Number'],
-                    street_name=row['Residential Address - Street Name'],
-                    apartment_number=row['Residential Address - Apartment Number'] if row['Residential Address - Apartment Number'] else None,
-                    zip_code=row['Residential Address - Zip Code'],
-                    date_of_birth=dob,
-                    date_of_registration=dor,
-                    party_affiliation=row['Party Affiliation'],
-                    precinct_number=row['Precinct Number'],
-                    v20state=row['v20state'] == 'TRUE',
-                    v21town=row['v21town'] == 'TRUE',
-                    v21primary=row['v21primary'] == 'TRUE',
-                    v22general=row['v22general'] == 'TRUE',
-                    v23town=row['v23town'] == 'TRUE',
-                    voter_score=int(row['voter_score'])
-                )
-                voter.save()
-
-                count += 1
-                if count % 1000 == 0:
-                    print(f"Loaded {count} voters...")
-
-            except Exception as e:
-                print(f"Error loading row: {e}")
-                print(f"Row data: {row}")
-                continue
-
-    print(f"Done! Loaded {count} voters.")
+    elapsed = time.perf_counter() - started
+    print(f"Done! Loaded {count} voters in {elapsed:.1f}s ({count / max(elapsed, 1e-9):.0f} voters/s).")
@@ -1,3 +1,245 @@
+"""
+Name: Anthony Xie
+Email: anthoxie@bu.edu
+Description: Tests for the voter_analytics application.
+"""
+
+import io
+import os
+import tempfile
+from contextlib import redirect_stdout
+from datetime import date
+from itertools import combinations
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .importer import VOTER_COLUMNS
+from . import models
+from .models import (ELECTIONS, Voter, VoterImport, VoterSummary, filter_participation, load_data, participation_mask,
+                     rebuild_summaries)
+
+
+class VoterAdminQueryCountTests(TestCase):
+    """Check that the Voter changelist does not scan the table as it grows."""
+
+    def setUp(self):
+        """Log in as a superuser and create a first batch of voters."""
+        cache.clear()
+        admin_user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(admin_user)
+        # Load the session and user into their cache before counting
+        self.client.get(reverse('admin:index'))
+        self.created = 0
+        self.add_voters(5)
+
+    def add_voters(self, count):
+        """Add voters and record them as a new import."""
+        for _ in range(count):
+            self.created += 1
+            Voter.objects.create(
+                last_name=f'Smith{self.created}', first_name='Alex', street_number='1',
+                street_name='Main St', zip_code='02459', date_of_birth=date(1980, 1, 1),
+                date_of_registration=date(2000, 1, 1), party_affiliation='D ',
+                precinct_number=str(self.created % 3 + 1), voter_score=self.created % 6,
+            )
+        VoterImport.objects.create(voter_count=Voter.objects.count(), completed=timezone.now())
+
+    def capture(self, params=None):
+        """Request the Voter changelist and return the response and the SQL it ran."""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('admin:voter_analytics_voter_changelist'), params or {})
+        self.assertEqual(response.status_code, 200)
+        return response, [query['sql'] for query in queries.captured_queries]
+
+    def test_changelist_queries_do_not_grow(self):
+        """The unfiltered changelist runs a fixed number of queries and no COUNT."""
+        self.capture()
+        response, before = self.capture()
+        self.add_voters(20)
+        self.capture()
+        response, after = self.capture()
+        self.assertEqual(len(after), len(before))
+        self.assertFalse([sql for sql in after if 'COUNT(' in sql])
+        self.assertEqual(response.context['cl'].result_count, 25)
+
+    def test_facets_are_cached(self):
+        """Filter choices are read from the cache after the first request."""
+        self.capture()
+        response, queries = self.capture()
+        self.assertFalse([sql for sql in queries if 'DISTINCT' in sql])
+        choices = [choice['display'] for spec in response.context['cl'].filter_specs
+                   for choice in spec.choices(response.context['cl'])]
+        self.assertIn('D', choices)
+        self.assertIn('3', choices)
+
+    def test_search_uses_name_index(self):
+        """Name searches match prefixes case-insensitively through the indexes."""
+        response, queries = self.capture({'q': 'smith1'})
+        self.assertEqual(response.context['cl'].result_count, 1)
+        search = next(sql for sql in queries if 'LIKE' in sql and 'COUNT(' not in sql)
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + search)
+            plan = ' '.join(str(row) for row in cursor.fetchall())
+        self.assertNotIn('SCAN voter_analytics_voter', plan)
+
+
+class LoadDataTests(TestCase):
+    """Check that the CSV import loads every chunk and reports rejected rows."""
+
+    def write_csv(self, records):
+        """Write a voter CSV with the given records and return its path."""
+        handle, path = tempfile.mkstemp(suffix='.csv')
+        self.addCleanup(os.remove, path)
+        with os.fdopen(handle, 'w', newline='') as file:
+            file.write(','.join(column for field, column in VOTER_COLUMNS) + '\n')
+            for record in records:
+                file.write(','.join(record) + '\n')
+        return path
+
+    def test_import_crosses_chunk_boundaries(self):
+        """Records on both sides of a chunk boundary are loaded and bad rows are reported."""
+        records = []
+        for i in range(6):
+            records.append([f'Smith{i}', 'Alex', str(i), 'Main St', '', '02459', '1980-01-01', '2000-01-01',
+                            'D ', str(i % 2 + 1), 'TRUE', 'FALSE', 'FALSE', 'TRUE', 'FALSE', '2'])
+        records[3][6] = 'not a date'
+        path = self.write_csv(records)
+        Voter.objects.create(
+            last_name='Old', first_name='Voter', street_number='1', street_name='Elm St', zip_code='02459',
+            date_of_birth=date(1950, 1, 1), date_of_registration=date(1970, 1, 1), party_affiliation='R ',
+            precinct_number='9',
+        )
+
+        output = io.StringIO()
+        with redirect_stdout(output):
+            # Each chunk holds about one record
+            load_data(path, workers=1, chunk_size=64)
+
+        self.assertEqual(output.getvalue().count('Error loading row'), 1)
+        self.assertIn("'Smith3'", output.getvalue())
+        self.assertEqual(sorted(Voter.objects.values_list('last_name', flat=True)),
+                         ['Smith0', 'Smith1', 'Smith2', 'Smith4', 'Smith5'])
+        expected = participation_mask([ELECTIONS[0], ELECTIONS[3]])
+        self.assertEqual(set(Voter.objects.values_list('participation', flat=True)), {expected})
+        self.assertEqual(VoterImport.latest().voter_count, 5)
+        self.assertEqual(VoterSummary.objects.get(group_type='precinct', group_value='1').voter_count, 3)
+
+    def test_no_validators_during_import(self):
+        """Pages served while an import is running send no ETag, and pages after it get a new one."""
+        path = self.write_csv([['Smith', 'Alex', '1', 'Main St', '', '02459', '1980-01-01', '2000-01-01',
+                                'D ', '1', 'TRUE', 'FALSE', 'FALSE', 'TRUE', 'FALSE', '2']])
+        with redirect_stdout(io.StringIO()):
+            load_data(path, workers=1)
+        voter = Voter.objects.get()
+        url = reverse('voter', kwargs={'pk': voter.pk})
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        insert = models._insert_voters
+        during = []
+
+        def insert_and_read(rows):
+            insert(rows)
+            # The reloaded voter may reuse the old primary key
+            response = self.client.get(reverse('voter', kwargs={'pk': Voter.objects.get().pk}),
+                                       HTTP_IF_NONE_MATCH=etag)
+            during.append((response.status_code, response.has_header('ETag')))
+            during.append(self.client.get(reverse('summaries')).has_header('ETag'))
+
+        with mock.patch.object(models, '_insert_voters', side_effect=insert_and_read), \
+                redirect_stdout(io.StringIO()):
+            load_data(path, workers=1)
+        self.assertEqual(during, [(200, False), False])
+        new_url = reverse('voter', kwargs={'pk': Voter.objects.get().pk})
+        self.assertNotEqual(self.client.get(new_url)['ETag'], etag)
+
+
+class ParticipationFilterTests(TestCase):
+    """Check the all, any and none participation filters against the election fields."""
+
+    def setUp(self):
+        """Create one voter for every combination of elections."""
+        for number in range(1 << len(ELECTIONS)):
+            Voter.objects.create(
+                last_name=f'Voter{number}', first_name='Alex', street_number='1', street_name='Main St',
+                zip_code='02459', date_of_birth=date(1980, 1, 1), date_of_registration=date(2000, 1, 1),
+                party_affiliation='D ', precinct_number='1',
+                **{election: bool(number >> bit & 1) for bit, election in enumerate(ELECTIONS)},
+            )
+
+    def matching(self, elections, mode):
+        """Return the last names filter_participation selects."""
+        return set(filter_participation(Voter.objects.all(), elections, mode).values_list('last_name', flat=True))
+
+    def expected(self, elections, test):
+        """Return the last names of the voters whose election fields pass a test."""
+        return {voter.last_name for voter in Voter.objects.all()
+                if test([getattr(voter, election) for election in elections])}
+
+    def test_modes_match_election_fields(self):
+        """Every mode selects the same voters as testing the booleans directly."""
+        for size in (1, 2, 3):
+            for elections in combinations(ELECTIONS, size):
+                with self.subTest(elections=elections):
+                    self.assertEqual(self.matching(elections, 'all'), self.expected(elections, all))
+                    self.assertEqual(self.matching(elections, 'any'), self.expected(elections, any))
+                    self.assertEqual(self.matching(elections, 'none'),
+                                     self.expected(elections, lambda voted: not any(voted)))
+
+    def test_unknown_mode_and_no_elections(self):
+        """An unknown mode falls back to all, and no elections leaves the queryset alone."""
+        elections = ['v20state', 'v23town']
+        self.assertEqual(self.matching(elections, 'bogus'), self.matching(elections, 'all'))
+        self.assertEqual(len(self.matching([], 'none')), 1 << len(ELECTIONS))
+
+    def test_saving_fields_updates_bitmask(self):
+        """Changing an election field through save keeps the bitmask in sync, even with update_fields."""
+        voter = Voter.objects.get(participation=0)
+        voter.v22general = True
+        voter.save(update_fields=['v22general'])
+        voter.refresh_from_db()
+        self.assertEqual(voter.participation, participation_mask(['v22general']))
+
+
+class VoterSummaryViewTests(TestCase):
+    """Check the filters of the summary report."""
+
+    def setUp(self):
+        """Create voters in two precincts and roll them up."""
+        for i in range(3):
+            Voter.objects.create(
+                last_name=f'Smith{i}', first_name='Alex', street_number='1', street_name='Main St',
+                zip_code='02459', date_of_birth=date(1980, 1, 1), date_of_registration=date(2000, 1, 1),
+                party_affiliation='D ', precinct_number='1' if i else '2',
+            )
+        VoterImport.objects.create(voter_count=3, completed=timezone.now())
+        rebuild_summaries()
+
+    def precincts(self, **params):
+        """Return the precincts listed by the report for the given filters."""
+        response = self.client.get(reverse('summaries'), params)
+        self.assertEqual(response.status_code, 200)
+        return [summary.group_value for summary in response.context['summaries']]
+
+    def test_min_voters(self):
+        """A numeric minimum filters the rows, and any other value is ignored."""
+        self.assertEqual(self.precincts(min_voters='2'), ['1'])
+        self.assertEqual(self.precincts(min_voters='abc'), ['1', '2'])
+        self.assertEqual(self.precincts(min_voters='-1'), ['1', '2'])
+
+    def test_migration_backfills_summaries(self):
+        """Migrating an existing deployment fills the summaries from the loaded voters."""
+        from django.apps import apps
+        from importlib import import_module
+        migration = import_module('voter_analytics.migrations.0007_backfill_summaries')
 
-# Create your tests here.
+        VoterSummary.objects.all().delete()
+        migration.backfill_summaries(apps, None)
+        self.assertEqual(self.precincts(), ['1', '2'])
@@ -5,10 +5,11 @@ Description: URL patterns for the voter_analytics application.
 """
 
 from django.urls import path
-from .views import VotersListView, VoterDetailView, GraphsView
+from .views import VotersListView, VoterDetailView, GraphsView, VoterSummaryView
 
 urlpatterns = [
     path('', VotersListView.as_view(), name='voters'),
     path('voter/<int:pk>', VoterDetailView.as_view(), name='voter'),
     path('graphs', GraphsView.as_view(), name='graphs'),
+    path('summaries', VoterSummaryView.as_view(), name='summaries'),
 ]
@@ -2,14 +2,19 @@
 Name: Anthony Xie
 Email: anthoxie@bu.edu
 Description: Views for the voter_analytics application. Includes list view with filtering,
-detail view, and graphs view with plotly visualizations.
+detail view, graphs view with plotly visualizations, and precinct/zip summary reports
+with CSV export.
 """
 
+import csv
+import hashlib
+
+from django.http import HttpResponse
 from django.shortcuts import render
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
 from django.views.generic import ListView, DetailView, TemplateView
-from .models import Voter
-import plotly
-import plotly.graph_objs as go
+from .models import Voter, VoterImport, VoterSummary, AGE_BANDS, ELECTIONS, filter_participation
 from collections import Counter
 
 
@@ -28,11 +33,8 @@ class VotersListView(ListView):
         min_birth_year = self.request.GET.get('min_birth_year')
         max_birth_year = self.request.GET.get('max_birth_year')
         voter_score = self.request.GET.get('voter_score')
-        v20state = self.request.GET.get('v20state')
-        v21town = self.request.GET.get('v21town')
-        v21primary = self.request.GET.get('v21primary')
-        v22general = self.request.GET.get('v22general')
-        v23town = self.request.GET.get('v23town')
+        elections = [election for election in ELECTIONS if self.request.GET.get(election)]
+        participation_mode = self.request.GET.get('participation_mode', 'all')
 
         if party:
             queryset = queryset.filter(party_affiliation=party)
@@ -42,16 +44,7 @@ class VotersListView(ListView):
             queryset = queryset.filter(date_of_birth__year__lte=int(max_birth_year))
         if voter_score:
             queryset = queryset.filter(voter_score=int(voter_score))
-        if v20state:
-            queryset = queryset.filter(v20state=True)
-        if v21town:
-            queryset = queryset.filter(v21town=True)
-        if v21primary:
-            queryset = queryset.filter(v21primary=True)
-        if v22general:
-            queryset = queryset.filter(v22general=True)
-        if v23town:
-            queryset = queryset.filter(v23town=True)
+        queryset = filter_participation(queryset, elections, participation_mode)
 
         return queryset
 
@@ -73,10 +66,33 @@ class VotersListView(ListView):
         context['current_v21primary'] = self.request.GET.get('v21primary', '')
         context['current_v22general'] = self.request.GET.get('v22general', '')
         context['current_v23town'] = self.request.GET.get('v23town', '')
+        context['current_participation_mode'] = self.request.GET.get('participation_mode', 'all')
 
         return context
 
 
+def _latest_import(request):
+    """Return the current VoterImport generation, or None during an import, looked up once per request."""
+    if not hasattr(request, '_latest_voter_import'):
+        request._latest_voter_import = VoterImport.generation()
+    return request._latest_voter_import
+
+
+def voter_etag(request, pk):
+    """Return a weak ETag for a voter page from the current import generation."""
+    latest = _latest_import(request)
+    if latest is None:
+        return None
+    return f'W/"voter-{pk}-{latest.pk}"'
+
+
+def voter_last_modified(request, pk):
+    """Return the completion time of the current import generation."""
+    latest = _latest_import(request)
+    return latest.completed if latest else None
+
+
+@method_decorator(condition(etag_func=voter_etag, last_modified_func=voter_last_modified), name='get')
 class VoterDetailView(DetailView):
     """Display detailed information for a single voter."""
     model = Voter
@@ -90,6 +106,11 @@ class GraphsView(TemplateView):
 
     def get_context_data(self, **kwargs):
         """Override get_context_data to generate graphs based on filtered data."""
+        # plotly takes seconds to import, so only load it when graphs are drawn
+        # instead of in every worker that imports this module
+        import plotly
+        import plotly.graph_objs as go
+
         context = super().get_context_data(**kwargs)
 
         # Get filtered queryset based on GET parameters
@@ -99,11 +120,8 @@ class GraphsView(TemplateView):
         min_birth_year = self.request.GET.get('min_birth_year')
         max_birth_year = self.request.GET.get('max_birth_year')
         voter_score = self.request.GET.get('voter_score')
-        v20state = self.request.GET.get('v20state')
-        v21town = self.request.GET.get('v21town')
-        v21primary = self.request.GET.get('v21primary')
-        v22general = self.request.GET.get('v22general')
-        v23town = self.request.GET.get('v23town')
+        elections = [election for election in ELECTIONS if self.request.GET.get(election)]
+        participation_mode = self.request.GET.get('participation_mode', 'all')
 
         if party:
             queryset = queryset.filter(party_affiliation=party)
@@ -113,16 +131,7 @@ class GraphsView(TemplateView):
             queryset = queryset.filter(date_of_birth__year__lte=int(max_birth_year))
         if voter_score:
             queryset = queryset.filter(voter_score=int(voter_score))
-        if v20state:
-            queryset = queryset.filter(v20state=True)
-        if v21town:
-            queryset = queryset.filter(v21town=True)
-        if v21primary:
-            queryset = queryset.filter(v21primary=True)
-        if v22general:
-            queryset = queryset.filter(v22general=True)
-        if v23town:
-            queryset = queryset.filter(v23town=True)
+        queryset = filter_participation(queryset, elections, participation_mode)
 
         voters = queryset
 
@@ -186,5 +195,77 @@ class GraphsView(TemplateView):
         context['current_v21primary'] = self.request.GET.get('v21primary', '')
         context['current_v22general'] = self.request.GET.get('v22general', '')
         context['current_v23town'] = self.request.GET.get('v23town', '')
+        context['current_participation_mode'] = self.request.GET.get('participation_mode', 'all')
+
+        return context
+
+
+def summary_etag(request):
+    """Return a weak ETag for a summary report from the import generation and filters."""
+    latest = _latest_import(request)
+    if latest is None:
+        return None
+    query = hashlib.md5(request.GET.urlencode().encode()).hexdigest()
+    return f'W/"summaries-{latest.pk}-{query}"'
+
+
+@method_decorator(condition(etag_func=summary_etag), name='get')
+class VoterSummaryView(ListView):
+    """Display precinct or zip code roll-ups of the voters, or export them as CSV."""
+    model = VoterSummary
+    template_name = 'voter_analytics/summaries.html'
+    context_object_name = 'summaries'
+
+    def get_queryset(self):
+        """Filter summaries based on GET parameters."""
+        group = self.request.GET.get('group', 'precinct')
+        value = self.request.GET.get('value')
+        min_voters = self.request.GET.get('min_voters')
+
+        queryset = VoterSummary.objects.filter(group_type=group)
+        if value:
+            queryset = queryset.filter(group_value=value.strip())
+        # A minimum that is not a whole number is ignored
+        if min_voters and min_voters.strip().isdigit():
+            queryset = queryset.filter(voter_count__gte=int(min_voters))
+
+        return queryset
+
+    def get_context_data(self, **kwargs):
+        """Add filter options and the current filters to context."""
+        context = super().get_context_data(**kwargs)
+
+        current_group = self.request.GET.get('group', 'precinct')
+        context['group_choices'] = VoterSummary.GROUP_CHOICES
+        context['group_values'] = (VoterSummary.objects.filter(group_type=current_group)
+                                   .values_list('group_value', flat=True))
+        context['current_group'] = current_group
+        context['current_value'] = self.request.GET.get('value', '')
+        context['current_min_voters'] = self.request.GET.get('min_voters', '')
+        context['csv_query'] = self.request.GET.copy()
+        context['csv_query']['format'] = 'csv'
+        context['latest_import'] = _latest_import(self.request)
 
         return context
+
+    def render_to_response(self, context, **response_kwargs):
+        """Return the summaries as CSV when format=csv is requested."""
+        if self.request.GET.get('format') != 'csv':
+            return super().render_to_response(context, **response_kwargs)
+
+        summaries = list(context['summaries'])
+        parties = sorted({party for summary in summaries for party in summary.party_counts})
+        age_fields = [field for field, label, low, high in AGE_BANDS]
+        score_fields = [f'score_{score}' for score in range(6)]
+
+        response = HttpResponse(content_type='text/csv')
+        response['Content-Disposition'] = f'attachment; filename="voter_{context["current_group"]}_summaries.csv"'
+        writer = csv.writer(response)
+        writer.writerow(['group_type', 'group_value', 'voter_count']
+                        + [f'party_{party}' for party in parties]
+                        + age_fields + score_fields + ELECTIONS)
+        for summary in summaries:
+            writer.writerow([summary.group_type, summary.group_value, summary.voter_count]
+                            + [summary.party_counts.get(party, 0) for party in parties]
+                            + [getattr(summary, field) for field in age_fields + score_fields + ELECTIONS])
+        return response